@@ -1,10 +1,16 @@
 """
 Enhanced ATM Simulation Project written in Python, using functions and global variables.
 
+This module is the interactive front end: it reads input, calls the
+programmatic core in ``core.py`` and prints the results. Use ``batch.py`` to
+run operations from a file without prompts.
+
 ## New Features Added
 
 - **Multiple Account Support:** Switch between Savings and Checking accounts
+- **Multiple Customers:** Any number of customers and accounts in a compact columnar store
 - **Transaction History with Timestamps:** Full transaction logging with dates/times
+- **Transaction Search:** Find transactions by date range, type and amount
 - **Daily Withdrawal Limits:** Configurable daily withdrawal limits
 - **Account Transfer:** Transfer money between your own accounts
 - **Bill Payment:** Pay utilities, phone, and credit card bills
@@ -16,46 +22,54 @@ Enhanced ATM Simulation Project written in Python, using functions and global va
 - **Balance Alerts:** Warnings for low balances
 - **Transaction Categories:** Categorized spending tracking
 - **Quick Cash:** Preset withdrawal amounts
+- **Cash Cassettes:** Withdrawals are paid in the notes loaded in the machine
 - **Deposit Limits:** Maximum deposit validation
 - **Session Timeout:** Auto-logout after inactivity
+- **Batch Processing:** Run operations from a CSV/JSONL file at full speed
+- **Operation Metrics:** Call counts, outcomes and latency percentiles per operation
 
 ## Usage Instructions
 
-1. Default PIN: 1234
+1. Default card number: 0, default PIN: 1234
 2. Starting balances: Savings $1000, Checking $500
 3. Daily withdrawal limit: $500
 4. Transaction fees apply to some operations
 5. Interest is calculated daily on savings balance
+6. Cash is dispensed in $100, $50, $20 and $10 notes
 """
 
 import datetime
-import random
+import os
 import time
 
+from accounts import NO_ACCOUNT
+from cassettes import CashCassettes
+from ledger import TxType, format_transaction
+import core
+import export
+import metrics
+import money
+from wal import WriteAheadLog
+from history import HistoryFile, HISTORY_NAME
+
 # Global variables - moved to top for clarity
-balance_savings = 1000.0
-balance_checking = 500.0
-current_account = "savings"
-transactions = []
-pin_attempts = 3
-pin = "1234"
-
-daily_withdrawal_limit = 500.0
-daily_withdrawn = 0.0
-last_withdrawal_date = None
-account_locked = False
-lockout_time = None
-session_start_time = None
-session_timeout = 300 # 5 minutes session timeout
-transaction_fee = 1.50
-last_interest_date = None
+bank = core.Bank()
+cassettes = CashCassettes(presets=core.QUICK_CASH_AMOUNTS)  # notes in this machine
+session = bank.open_session(cassettes)
+history_page_size = 20
+search_limit = 50  # most search results listed at once
+data_dir = os.environ.get("ATM_DATA_DIR", "atm_data")
+metrics_file = "metrics.prom"
+journal = None
 
 def main():
-    global session_start_time
-    
     initialize_system()
-    session_start_time = datetime.datetime.now()
-    
+    try:
+        run_session()
+    finally:
+        shutdown_system()
+
+def run_session():
     if not authenticate_user():
         print("Too many incorrect attempts. Exiting.")
         return
@@ -68,12 +82,12 @@ def main():
             print("⏰ Session timed out for security. Please restart.")
             break
             
-        if account_locked:
+        if bank.lockout_remaining(session.customer):
             print("🔒 Account is temporarily locked. Please try again later.")
             break
             
         show_menu()
-        action = input("\nEnter your choice (1-15): ").strip()
+        action = input("\nEnter your choice (1-19): ").strip()
         
         if action == "1":
             show_balance()
@@ -104,69 +118,95 @@ def main():
         elif action == "14":
             check_daily_limits()
         elif action == "15":
+            show_metrics()
+        elif action == "16":
+            scheduled_payments()
+        elif action == "17":
+            export_transaction_history()
+        elif action == "18":
+            search_transactions()
+        elif action == "19":
             print("💰 Thank you for using Enhanced ATM. Goodbye!")
             break
         else:
             print("❌ Invalid choice. Please try again.")
+        
+        if not session.authenticated:
+            print("⏰ Session ended. Please restart.")
+            break
             
      
         time.sleep(0.7)
 
 def initialize_system():
-    """Initialize system variables and calculate any pending interest"""
-    global last_interest_date, last_withdrawal_date, balance_savings, balance_checking
-    global daily_withdrawn, daily_withdrawal_limit, current_account, transactions
-    global pin_attempts, pin, account_locked, lockout_time, session_start_time
-    global session_timeout, transaction_fee
-    
-    current_date = datetime.datetime.now().date()
-    
-    if last_interest_date is None:
-        last_interest_date = current_date
-    
-    if last_withdrawal_date is None:
-        last_withdrawal_date = current_date
-    
-    # Calculate any pending interest
-    calculate_daily_interest()
+    """Recover saved state, create the default customer and run the end-of-day pipeline"""
+    global bank, journal
+    
+    # Restore balances, PINs, lockouts and history from the write-ahead log
+    # One terminal: commit every operation as it completes
+    journal = WriteAheadLog(data_dir, group_size=1)
+    recovered = journal.recover(bank)
+    if bank.store.customer_count:
+        print(f"♻️  Recovered state ({recovered} log records replayed in "
+              f"{journal.recovery_seconds * 1000:.1f} ms)")
+    journal.attach(bank)
+    bank.attach_history(HistoryFile(os.path.join(data_dir, HISTORY_NAME), bank.store))
+    metrics.registry.enable()
+    
+    # Create the default customer on a fresh store
+    if bank.store.customer_count == 0:
+        bank.add_customer("1234", savings=100000, checking=50000)
+    
+    # Make the payments due today and calculate any pending interest
+    run_end_of_day()
+
+def shutdown_system():
+    """Flush the write-ahead log so nothing is lost on exit, and export metrics"""
+    global journal
+    
+    if metrics.registry.enabled:
+        metrics.registry.write_prometheus(os.path.join(data_dir, metrics_file))
+    
+    if journal is not None:
+        journal.close()
+        journal = None
+    if bank.history is not None:
+        bank.history.close()
 
 def authenticate_user():
     """Enhanced authentication with account lockout"""
-    global pin_attempts, pin, account_locked, lockout_time
+    global session
+    
+    try:
+        customer = int(input("💳 Enter your card number: ").strip())
+        bank.store.check_customer(customer)
+    except (ValueError, KeyError):
+        print("❌ Unknown card number.")
+        return False
     
-    # Check if account is locked
-    if account_locked and lockout_time:
-        time_diff = datetime.datetime.now() - lockout_time
-        if time_diff.total_seconds() < 1800:  # 30 minutes lockout
-            remaining = 1800 - time_diff.total_seconds()
+    while True:
+        remaining = bank.lockout_remaining(customer)
+        if remaining:
             print(f"🔒 Account locked. Try again in {remaining/60:.1f} minutes.")
             return False
-        else:
-            account_locked = False
-            lockout_time = None
-            pin_attempts = 3
-  
-    while pin_attempts > 0:
+        
         user_pin = input("🔐 Enter your PIN: ").strip()
-        if user_pin == pin:
+        result = session.login(customer, user_pin)
+        if result.ok:
             print("✅ Authentication successful!")
-            pin_attempts = 3  # Reset attempts on success
             return True
+        if result.code == core.BAD_PIN:
+            print(f"❌ {result.message}")
+        elif result.code == core.LOCKED:
+            print("🔒 Account locked due to multiple failed attempts.")
+            return False
         else:
-            pin_attempts -= 1
-            if pin_attempts == 0:
-                account_locked = True
-                lockout_time = datetime.datetime.now()
-                print("🔒 Account locked due to multiple failed attempts.")
-                log_transaction("SECURITY", "Account locked - multiple failed PIN attempts", 0)
-                return False
-            print(f"❌ Incorrect PIN. You have {pin_attempts} attempts left.")
-    
-    return False
+            print(f"❌ {result.message}")
+            return False
 
 def show_menu():
     """Display the enhanced ATM menu"""
-    print(f"\n🏦 ATM Menu - Current Account: {current_account.title()}")
+    print(f"\n🏦 ATM Menu - Current Account: {account_label(session.account).title()}")
     print("=" * 40)
     print("1.  💰 Check Balance")
     print("2.  📥 Deposit Money")
@@ -182,244 +222,245 @@ def show_menu():
     print("12. 💹 Calculate Interest")
     print("13. ℹ️  Account Information")
     print("14. 📈 Check Daily Limits")
-    print("15. 🚪 Exit")
+    print("15. 📟 Operation Metrics")
+    print("16. 🗓️  Scheduled Payments")
+    print("17. 💾 Export History")
+    print("18. 🔎 Search Transactions")
+    print("19. 🚪 Exit")
 
 def show_balance():
     """Display current account balance with alerts"""
-    global balance_savings, balance_checking, current_account
-    
-    current_balance = balance_savings if current_account == "savings" else balance_checking
+    result = session.balances()
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    current_balance = result.balance
     
-    print(f"\n💰 {current_account.title()} Account Balance: ${current_balance:.2f}")
+    print(f"\n💰 {account_label(session.account).title()} Account Balance: ${from_cents(current_balance)}")
     
     # Balance alerts
-    if current_balance < 100:
-        print("⚠️  Warning: Low balance!")
-    elif current_balance < 50:
+    if current_balance < bank.very_low_balance:
         print("🚨 Alert: Very low balance!")
+    elif current_balance < bank.low_balance:
+        print("⚠️  Warning: Low balance!")
     
-    # Show other account balance too
-    other_account = "checking" if current_account == "savings" else "savings"
-    other_balance = balance_checking if current_account == "savings" else balance_savings
-    print(f"📊 {other_account.title()} Account Balance: ${other_balance:.2f}")
+    # Show other account balances too
+    for other_account, other_balance in result.data:
+        if other_account != session.account:
+            print(f"📊 {account_label(other_account).title()} Account Balance: ${from_cents(other_balance)}")
 
 def deposit_money():
     """Enhanced deposit with limits and validation"""
-    global balance_savings, balance_checking, current_account, transactions
-    
     try:
-        amount = float(input("💵 Enter the amount to deposit: $"))
-        
-        if amount <= 0:
-            print("❌ Deposit amount must be positive.")
-            return
-        
-        if amount > 10000:  # Daily deposit limit
-            print("❌ Daily deposit limit is $10,000.")
-            return
-        
-        # Process deposit
-        if current_account == "savings":
-            balance_savings += amount
-            new_balance = balance_savings
-        else:
-            balance_checking += amount
-            new_balance = balance_checking
-        
-        log_transaction("DEPOSIT", f"Deposited to {current_account}", amount)
-        print(f"✅ Successfully deposited ${amount:.2f}")
-        print(f"💰 New {current_account} balance: ${new_balance:.2f}")
-        
+        amount = to_cents(input("💵 Enter the amount to deposit: $"))
     except ValueError:
-        print("❌ Invalid input. Please enter a numeric value.")
+        print("❌ Invalid input. Please enter an amount in dollars and cents.")
+        return
+    
+    result = session.deposit(amount)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    
+    print(f"✅ Successfully deposited ${from_cents(result.amount)}")
+    print(f"💰 New {account_label(session.account)} balance: ${from_cents(result.balance)}")
 
 def withdraw_money():
     """Enhanced withdrawal with daily limits and fees"""
-    global balance_savings, balance_checking, current_account
-    global daily_withdrawn, daily_withdrawal_limit, last_withdrawal_date
-    
     try:
-        # Check daily limit reset
-        check_daily_limit_reset()
-        
-        amount = float(input("💸 Enter the amount to withdraw: $"))
-        
-        if amount <= 0:
-            print("❌ Withdrawal amount must be positive.")
-            return
-        
-        current_balance = balance_savings if current_account == "savings" else balance_checking
-        
-        # Check daily withdrawal limit
-        if daily_withdrawn + amount > daily_withdrawal_limit:
-            remaining = daily_withdrawal_limit - daily_withdrawn
-            print(f"❌ Daily withdrawal limit exceeded. Remaining: ${remaining:.2f}")
-            return
-        
-        # Check sufficient funds (including potential fee)
-        total_cost = amount + transaction_fee if amount > 200 else amount
-        
-        if total_cost > current_balance:
-            print("❌ Insufficient funds for this withdrawal.")
-            return
-        
-        # Process withdrawal
-        if current_account == "savings":
-            balance_savings -= total_cost
-            new_balance = balance_savings
-        else:
-            balance_checking -= total_cost
-            new_balance = balance_checking
-        
-        daily_withdrawn += amount
-        
-        log_transaction("WITHDRAWAL", f"Withdrew from {current_account}", amount)
-        
-        if amount > 200:
-            log_transaction("FEE", "Withdrawal fee", transaction_fee)
-            print(f"ℹ️  Transaction fee: ${transaction_fee:.2f}")
-        
-        print(f"✅ Successfully withdrew ${amount:.2f}")
-        print(f"💰 New {current_account} balance: ${new_balance:.2f}")
-        
+        amount = to_cents(input("💸 Enter the amount to withdraw: $"))
     except ValueError:
-        print("❌ Invalid input. Please enter a numeric value.")
+        print("❌ Invalid input. Please enter an amount in dollars and cents.")
+        return
+    
+    result = session.withdraw(amount)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    
+    if result.fee:
+        print(f"ℹ️  Transaction fee: ${from_cents(result.fee)}")
+    print(f"✅ Successfully withdrew ${from_cents(result.amount)}")
+    print_notes(result.data)
+    print(f"💰 New {account_label(session.account)} balance: ${from_cents(result.balance)}")
 
 def quick_cash():
     """Quick cash withdrawal with preset amounts"""
-    global balance_savings, balance_checking, current_account
-    
     print("\n⚡ Quick Cash Options:")
-    print("1. $20    2. $40    3. $60    4. $80    5. $100")
+    print("    ".join(f"{i}. ${cents // 100}" for i, cents in enumerate(core.QUICK_CASH_AMOUNTS, 1)))
     
-    choice = input("Select amount (1-5): ").strip()
-    amounts = {"1": 20, "2": 40, "3": 60, "4": 80, "5": 100}
+    choice = input(f"Select amount (1-{len(core.QUICK_CASH_AMOUNTS)}): ").strip()
     
-    if choice in amounts:
-        amount = amounts[choice]
-        print(f"Processing withdrawal of ${amount}...")
-        
-        # Simulate the withdrawal process
-        current_balance = balance_savings if current_account == "savings" else balance_checking
-        
-        if amount <= current_balance:
-            if current_account == "savings":
-                balance_savings -= amount
-            else:
-                balance_checking -= amount
-            
-            log_transaction("QUICK_CASH", f"Quick cash from {current_account}", amount)
-            print(f"✅ Quick cash: ${amount} withdrawn successfully!")
-        else:
-            print("❌ Insufficient funds.")
-    else:
+    if not choice.isdigit() or not 1 <= int(choice) <= len(core.QUICK_CASH_AMOUNTS):
         print("❌ Invalid selection.")
+        return
+    
+    amount = core.QUICK_CASH_AMOUNTS[int(choice) - 1]
+    print(f"Processing withdrawal of ${amount // 100}...")
+    
+    result = session.quick_cash(amount)
+    if result.ok:
+        print(f"✅ Quick cash: ${amount // 100} withdrawn successfully!")
+        print_notes(result.data)
+    else:
+        print(f"❌ {result.message}")
+
+def print_notes(notes):
+    """Show the notes dispensed for a withdrawal"""
+    if notes:
+        print("💵 Dispensed: " + ", ".join(f"{count} × ${denomination // 100}"
+                                           for denomination, count in notes.items()))
 
 def transfer_between_accounts():
-    """Transfer money between savings and checking accounts"""
-    global balance_savings, balance_checking, current_account
+    """Transfer money from the current account to another of your accounts"""
+    targets = [a for a in session.accounts() if a != session.account]
+    if not targets:
+        print("❌ You have no other account to transfer to.")
+        return
     
-    try:
-        amount = float(input("🔄 Enter transfer amount: $"))
-        
-        if amount <= 0:
-            print("❌ Transfer amount must be positive.")
+    target = targets[0]
+    if len(targets) > 1:
+        print("\n🔄 Transfer to:")
+        for i, account in enumerate(targets, 1):
+            print(f"{i}. {account_label(account).title()}")
+        choice = input(f"Select account (1-{len(targets)}): ").strip()
+        if not choice.isdigit() or not 1 <= int(choice) <= len(targets):
+            print("❌ Invalid selection.")
             return
-        
-        if current_account == "savings":
-            if amount > balance_savings:
-                print("❌ Insufficient funds in savings account.")
-                return
-            balance_savings -= amount
-            balance_checking += amount
-            log_transaction("TRANSFER", "Transfer: Savings → Checking", amount)
-            print(f"✅ Transferred ${amount:.2f} from Savings to Checking")
-        else:
-            if amount > balance_checking:
-                print("❌ Insufficient funds in checking account.")
-                return
-            balance_checking -= amount
-            balance_savings += amount
-            log_transaction("TRANSFER", "Transfer: Checking → Savings", amount)
-            print(f"✅ Transferred ${amount:.2f} from Checking to Savings")
-        
-        print(f"💰 Savings: ${balance_savings:.2f} | Checking: ${balance_checking:.2f}")
-        
+        target = targets[int(choice) - 1]
+    
+    try:
+        amount = to_cents(input("🔄 Enter transfer amount: $"))
     except ValueError:
-        print("❌ Invalid input. Please enter a numeric value.")
+        print("❌ Invalid input. Please enter an amount in dollars and cents.")
+        return
+    
+    result = session.transfer(target, amount)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    
+    source_name = account_label(session.account).title()
+    target_name = account_label(target).title()
+    print(f"✅ Transferred ${from_cents(result.amount)} from {source_name} to {target_name}")
+    print(" | ".join(f"💰 {account_label(a).title()}: ${from_cents(session.balance_of(a))}"
+                     for a in (session.account, target)))
 
 def pay_bills():
     """Bill payment feature"""
-    global balance_savings, balance_checking, current_account, transaction_fee
-    
+    payees = bank.payees.names
     print("\n💳 Bill Payment Options:")
-    print("1. Electricity    2. Water    3. Phone    4. Internet    5. Credit Card")
-    
-    choice = input("Select bill type (1-5): ").strip()
-    bill_types = {
-        "1": "Electricity", "2": "Water", "3": "Phone", 
-        "4": "Internet", "5": "Credit Card"
-    }
-    
-    if choice in bill_types:
-        bill_type = bill_types[choice]
-        try:
-            amount = float(input(f"Enter {bill_type} bill amount: $"))
-            
-            if amount <= 0:
-                print("❌ Bill amount must be positive.")
-                return
-            
-            current_balance = balance_savings if current_account == "savings" else balance_checking
-            total_cost = amount + transaction_fee
-            
-            if total_cost > current_balance:
-                print("❌ Insufficient funds for bill payment.")
-                return
-            
-            # Process payment
-            if current_account == "savings":
-                balance_savings -= total_cost
-            else:
-                balance_checking -= total_cost
-            
-            log_transaction("BILL_PAYMENT", f"Paid {bill_type} bill", amount)
-            log_transaction("FEE", "Bill payment fee", transaction_fee)
-            
-            print(f"✅ {bill_type} bill of ${amount:.2f} paid successfully!")
-            print(f"ℹ️  Service fee: ${transaction_fee:.2f}")
-            
-        except ValueError:
-            print("❌ Invalid input. Please enter a numeric value.")
+    print("    ".join(f"{i}. {payee}" for i, payee in enumerate(payees, 1)))
+    
+    choice = input(f"Select bill type (1-{len(payees)}): ").strip()
+    
+    if not choice.isdigit() or not 1 <= int(choice) <= len(payees):
+        print("❌ Invalid selection.")
+        return
+    
+    bill_type = payees[int(choice) - 1]
+    try:
+        amount = to_cents(input(f"Enter {bill_type} bill amount: $"))
+    except ValueError:
+        print("❌ Invalid input. Please enter an amount in dollars and cents.")
+        return
+    
+    result = session.pay_bill(bill_type, amount)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    
+    print(f"✅ {bill_type} bill of ${from_cents(result.amount)} paid successfully!")
+    print(f"ℹ️  Service fee: ${from_cents(result.fee)}")
+
+def scheduled_payments():
+    """List, add and cancel scheduled bill payments"""
+    result = session.scheduled_payments()
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    payments = result.data
+    
+    print("\n🗓️  Scheduled Payments:")
+    print("=" * 50)
+    if not payments:
+        print("No scheduled payments.")
+    for i, payment in enumerate(payments, 1):
+        repeat = f"every {payment['interval']} days" if payment["interval"] else "once"
+        print(f"{i}. {payment['payee']:<15} {'$' + from_cents(payment['amount']):>11} "
+              f"next {payment['next_due']}, {repeat} ({account_label(payment['account'])})")
+    print("=" * 50)
+    
+    action = input("(n) New payment, (c) Cancel a payment, Enter to go back: ").strip().lower()
+    if action == "n":
+        schedule_new_payment()
+    elif action == "c" and payments:
+        choice = input(f"Cancel which payment (1-{len(payments)}): ").strip()
+        if not choice.isdigit() or not 1 <= int(choice) <= len(payments):
+            print("❌ Invalid selection.")
+            return
+        result = session.cancel_payment(payments[int(choice) - 1]["id"])
+        print(f"{'✅' if result.ok else '❌'} {result.message}")
+
+def schedule_new_payment():
+    """Schedule a one-off or recurring payment from the current account"""
+    payees = bank.payees.names
+    print("    ".join(f"{i}. {payee}" for i, payee in enumerate(payees, 1)))
+    choice = input(f"Select payee (1-{len(payees)}), or type a new payee name: ").strip()
+    if choice.isdigit():
+        if not 1 <= int(choice) <= len(payees):
+            print("❌ Invalid selection.")
+            return
+        payee = int(choice) - 1
+    elif choice:
+        payee = bank.add_payee(choice)
     else:
         print("❌ Invalid selection.")
+        return
+    
+    try:
+        amount = to_cents(input(f"Enter amount to pay {bank.payees.names[payee]}: $"))
+        days = int(input("First payment in how many days (0 = today): ").strip())
+        interval = int(input("Repeat every how many days (0 = once): ").strip())
+    except ValueError:
+        print("❌ Invalid input.")
+        return
+    
+    first_day = datetime.date.today().toordinal() + days
+    result = session.schedule_payment(payee, amount, first_day, interval)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    print(f"✅ {result.message} First payment on {datetime.date.fromordinal(first_day)}.")
+    if days == 0:
+        print("ℹ️  Payments due today are made in the end-of-day run.")
 
 def switch_account():
-    """Switch between savings and checking accounts"""
-    global current_account
+    """Switch between the accounts of the logged-in customer"""
+    accounts = session.accounts()
     
-    print(f"\n🔀 Current account: {current_account.title()}")
-    print("1. Savings Account    2. Checking Account")
+    print(f"\n🔀 Current account: {account_label(session.account).title()}")
+    print("    ".join(f"{i}. {account_label(a).title()} Account" for i, a in enumerate(accounts, 1)))
     
-    choice = input("Select account (1-2): ").strip()
+    choice = input(f"Select account (1-{len(accounts)}): ").strip()
     
-    if choice == "1":
-        current_account = "savings"
-        print("✅ Switched to Savings Account")
-    elif choice == "2":
-        current_account = "checking"
-        print("✅ Switched to Checking Account")
-    else:
+    if not choice.isdigit() or not 1 <= int(choice) <= len(accounts):
         print("❌ Invalid selection.")
+        return
+    
+    result = session.switch_account(accounts[int(choice) - 1])
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    print(f"✅ Switched to {account_label(session.account).title()} Account")
 
 def change_pin():
     """Change PIN with security verification"""
-    global pin
-    
     current_pin = input("🔐 Enter current PIN: ").strip()
     
-    if current_pin != pin:
-        print("❌ Current PIN is incorrect.")
+    result = session.verify_pin(current_pin)
+    if not result.ok:
+        print(f"❌ {result.message}")
         return
     
     new_pin = input("🔑 Enter new PIN (4 digits): ").strip()
@@ -430,48 +471,139 @@ def change_pin():
     
     confirm_pin = input("🔑 Confirm new PIN: ").strip()
     
-    if new_pin != confirm_pin:
-        print("❌ PINs don't match.")
-        return
-    
-    pin = new_pin
-    log_transaction("SECURITY", "PIN changed", 0)
-    print("✅ PIN changed successfully!")
+    result = session.change_pin(current_pin, new_pin, confirm_pin)
+    if result.ok:
+        print("✅ PIN changed successfully!")
+    else:
+        print(f"❌ {result.message}")
 
 def show_statement():
     """Show mini statement with recent transactions"""
-    global transactions
+    result = session.mini_statement(5)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    recent_transactions = result.data
     
     print("\n📋 Mini Statement (Last 5 Transactions):")
     print("=" * 50)
     
-    if not transactions:
+    if not recent_transactions:
         print("No recent transactions.")
     else:
-        recent_transactions = transactions[-5:]
         for i, transaction in enumerate(recent_transactions, 1):
-            print(f"{i}. {transaction}")
+            print(f"{i}. {format_transaction(transaction, account_label)}")
     
     print("=" * 50)
 
 def show_transaction_history():
-    """Show complete transaction history"""
-    global transactions
+    """Show the customer's complete transaction history, one page at a time"""
+    result = session.transaction_history(0, history_page_size)
     
     print("\n📊 Complete Transaction History:")
     print("=" * 60)
     
-    if not transactions:
+    if result.ok and not result.data["transactions"]:
         print("No transactions found.")
-    else:
-        for i, transaction in enumerate(transactions, 1):
-            print(f"{i:2d}. {transaction}")
+    number = 0
+    while result.ok:
+        for transaction in result.data["transactions"]:
+            number += 1
+            print(f"{number:2d}. {format_transaction(transaction, account_label)}")
+        following = result.data["next"]
+        if following is None:
+            break
+        more = input(f"-- {number} shown. Enter for more, q to stop: ").strip()
+        if more.lower() == "q":
+            break
+        result = session.transaction_history(following, history_page_size)
+    if not result.ok:
+        print(f"❌ {result.message}")
     
     print("=" * 60)
 
+def search_transactions():
+    """Find the customer's transactions by date range, type and amount"""
+    types = list(TxType)
+    try:
+        start = input("From date (YYYY-MM-DD, Enter for 7 days ago): ").strip()
+        start = (datetime.date.fromisoformat(start) if start
+                 else datetime.date.today() - datetime.timedelta(days=7))
+        end = input("To date (YYYY-MM-DD, Enter for today): ").strip()
+        end = datetime.date.fromisoformat(end) if end else datetime.date.today()
+    except ValueError:
+        print("❌ Invalid date.")
+        return
+    
+    print("    ".join(f"{i}. {t.name.replace('_', ' ').title()}" for i, t in enumerate(types, 1)))
+    choice = input("Types (e.g. 2,3; Enter for all): ").strip()
+    selected = None
+    if choice:
+        numbers = [part.strip() for part in choice.split(",")]
+        if not all(n.isdigit() and 1 <= int(n) <= len(types) for n in numbers):
+            print("❌ Invalid selection.")
+            return
+        selected = [types[int(n) - 1] for n in numbers]
+    
+    try:
+        low = input("Minimum amount (Enter for none): $").strip()
+        low = to_cents(low) if low else None
+        high = input("Maximum amount (Enter for none): $").strip()
+        high = to_cents(high) if high else None
+    except ValueError:
+        print("❌ Invalid input. Please enter an amount in dollars and cents.")
+        return
+    
+    start_ts = time.mktime(start.timetuple())
+    end_ts = time.mktime((end + datetime.timedelta(days=1)).timetuple())
+    result = session.search_transactions(start_ts, end_ts, selected, low, high,
+                                         limit=search_limit + 1)
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    
+    found = result.data
+    print(f"\n🔎 Transactions {start} to {end}:")
+    print("=" * 60)
+    if not found:
+        print("No matching transactions.")
+    for number, transaction in enumerate(found[:search_limit], 1):
+        print(f"{number:2d}. {format_transaction(transaction, account_label)}")
+    if len(found) > search_limit:
+        print(f"-- First {search_limit} shown; narrow the search to see the rest.")
+    print("=" * 60)
+
+def export_transaction_history():
+    """Export the customer's history to a CSV or JSON Lines file"""
+    choice = input("Export format - (1) CSV, (2) JSON Lines: ").strip()
+    if choice not in ("1", "2"):
+        print("❌ Invalid selection.")
+        return
+    fmt = export.FORMATS[int(choice) - 1]
+    compress = input("Compress with gzip? (y/N): ").strip().lower() == "y"
+    try:
+        start = input("From date (YYYY-MM-DD, Enter for the beginning): ").strip()
+        start = datetime.date.fromisoformat(start) if start else None
+        end = input("To date (YYYY-MM-DD, Enter for today): ").strip()
+        end = datetime.date.fromisoformat(end) if end else None
+    except ValueError:
+        print("❌ Invalid date.")
+        return
+    
+    stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(data_dir, f"history-{session.customer}-{stamp}.{fmt}"
+                                  + (".gz" if compress else ""))
+    with export.open_output(path, compress) as out:
+        stats = export.export_history(bank.history, out, fmt, session.accounts(), start, end)
+    print(f"✅ Exported {stats.records} record(s) to {path} ({stats.rate:,.0f} records/sec)")
+
 def generate_monthly_statement():
     """Generate a detailed monthly statement"""
-    global transactions, balance_savings, balance_checking
+    result = session.monthly_statement()
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    summary = result.data["summary"]
     
     print("\n📄 Monthly Account Statement")
     print("=" * 50)
@@ -480,127 +612,158 @@ def generate_monthly_statement():
     print("=" * 50)
     
     print(f"💰 Current Balances:")
-    print(f"   Savings Account:  ${balance_savings:.2f}")
-    print(f"   Checking Account: ${balance_checking:.2f}")
-    print(f"   Total Balance:    ${balance_savings + balance_checking:.2f}")
+    for account, balance in result.data["balances"]:
+        print(f"   {account_label(account).title() + ' Account:':<22}${from_cents(balance)}")
+    print(f"   {'Total Balance:':<22}${from_cents(result.balance)}")
     
-    print(f"\n📊 Transaction Summary:")
-    deposits = sum(1 for t in transactions if "DEPOSIT" in t)
-    withdrawals = sum(1 for t in transactions if "WITHDRAWAL" in t or "QUICK_CASH" in t)
-    transfers = sum(1 for t in transactions if "TRANSFER" in t)
-    payments = sum(1 for t in transactions if "BILL_PAYMENT" in t)
+    if result.data["months"]:
+        print(f"\n📅 This Month:")
+        for month in result.data["months"]:
+            print(f"   {account_label(month.account).title() + ':':<22}"
+                  f"opening ${from_cents(month.opening)} → closing ${from_cents(month.closing)}")
     
-    print(f"   Deposits:     {deposits}")
-    print(f"   Withdrawals:  {withdrawals}")
-    print(f"   Transfers:    {transfers}")
-    print(f"   Bill Payments: {payments}")
-    print(f"   Total Transactions: {len(transactions)}")
+    print(f"\n📊 Transaction Summary:")
+    deposits = summary[TxType.DEPOSIT][0]
+    withdrawals = summary[TxType.WITHDRAWAL][0] + summary[TxType.QUICK_CASH][0]
+    transfers = summary[TxType.TRANSFER][0]
+    payments = summary[TxType.BILL_PAYMENT][0]
+    
+    print(f"   Deposits:     {deposits} (${from_cents(summary[TxType.DEPOSIT][1])})")
+    print(f"   Withdrawals:  {withdrawals} "
+          f"(${from_cents(summary[TxType.WITHDRAWAL][1] + summary[TxType.QUICK_CASH][1])})")
+    print(f"   Transfers:    {transfers} (${from_cents(summary[TxType.TRANSFER][1])})")
+    print(f"   Bill Payments: {payments} (${from_cents(summary[TxType.BILL_PAYMENT][1])})")
+    print(f"   Fees:         ${from_cents(summary[TxType.FEE][1])}")
+    print(f"   Total Transactions: {sum(count for count, _ in summary.values())}")
+    
+    if result.data["categories"]:
+        print(f"\n🧾 Spending by Category (vs last month):")
+        for category, (cents, previous, change) in result.data["categories"].items():
+            sign = "+" if change >= 0 else "-"
+            amount = "$" + from_cents(cents)
+            print(f"   {category + ':':<14}{amount:>11}  ({sign}${from_cents(abs(change))})")
+        top = ", ".join(category for category, _ in result.data["top_categories"])
+        print(f"   Top categories: {top}")
     
     print("=" * 50)
 
 def calculate_interest():
-    """Calculate and apply interest to savings account"""
-    global balance_savings, last_interest_date
-    
-    current_date = datetime.datetime.now().date()
+    """Calculate and apply pending interest to the customer's savings accounts"""
+    result = session.calculate_interest()
     
-    if last_interest_date == current_date:
+    if result.code == core.NOTHING_TO_DO:
         print("💹 Interest already calculated today.")
         return
-    
-    # Simple daily interest calculation (0.01% daily = ~3.65% annual)
-    daily_interest_rate = 0.0001
-    interest_earned = balance_savings * daily_interest_rate
-    
-    if interest_earned > 0:
-        balance_savings += interest_earned
-        log_transaction("INTEREST", "Daily interest earned", interest_earned)
-        print(f"💹 Interest earned: ${interest_earned:.2f}")
-        print(f"💰 New savings balance: ${balance_savings:.2f}")
-        last_interest_date = current_date
-    else:
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    if not result.data:
         print("💹 No interest earned (zero balance).")
-
-def calculate_daily_interest():
-    """Calculate any pending daily interest"""
-    global last_interest_date, balance_savings, transactions
-    
-    current_date = datetime.datetime.now().date()
+        return
     
-    if last_interest_date and last_interest_date < current_date:
-        days_passed = (current_date - last_interest_date).days
-        if days_passed > 0:
-            print(f"💹 Calculating {days_passed} day(s) of pending interest...")
-            for _ in range(days_passed):
-                calculate_interest()
+    for account, days, cents in result.data:
+        print(f"💹 Interest earned over {days} day(s): ${from_cents(cents)}")
+        print(f"💰 New {account_label(account)} balance: ${from_cents(session.balance_of(account))}")
+
+def run_end_of_day():
+    """Run the end-of-day pipeline: scheduled payments, interest, limits, fees and alerts"""
+    report = bank.end_of_day().data
+    payments = report.payments
+    if payments.paid:
+        print(f"🗓️  Made {payments.paid} scheduled payment(s) totalling ${from_cents(payments.cents)}.")
+    if payments.retried or payments.failed:
+        print(f"⚠️  {payments.retried + payments.failed} scheduled payment(s) could not be made "
+              f"(insufficient funds).")
+    if report.interest_accounts:
+        print(f"💹 Credited ${from_cents(report.interest_cents)} of pending interest to "
+              f"{report.interest_accounts} account(s).")
+    if report.fee_accounts:
+        print(f"ℹ️  Charged ${from_cents(report.fee_cents)} of monthly maintenance fees to "
+              f"{report.fee_accounts} account(s).")
 
 def show_account_info():
     """Display detailed account information"""
-    global balance_savings, balance_checking, current_account
-    global daily_withdrawal_limit, daily_withdrawn, pin
+    result = session.daily_limits()
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    limits = result.data
     
     print("\nℹ️  Account Information:")
     print("=" * 40)
-    print(f"👤 Account Holder: ATM User")
-    print(f"🏦 Current Account: {current_account.title()}")
-    print(f"💰 Savings Balance: ${balance_savings:.2f}")
-    print(f"💳 Checking Balance: ${balance_checking:.2f}")
-    print(f"💵 Total Balance: ${balance_savings + balance_checking:.2f}")
-    print(f"📉 Daily Withdrawal Limit: ${daily_withdrawal_limit:.2f}")
-    print(f"📊 Today's Withdrawals: ${daily_withdrawn:.2f}")
-    print(f"📈 Remaining Limit: ${daily_withdrawal_limit - daily_withdrawn:.2f}")
-    print(f"🔐 PIN: {'*' * len(pin)}")
+    print(f"👤 Account Holder: ATM User (card #{session.customer})")
+    print(f"🏦 Current Account: {account_label(session.account).title()}")
+    for account, balance in session.balances().data:
+        print(f"💰 {account_label(account).title()} Balance: ${from_cents(balance)}")
+    print(f"💵 Total Balance: ${from_cents(bank.store.total_balance(session.customer))}")
+    print(f"📉 Daily Withdrawal Limit: ${from_cents(limits['limit'])}")
+    period = "Today's" if limits["window"] == "day" else "Last 24h"
+    print(f"📊 {period} Withdrawals: ${from_cents(limits['used'])}")
+    print(f"📈 Remaining Limit: ${from_cents(limits['remaining'])}")
+    alerts = bank.fraud.alerts_for(session.customer)
+    if alerts:
+        print(f"🛡️  Security Alerts: {len(alerts)} (latest: {alerts[-1].rule})")
+    print(f"🔐 PIN: {'*' * 4}")
     print(f"📅 Last Login: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("=" * 40)
 
+def show_metrics():
+    """Display call counts, outcomes and latency percentiles per operation"""
+    rows = metrics.registry.summary()
+    
+    print("\n📟 Operation Metrics:")
+    print("=" * 60)
+    if not rows:
+        print("No operations recorded.")
+    else:
+        print(f"{'Operation':<20}{'Calls':>7}{'p50 µs':>10}{'p99 µs':>10}{'max µs':>10}")
+        for operation, calls, p50, p99, slowest, outcomes in rows:
+            print(f"{operation:<20}{calls:>7}{p50 / 1000:>10.1f}{p99 / 1000:>10.1f}"
+                  f"{slowest / 1000:>10.1f}")
+            breakdown = {code: n for code, n in outcomes.items() if code != core.OK}
+            if breakdown:
+                print("    " + ", ".join(f"{code} {n}" for code, n in sorted(breakdown.items())))
+    keys = bank.idempotency
+    print(f"🔁 Request keys: {len(keys)} cached, hit rate {keys.hit_rate:.1%}, "
+          f"{keys.evictions} evicted")
+    print(f"📁 Exported to {os.path.join(data_dir, metrics_file)} on exit")
+    print("=" * 60)
+
 def check_daily_limits():
     """Check and display daily transaction limits"""
-    global daily_withdrawal_limit, daily_withdrawn
+    result = session.daily_limits()
+    if not result.ok:
+        print(f"❌ {result.message}")
+        return
+    limits = result.data
     
     print("\n📈 Daily Transaction Limits:")
     print("=" * 35)
-    print(f"💸 Withdrawal Limit: ${daily_withdrawal_limit:.2f}")
-    print(f"📊 Used Today: ${daily_withdrawn:.2f}")
-    print(f"💰 Remaining: ${daily_withdrawal_limit - daily_withdrawn:.2f}")
-    print(f"💵 Deposit Limit: $10,000.00")
+    print(f"💸 Withdrawal Limit: ${from_cents(limits['limit'])}")
+    period = "Today" if limits["window"] == "day" else "in Last 24h"
+    print(f"📊 Used {period}: ${from_cents(limits['used'])}")
+    print(f"💰 Remaining: ${from_cents(limits['remaining'])}")
+    print(f"💵 Deposit Limit: ${from_cents(limits['deposit_limit'], grouping=True)}")
     print("=" * 35)
 
-def check_daily_limit_reset():
-    """Reset daily withdrawal limit if new day"""
-    global daily_withdrawn, last_withdrawal_date
-    
-    current_date = datetime.datetime.now().date()
-    
-    if last_withdrawal_date != current_date:
-        daily_withdrawn = 0.0
-        last_withdrawal_date = current_date
-
 def check_session_timeout():
-    """Check if session has timed out"""
-    global session_start_time, session_timeout
-    
-    if session_start_time:
-        elapsed = (datetime.datetime.now() - session_start_time).total_seconds()
-        return elapsed > session_timeout
-    
-    return False
+    """Check if session has timed out, firing any expired deadlines first"""
+    bank.tick()
+    return session.timed_out()
 
-def log_transaction(transaction_type, description, amount):
-    """Log transaction with timestamp and details"""
-    global transactions
-    
-    timestamp = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    
-    if amount > 0:
-        transaction_log = f"[{timestamp}] {transaction_type}: {description} - ${amount:.2f}"
-    else:
-        transaction_log = f"[{timestamp}] {transaction_type}: {description}"
-    
-    transactions.append(transaction_log)
-    
-    # Keep only last 100 transactions to manage memory
-    if len(transactions) > 100:
-        transactions = transactions[-100:]
+def to_cents(text):
+    """Parse a dollar amount typed by the user into integer cents"""
+    return money.parse_cents(text)
+
+def from_cents(cents, grouping=False):
+    """Format integer cents as dollars for display, e.g. 1050 -> '10.50'"""
+    return money.format_cents(cents, grouping)
+
+def account_label(account):
+    """Short display name of an account, e.g. 'savings #0'"""
+    if account == NO_ACCOUNT:
+        return "-"
+    return f"{bank.store.kind_name(account)} #{account}"
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,127 @@
+"""
+Columnar account store for the Enhanced ATM Simulation.
+
+Every customer and every account is a row in a set of typed arrays rather than
+a dict or object of its own, so the store can hold millions of customers with
+only a few tens of bytes per account.
+
+## Layout
+
+- **Accounts:** balance (integer cents), owner, kind, the last day interest
+  was credited and a link to the owner's next account, one ``array`` column each
+- **Customers:** head/tail of the customer's account chain (PINs are kept
+  hashed in pins.PinStore)
+- **Ids are rows:** customer and account numbers are handed out sequentially
+  and double as the row index, so every lookup is a single array access
+- **Any number of accounts per customer:** accounts of one customer are chained
+  through ``next_account``, so opening one more account is O(1)
+"""
+
+import datetime
+from array import array
+
+import money
+
+# Account kinds
+SAVINGS = 0
+CHECKING = 1
+ACCOUNT_KINDS = {SAVINGS: "savings", CHECKING: "checking"}
+
+NO_ACCOUNT = -1
+
+class AccountStore:
+    """Compact in-memory store of customers and their accounts"""
+
+    def __init__(self):
+        # Per-account columns, indexed by account id
+        self.balance = array("q")
+        self.owner = array("q")
+        self.kind = array("b")
+        self.interest_day = array("i")
+        self.next_account = array("q")
+
+        # Per-customer columns, indexed by customer id
+        self.first_account = array("q")
+        self.last_account = array("q")
+
+    def __len__(self):
+        return len(self.balance)
+
+    @property
+    def customer_count(self):
+        return len(self.first_account)
+
+    def add_customer(self):
+        """Register a customer and return the customer id"""
+        customer = len(self.first_account)
+        self.first_account.append(NO_ACCOUNT)
+        self.last_account.append(NO_ACCOUNT)
+        return customer
+
+    def open_account(self, customer, kind, balance_cents=0, opened_day=None):
+        """Open an account for an existing customer and return the account id
+
+        opened_day is a date ordinal; interest accrues from that day on.
+        """
+        if kind not in ACCOUNT_KINDS:
+            raise ValueError(f"Unknown account kind: {kind}")
+        self.check_customer(customer)
+
+        account = len(self.balance)
+        self.balance.append(balance_cents)
+        self.owner.append(customer)
+        self.kind.append(kind)
+        if opened_day is None:
+            opened_day = datetime.date.today().toordinal()
+        self.interest_day.append(opened_day)
+        self.next_account.append(NO_ACCOUNT)
+
+        tail = self.last_account[customer]
+        if tail == NO_ACCOUNT:
+            self.first_account[customer] = account
+        else:
+            self.next_account[tail] = account
+        self.last_account[customer] = account
+        return account
+
+    def check_customer(self, customer):
+        if not 0 <= customer < len(self.first_account):
+            raise KeyError(f"Unknown customer: {customer}")
+
+    def check_account(self, account):
+        if not 0 <= account < len(self.balance):
+            raise KeyError(f"Unknown account: {account}")
+
+    def accounts_of(self, customer):
+        """Yield the account ids of a customer in the order they were opened"""
+        self.check_customer(customer)
+        account = self.first_account[customer]
+        while account != NO_ACCOUNT:
+            yield account
+            account = self.next_account[account]
+
+    def kind_name(self, account):
+        return ACCOUNT_KINDS[self.kind[account]]
+
+    def credit(self, account, cents):
+        """Add cents to an account and return the new balance"""
+        self.balance[account] += cents
+        return self.balance[account]
+
+    def debit(self, account, cents):
+        """Remove cents from an account and return the new balance"""
+        self.balance[account] -= cents
+        return self.balance[account]
+
+    def total_balance(self, customer):
+        return sum(self.balance[a] for a in self.accounts_of(customer))
+
+    def total(self):
+        """Cents held across every account, summed exactly in int64"""
+        return money.total(self.balance)
+
+    def nbytes(self):
+        """Approximate memory used by the columns, in bytes"""
+        columns = (self.balance, self.owner, self.kind, self.interest_day, self.next_account,
+                   self.first_account, self.last_account)
+        return sum(c.itemsize * len(c) for c in columns)
@@ -0,0 +1,189 @@
+"""
+Batch runner for the Enhanced ATM Simulation.
+
+Executes operations from a CSV or JSON Lines file against the programmatic
+core, with no prompts and no pacing, and reports throughput.
+
+Each row names an operation and the card it runs for:
+
+    op,card,pin,amount,account,target,bill,new_pin
+    login,0,1234,,,,,
+    deposit,0,,100.00,,,,
+    transfer,0,,25.00,0,1,,
+    pay_bill,0,,40.00,,,Electricity,
+
+or, as JSON Lines, ``{"op": "withdraw", "card": 0, "amount": "60"}``.
+Amounts are dollars. ``account`` switches the card's session to that account
+before the operation runs. A card must ``login`` before anything else. An
+optional ``key`` is the operation's idempotency key: a repeated row with the
+same key returns the first result instead of running again.
+
+With ``--data-dir`` the bank is recovered from, and journaled to, the
+write-ahead log in that directory (see wal.py), and history is appended to
+the binary history file there (see history.py).
+
+With ``--metrics`` per-operation counts, outcomes and latency histograms are
+written there in the Prometheus text format (see metrics.py).
+
+Usage: python batch.py OPERATIONS_FILE [--results OUT.jsonl] [--customers N]
+                       [--data-dir DIR] [--metrics FILE] [--rolling-limit]
+                       [--pin-iterations N]
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+
+import core
+import metrics
+from money import parse_cents
+from history import HistoryFile, HISTORY_NAME
+from pins import DEFAULT_ITERATIONS, FAST_ITERATIONS
+from wal import WriteAheadLog
+
+def read_operations(path):
+    """Yield operations as dicts from a .csv or .jsonl file"""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield {k: v for k, v in row.items() if v not in (None, "")}
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+class BatchRunner:
+    """Executes operations for many cards, keeping one session per card"""
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.sessions = {}
+        self.codes = {}
+        self.executed = 0
+
+    def session_for(self, card):
+        session = self.sessions.get(card)
+        if session is None:
+            session = self.sessions[card] = self.bank.open_session()
+        return session
+
+    def execute(self, op):
+        """Run one operation dict and return its Result"""
+        self.bank.tick()
+        try:
+            result = self._dispatch(op)
+        except (KeyError, ValueError) as e:
+            result = core.fail(core.INVALID_CHOICE, f"Bad operation {op!r}: {e}")
+        self.executed += 1
+        self.codes[result.code] = self.codes.get(result.code, 0) + 1
+        return result
+
+    def _dispatch(self, op):
+        name = op["op"]
+        card = int(op["card"])
+        session = self.session_for(card)
+
+        if name == "login":
+            return session.login(card, str(op["pin"]))
+        if name == "logout":
+            return session.logout()
+        if name == "switch":
+            return session.switch_account(int(op["account"]))
+
+        if "account" in op:
+            result = session.switch_account(int(op["account"]))
+            if not result.ok:
+                return result
+        keyed = {"key": str(op["key"])} if "key" in op else {}
+
+        if name == "deposit":
+            return session.deposit(parse_cents(op["amount"]), **keyed)
+        if name == "withdraw":
+            return session.withdraw(parse_cents(op["amount"]), **keyed)
+        if name == "quick_cash":
+            return session.quick_cash(parse_cents(op["amount"]), **keyed)
+        if name == "transfer":
+            return session.transfer(int(op["target"]), parse_cents(op["amount"]), **keyed)
+        if name == "pay_bill":
+            return session.pay_bill(op["bill"], parse_cents(op["amount"]), **keyed)
+        if name == "change_pin":
+            return session.change_pin(str(op["pin"]), str(op["new_pin"]), str(op["new_pin"]), **keyed)
+        if name == "balance":
+            return session.balances()
+        if name == "statement":
+            return session.mini_statement()
+        if name == "monthly_statement":
+            return session.monthly_statement()
+        if name == "interest":
+            return session.calculate_interest()
+        if name == "daily_limits":
+            return session.daily_limits()
+        raise ValueError(f"unknown operation {name!r}")
+
+    def run(self, operations, results_file=None):
+        """Execute every operation; returns (count, elapsed seconds)"""
+        start = time.perf_counter()
+        for op in operations:
+            result = self.execute(op)
+            if results_file is not None:
+                results_file.write(json.dumps(result.as_dict()) + "\n")
+        return self.executed, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run ATM operations from a CSV/JSONL file")
+    parser.add_argument("operations", help="operations file (.csv or .jsonl)")
+    parser.add_argument("--results", help="write one JSON result per operation here")
+    parser.add_argument("--customers", type=int, default=1,
+                        help="default customers to create first (PIN 1234, $1000/$500)")
+    parser.add_argument("--data-dir", help="recover from and journal to this WAL directory")
+    parser.add_argument("--metrics", help="write Prometheus-format operation metrics here")
+    parser.add_argument("--rolling-limit", action="store_true",
+                        help="apply the withdrawal limit to the last 24 hours, not the day")
+    parser.add_argument("--pin-iterations", type=int, default=DEFAULT_ITERATIONS,
+                        help="PIN hashing work factor; lower it to create many customers "
+                             f"quickly (e.g. {FAST_ITERATIONS})")
+    args = parser.parse_args(argv)
+    
+    if args.metrics:
+        metrics.registry.enable()
+    bank = core.Bank(rolling_limit=args.rolling_limit, pin_iterations=args.pin_iterations)
+    journal = None
+    if args.data_dir:
+        journal = WriteAheadLog(args.data_dir)
+        recovered = journal.recover(bank)
+        print(f"Recovered {recovered} log records in {journal.recovery_seconds * 1000:.1f} ms")
+        journal.attach(bank)
+        bank.attach_history(HistoryFile(os.path.join(args.data_dir, HISTORY_NAME), bank.store))
+    while bank.store.customer_count < args.customers:
+        bank.add_customer("1234", savings=100000, checking=50000)
+
+    runner = BatchRunner(bank)
+    results_file = open(args.results, "w", encoding="utf-8") if args.results else None
+    try:
+        count, elapsed = runner.run(read_operations(args.operations), results_file)
+    finally:
+        if results_file is not None:
+            results_file.close()
+        if journal is not None:
+            journal.close()
+            bank.history.close()
+
+    if args.metrics:
+        metrics.registry.write_prometheus(args.metrics)
+
+    rate = count / elapsed if elapsed else float("inf")
+    print(f"Executed {count} operations in {elapsed:.3f}s ({rate:,.0f} ops/sec)")
+    for code, n in sorted(runner.codes.items()):
+        print(f"  {code}: {n}")
+    if journal is not None:
+        stats = journal.stats()
+        print(f"Journal: {stats['records']} records in {stats['commits']} commits "
+              f"({stats['records_per_sec']:,.0f} records/sec of commit time)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
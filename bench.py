@@ -0,0 +1,217 @@
+"""
+Microbenchmarks for the Enhanced ATM Simulation.
+
+Times the hot paths at several history sizes and reports ops/sec plus p50
+and p99 latency for each:
+
+- ``log_transaction``, deposit, withdraw (with and without fee), transfer and
+  bill payment through the core
+- the monthly statement and the first page of the transaction history, as
+  rendered by the interactive front end (output discarded)
+- interest catch-up of a savings account 30 days behind
+
+Before each size the ledger and a temporary history file are filled with
+that many records, spread over the past year and over ``--customers``
+customers. Results are written as JSON; ``--compare`` checks them against
+an earlier run and exits non-zero when a benchmark's p50 got slower than
+the tolerance allows.
+
+Sizes up to 10^7 are supported. Once the history file is attached the
+ledger keeps only its recent window, so a 10^7 run stays under 300 MB of
+memory, mostly the history file's indexes. The file itself takes 72 bytes
+a record, about 720 MB on disk at 10^7. Filling runs at roughly 100k
+records/sec, so the default stops at 10^5 and ``--full`` runs every size
+up to 10^7.
+
+Usage: python bench.py [--sizes 100,1000,... | --full] [--iterations N]
+                       [--output FILE] [--compare BASELINE.json] [--tolerance 0.2]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import core
+import interest
+from history import HistoryFile, HISTORY_NAME
+from ledger import TxType
+from server import percentile
+from tools import make_bank
+
+import ATM
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+FULL_SIZES = DEFAULT_SIZES + (1000000, 10000000)
+YEAR_SECONDS = 365 * 24 * 3600
+PREFILL_TYPES = (TxType.DEPOSIT, TxType.WITHDRAWAL, TxType.BILL_PAYMENT, TxType.FEE)
+
+class FakeClock:
+    """Clock that can be set while the history is being filled"""
+
+    def __init__(self):
+        self.now = None
+
+    def __call__(self):
+        return time.time() if self.now is None else self.now
+
+def build_bank(size, customers, directory):
+    """A bank whose ledger and history file already hold `size` records"""
+    clock = FakeClock()
+    # unlimited: the loops below would trip the limits and velocity rules
+    bank = make_bank(customers, 10 ** 12, 10 ** 12, unlimited=True, clock=clock)
+    bank.attach_history(HistoryFile(os.path.join(directory, HISTORY_NAME), bank.store))
+
+    accounts = len(bank.store)
+    start = time.time() - YEAR_SECONDS
+    for i in range(size):
+        clock.now = start + YEAR_SECONDS * i / size
+        bank.log_transaction(PREFILL_TYPES[i % len(PREFILL_TYPES)], i % accounts, 100 + i % 97)
+    clock.now = None
+    bank.history.flush()
+    return bank
+
+def operations(bank):
+    """name -> zero-argument callable performing one operation"""
+    session = bank.open_session()
+    session.login(0, "1234")
+    savings, checking = session.accounts()
+    store = bank.store
+    today = interest.today()
+
+    def catch_up():
+        store.interest_day[savings] = today - 30
+        return interest.catch_up_account(store, bank.ledger, savings, today)
+
+    def render(view):
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                view()
+        return run
+
+    return {
+        "log_transaction": lambda: bank.log_transaction(TxType.DEPOSIT, checking, 100),
+        "deposit": lambda: session.deposit(100),
+        "withdraw": lambda: session.withdraw(100),
+        "withdraw_with_fee": lambda: session.withdraw(bank.fee_threshold + 100),
+        "transfer": lambda: session.transfer(checking, 100),
+        "pay_bill": lambda: session.pay_bill("Water", 100),
+        "monthly_statement": render(ATM.generate_monthly_statement),
+        "history_page": render(ATM.show_transaction_history),
+        "interest_catch_up": catch_up,
+    }, session
+
+def measure(operation, iterations, max_seconds):
+    """Time single calls; returns ops/sec, p50/p99 in microseconds and the count"""
+    clock = time.perf_counter_ns
+    latencies = []
+    deadline = time.perf_counter() + max_seconds
+    for i in range(iterations):
+        start = clock()
+        operation()
+        latencies.append(clock() - start)
+        if i >= 10 and time.perf_counter() > deadline:
+            break
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "iterations": len(latencies),
+        "ops_per_sec": len(latencies) * 1e9 / total if total else 0.0,
+        "p50_us": percentile(latencies, 50) / 1000,
+        "p99_us": percentile(latencies, 99) / 1000,
+    }
+
+def run(sizes, iterations, customers, max_seconds, selected=None):
+    results = []
+    ATM.input = lambda prompt="": "q"  # stop the history view after one page
+    for size in sizes:
+        directory = tempfile.mkdtemp(prefix="atm-bench-")
+        try:
+            start = time.perf_counter()
+            bank = build_bank(size, customers, directory)
+            print(f"\nHistory of {size:,} records (filled in {time.perf_counter() - start:.1f}s)")
+            print(f"  {'benchmark':<20}{'ops/sec':>12}{'p50 µs':>10}{'p99 µs':>10}")
+
+            ops, session = operations(bank)
+            ATM.bank, ATM.session = bank, session
+            for name, operation in ops.items():
+                if selected and name not in selected:
+                    continue
+                outcome = operation()
+                if isinstance(outcome, core.Result) and not outcome.ok:
+                    raise RuntimeError(f"{name} failed during warm-up: {outcome.message}")
+                stats = measure(operation, iterations, max_seconds)
+                results.append({"benchmark": name, "history": size, **stats})
+                print(f"  {name:<20}{stats['ops_per_sec']:>12,.0f}"
+                      f"{stats['p50_us']:>10.1f}{stats['p99_us']:>10.1f}")
+            bank.history.close()
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    del ATM.input
+    return results
+
+def compare(results, baseline_path, tolerance):
+    """Print p50 changes against a baseline run; returns the regressions"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["benchmark"], r["history"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    for result in results:
+        old = baseline.get((result["benchmark"], result["history"]))
+        if old is None or not old["p50_us"]:
+            continue
+        change = result["p50_us"] / old["p50_us"] - 1
+        flag = "  ❌ regression" if change > tolerance else ""
+        print(f"  {result['benchmark']:<20}{result['history']:>10,}  p50 {change:+.1%}{flag}")
+        if flag:
+            regressions.append(result)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the ATM hot paths")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma-separated history sizes (up to 10000000)")
+    parser.add_argument("--full", action="store_true",
+                        help="run every size up to 10000000 (several minutes)")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--max-seconds", type=float, default=2.0,
+                        help="stop a benchmark early once it has run this long")
+    parser.add_argument("--customers", type=int, default=100)
+    parser.add_argument("--only", help="comma-separated benchmark names")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed p50 slowdown before --compare fails")
+    args = parser.parse_args(argv)
+
+    sizes = list(FULL_SIZES) if args.full else [int(s) for s in args.sizes.split(",")]
+    selected = set(args.only.split(",")) if args.only else None
+    results = run(sizes, args.iterations, args.customers, args.max_seconds, selected)
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "customers": args.customers,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Cash cassettes for the Enhanced ATM Simulation.
+
+A terminal's cash is a few cassettes, one denomination each. Before a
+withdrawal is accepted, ``CashCassettes.solve`` picks the note mix that
+pays the amount in the fewest notes from the notes actually loaded, or
+rejects the amount. Limited supply means greedy change-making is not
+enough: with only $50 and $20 notes left, $60 is three twenties, not a
+fifty and a failure.
+
+- **Solver:** bounded change-making by dynamic programming over multiples
+  of the smallest unit the denominations share. Each cassette's count is
+  split into 1, 2, 4, ... note bundles (0/1 knapsack over bundles). A
+  dispense is capped at ``MAX_NOTES`` notes, which bounds the table.
+- **Cache:** solutions are memoized per amount. Dispensing only removes
+  notes, so a cached mix that still fits stays optimal and a cached
+  rejection stays a rejection; only mixes that no longer fit are dropped.
+  Loading notes clears the cache.
+- **Presets:** the quick-cash amounts are solved up front and re-solved
+  whenever a change invalidates them, so a quick-cash withdrawal is one
+  dictionary lookup.
+
+Amounts are integer cents.
+"""
+
+from array import array
+from math import gcd
+
+# Denomination (cents) -> notes loaded into a fresh terminal
+DEFAULT_LOAD = {10000: 200, 5000: 400, 2000: 1000, 1000: 500}
+MAX_NOTES = 40  # most notes the dispenser pays out at once
+CACHE_SIZE = 256
+
+class CashCassettes:
+    """Notes per denomination and a cached solver for note mixes"""
+
+    def __init__(self, load=None, presets=()):
+        load = DEFAULT_LOAD if load is None else load
+        self.denominations = tuple(sorted(load, reverse=True))
+        self.counts = array("l", (load[d] for d in self.denominations))
+        self.unit = 0
+        for denomination in self.denominations:
+            self.unit = gcd(self.unit, denomination)
+        self.presets = tuple(presets)
+        # amount -> note counts per denomination, or None when it cannot be paid
+        self.cache = {}
+        self.hits = self.misses = 0
+        self._solve_presets()
+
+    def total(self):
+        """Cents held in the cassettes"""
+        return sum(d * n for d, n in zip(self.denominations, self.counts))
+
+    def notes(self, mix):
+        """{denomination: count} of a mix, without the zero entries"""
+        return {d: n for d, n in zip(self.denominations, mix) if n}
+
+    # Solving
+
+    def solve(self, cents):
+        """Fewest-notes mix paying cents from the loaded notes, or None"""
+        try:
+            mix = self.cache[cents]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            return mix
+        mix = self._solve(cents)
+        if len(self.cache) >= CACHE_SIZE:
+            self.cache.clear()
+            self._solve_presets()
+        self.cache[cents] = mix
+        return mix
+
+    def _solve(self, cents):
+        if cents <= 0 or cents % self.unit or cents > self.total():
+            return None
+        units = cents // self.unit
+        if units > MAX_NOTES * self.denominations[0] // self.unit:
+            return None
+
+        # Bundles of 1, 2, 4, ... notes per denomination, as 0/1 items
+        bundles = []
+        for index, (denomination, count) in enumerate(zip(self.denominations, self.counts)):
+            count = min(count, MAX_NOTES, units * self.unit // denomination)
+            size = 1
+            while count > 0:
+                take = min(size, count)
+                bundles.append((index, take, take * denomination // self.unit))
+                count -= take
+                size *= 2
+
+        # best[v]: fewest notes making v units; chosen[i][v]: bundle i used for v
+        unreachable = MAX_NOTES + 1
+        best = [0] + [unreachable] * units
+        chosen = []
+        for _, notes, value in bundles:
+            used = bytearray(units + 1)
+            for v in range(units, value - 1, -1):
+                candidate = best[v - value] + notes
+                if candidate < best[v]:
+                    best[v] = candidate
+                    used[v] = 1
+            chosen.append(used)
+        if best[units] > MAX_NOTES:
+            return None
+
+        mix = [0] * len(self.denominations)
+        v = units
+        for (index, notes, value), used in zip(reversed(bundles), reversed(chosen)):
+            if used[v]:
+                mix[index] += notes
+                v -= value
+        return tuple(mix)
+
+    def _solve_presets(self):
+        for cents in self.presets:
+            if cents not in self.cache:
+                self.cache[cents] = self._solve(cents)
+
+    # Inventory changes
+
+    def dispense(self, mix):
+        """Remove a solved mix from the cassettes"""
+        counts = self.counts
+        for index, notes in enumerate(mix):
+            if notes > counts[index]:
+                raise ValueError("not enough notes loaded for this mix")
+        for index, notes in enumerate(mix):
+            counts[index] -= notes
+        # Fewer notes: keep every mix that still fits (it is still the best)
+        # and every rejection; drop the rest
+        stale = [cents for cents, cached in self.cache.items()
+                 if cached is not None and any(n > c for n, c in zip(cached, counts))]
+        for cents in stale:
+            del self.cache[cents]
+        if stale:
+            self._solve_presets()
+
+    def load(self, denomination, notes):
+        """Add notes of an existing denomination"""
+        self.counts[self.denominations.index(denomination)] += notes
+        self.cache.clear()
+        self._solve_presets()
@@ -0,0 +1,134 @@
+"""
+Spending by category for the Enhanced ATM Simulation.
+
+Money leaving an account is filed under a category: cash (withdrawals and
+quick cash), fees, or the category of a bill payment's payee: its bill type,
+or the category the payee was registered with (see payments.py).
+``SpendingRollups`` is a ledger listener that adds every such record to a
+daily and a monthly rollup for its account as it is appended, so "spend by
+category for month M", the top N categories and month-over-month changes are
+answered from the rollups without rescanning history.
+
+Each rollup is an array of (count, cents) per category. Monthly rollups are
+kept indefinitely; daily rollups for the last ``daily_retention`` days.
+"""
+
+import datetime
+import heapq
+from array import array
+
+from ledger import TxType
+
+BILL_TYPES = ("Electricity", "Water", "Phone", "Internet", "Credit Card")
+CASH = "Cash"
+FEES = "Fees"
+OTHER_BILLS = "Other Bills"
+CATEGORIES = (CASH, FEES) + BILL_TYPES + (OTHER_BILLS,)
+CATEGORY_COUNT = len(CATEGORIES)
+CATEGORY_INDEX = {name: i for i, name in enumerate(CATEGORIES)}
+
+def category_of(tx, payee_categories=None):
+    """Category index of a spending record, or None if it is not spending
+
+    payee_categories maps payee names (bill payment memos) to category names.
+    """
+    if tx.type == TxType.WITHDRAWAL or tx.type == TxType.QUICK_CASH:
+        return CATEGORY_INDEX[CASH]
+    if tx.type == TxType.FEE:
+        return CATEGORY_INDEX[FEES]
+    if tx.type == TxType.BILL_PAYMENT:
+        if payee_categories and tx.memo in payee_categories:
+            return CATEGORY_INDEX[payee_categories[tx.memo]]
+        return CATEGORY_INDEX.get(tx.memo, CATEGORY_INDEX[OTHER_BILLS])
+    return None
+
+def _empty_rollup():
+    return array("q", bytes(16 * CATEGORY_COUNT))
+
+class SpendingRollups:
+    """Daily and monthly (count, cents) per account and category"""
+
+    def __init__(self, daily_retention=62, payee_categories=None):
+        self.daily_retention = daily_retention
+        self.payee_categories = payee_categories
+        # (account, year * 12 + month - 1) -> [count per category..., cents per category...]
+        self.monthly = {}
+        # (account, date ordinal) -> same layout
+        self.daily = {}
+        # date ordinal -> accounts with a daily rollup that day, for pruning
+        self.days = {}
+
+    def record(self, tx):
+        """Ledger listener filing a spending record under its category"""
+        category = category_of(tx, self.payee_categories)
+        if category is None:
+            return
+        date = datetime.date.fromtimestamp(tx.ts)
+        month = date.year * 12 + date.month - 1
+        day = date.toordinal()
+
+        rollup = self.monthly.get((tx.account, month))
+        if rollup is None:
+            rollup = self.monthly[(tx.account, month)] = _empty_rollup()
+        rollup[category] += 1
+        rollup[CATEGORY_COUNT + category] += tx.cents
+
+        rollup = self.daily.get((tx.account, day))
+        if rollup is None:
+            accounts = self.days.get(day)
+            if accounts is None:
+                accounts = self.days[day] = []
+                self._prune(day)
+            accounts.append(tx.account)
+            rollup = self.daily[(tx.account, day)] = _empty_rollup()
+        rollup[category] += 1
+        rollup[CATEGORY_COUNT + category] += tx.cents
+
+    def _prune(self, today):
+        for day in [d for d in self.days if d <= today - self.daily_retention]:
+            for account in self.days.pop(day):
+                self.daily.pop((account, day), None)
+
+    # Queries
+
+    def _combined(self, rollups, keys):
+        total = _empty_rollup()
+        for key in keys:
+            rollup = rollups.get(key)
+            if rollup is not None:
+                for i, value in enumerate(rollup):
+                    total[i] += value
+        return total
+
+    @staticmethod
+    def _as_dict(rollup):
+        return {name: (rollup[i], rollup[CATEGORY_COUNT + i])
+                for i, name in enumerate(CATEGORIES) if rollup[i]}
+
+    def month(self, accounts, year, month):
+        """{category: (count, cents)} spent from the accounts in a month"""
+        key = year * 12 + month - 1
+        return self._as_dict(self._combined(self.monthly, [(a, key) for a in accounts]))
+
+    def day(self, accounts, date):
+        """{category: (count, cents)} spent from the accounts on a date"""
+        day = date.toordinal()
+        return self._as_dict(self._combined(self.daily, [(a, day) for a in accounts]))
+
+    def top(self, accounts, year, month, n=3):
+        """The n categories with the most cents spent in a month, largest first"""
+        spent = self.month(accounts, year, month)
+        largest = heapq.nlargest(n, ((cents, name) for name, (_, cents) in spent.items()))
+        return [(name, cents) for cents, name in largest]
+
+    def month_over_month(self, accounts, year, month):
+        """{category: (cents this month, cents the month before, change)}"""
+        previous = divmod(year * 12 + month - 2, 12)
+        current = self.month(accounts, year, month)
+        before = self.month(accounts, previous[0], previous[1] + 1)
+        changes = {}
+        for name in CATEGORIES:
+            now, then = current.get(name, (0, 0))[1], before.get(name, (0, 0))[1]
+            if now or then:
+                changes[name] = (now, then, now - then)
+        return changes
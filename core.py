@@ -0,0 +1,931 @@
+"""
+Programmatic core of the Enhanced ATM Simulation.
+
+All ATM operations live here, free of ``input()``, ``print`` and sleeps, so
+they can be driven by the interactive menu, the batch runner or any other
+front end. Amounts are integer cents and every operation returns a
+``Result`` describing the outcome.
+
+- **Bank:** the account store, the ledger, limits/fees, hashed PINs (see
+  pins.py) and per-customer PIN-attempt and lockout state
+- **Session:** one logged-in customer at one terminal, holding the selected
+  account and, at a cash machine, the terminal's cassettes: cash withdrawals
+  are refused unless the loaded notes can pay them (see cassettes.py)
+
+Withdrawals, quick cash and bill payments all count towards the customer's
+withdrawal limit, tracked per calendar day or over a rolling 24 hours (see
+limits.py).
+
+Bills are paid to the payees registered in ``Bank.payees``; payments can
+also be scheduled, once or recurring, and are then made by the end-of-day
+run ``Bank.run_scheduled_payments`` (see payments.py). ``Bank.end_of_day``
+runs them together with interest, limit rollover, monthly fees and balance
+alerts in one sharded pipeline (see eod.py).
+
+Sessions may run on different threads. An operation checks balances while
+holding the locks of the accounts it touches (see locking.py), then applies
+every leg -- amount, fee and their ledger records -- under the ledger lock,
+so no other thread or statement sees half of it. The write-ahead log
+snapshots and commits only when that lock is released (see wal.py), so a
+snapshot never holds half an operation either. A Session itself belongs to
+one thread at a time.
+
+State-changing session operations accept an idempotency key (``key=``);
+a retry with the same key returns the original Result instead of executing
+again (see idempotency.py).
+
+Before money moves, the session screens the operation against the bank's
+fraud rules (see fraud.py), which may flag it, decline it (BLOCKED) or lock
+the customer out (LOCKED).
+
+Idle timeouts, lockout release and the reset of failed PIN attempts are
+deadlines on the bank's timer wheel (see timers.py), fired by ``Bank.tick()``.
+
+Operations are wrapped with ``metrics.instrument`` and record call counts,
+outcome codes and latency whenever ``metrics.registry`` is enabled.
+"""
+
+import datetime
+import functools
+import time
+from array import array
+
+from accounts import AccountStore, SAVINGS, CHECKING, NO_ACCOUNT
+from categories import BILL_TYPES, CATEGORY_INDEX, OTHER_BILLS, SpendingRollups
+from eod import run_end_of_day
+from fraud import FLAG, LOCK, FraudEngine
+from idempotency import IdempotencyCache
+from ledger import Ledger, TxType
+from limits import WithdrawalLimits
+from locking import AccountLocks
+from metrics import instrument
+from money import format_cents
+from payments import PayeeRegistry, ScheduleBook, run_due_payments
+from pins import DEFAULT_ITERATIONS, PinStore, valid_pin
+from timers import TimerWheel
+import interest
+import wal
+
+# Result codes
+OK = "OK"
+INVALID_AMOUNT = "INVALID_AMOUNT"
+INVALID_CHOICE = "INVALID_CHOICE"
+INSUFFICIENT_FUNDS = "INSUFFICIENT_FUNDS"
+LIMIT_EXCEEDED = "LIMIT_EXCEEDED"
+DEPOSIT_LIMIT = "DEPOSIT_LIMIT"
+UNKNOWN_CARD = "UNKNOWN_CARD"
+BAD_PIN = "BAD_PIN"
+LOCKED = "LOCKED"
+INVALID_PIN = "INVALID_PIN"
+PIN_MISMATCH = "PIN_MISMATCH"
+NOT_AUTHENTICATED = "NOT_AUTHENTICATED"
+NOTHING_TO_DO = "NOTHING_TO_DO"
+CANNOT_DISPENSE = "CANNOT_DISPENSE"
+BLOCKED = "BLOCKED"
+KEY_REUSED = "KEY_REUSED"
+
+QUICK_CASH_AMOUNTS = (2000, 4000, 6000, 8000, 10000)
+MAX_PAYMENT_INTERVAL = 366  # days between recurring payments
+
+class Result:
+    """Outcome of a core operation; amounts are in cents"""
+
+    __slots__ = ("code", "message", "amount", "fee", "balance", "data")
+
+    def __init__(self, code=OK, message="", amount=0, fee=0, balance=None, data=None):
+        self.code = code
+        self.message = message
+        self.amount = amount
+        self.fee = fee
+        self.balance = balance
+        self.data = data
+
+    @property
+    def ok(self):
+        return self.code == OK
+
+    def as_dict(self):
+        return {"code": self.code, "message": self.message, "amount": self.amount,
+                "fee": self.fee, "balance": self.balance}
+
+    def __repr__(self):
+        return f"Result({self.code}, {self.message!r})"
+
+def fail(code, message, **fields):
+    return Result(code, message, **fields)
+
+def _cacheable(result):
+    # Session-state answers: a retry after logging in again should execute
+    return result.code not in (NOT_AUTHENTICATED, LOCKED)
+
+def idempotent(method):
+    """Let a Session method take key=: repeating a key returns the first Result"""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, key=None, **kwargs):
+        if key is None or not self.authenticated:
+            return method(self, *args, **kwargs)
+        return self.bank.idempotency.run(
+            (self.customer, key), (name, self.account, args, tuple(sorted(kwargs.items()))),
+            lambda: method(self, *args, **kwargs),
+            lambda: fail(KEY_REUSED, "Request key already used for a different operation."),
+            _cacheable)
+    return wrapper
+
+class Bank:
+    """Accounts, history and the rules that apply to every session"""
+
+    def __init__(self, store=None, ledger=None, clock=time.time, rolling_limit=False,
+                 pin_iterations=DEFAULT_ITERATIONS):
+        self.store = store if store is not None else AccountStore()
+        self.ledger = ledger if ledger is not None else Ledger(clock=clock)
+        self.clock = clock
+
+        self.daily_withdrawal_limit = 50000  # per customer, see limits
+        self.deposit_limit = 1000000
+        self.transaction_fee = 150
+        self.fee_threshold = 20000  # withdrawals above this pay the fee
+        self.maintenance_fee = 500  # monthly, on checking accounts below minimum_balance
+        self.fee_month = -1  # year * 12 + month - 1 of the last month fees were charged
+        self.minimum_balance = 10000
+        self.low_balance = 10000  # balance alert thresholds
+        self.very_low_balance = 5000
+        self.max_pin_attempts = 3
+        self.lockout_seconds = 1800  # 30 minutes lockout
+        self.pin_attempt_window = 1800  # failed PIN attempts are forgotten after 30 minutes
+        self.session_timeout = 300  # 5 minutes of inactivity
+
+        # Salted PIN hashes with their auth cache and verification pool
+        self.pins = PinStore(pin_iterations)
+        # Per-customer authentication state, indexed by customer id
+        self.pin_attempts = array("b")
+        self.lockout_time = array("d")  # 0.0 when not locked
+        self.last_failure = array("d")  # time of the latest failed PIN attempt
+
+        # Withdrawal usage per customer; rolling_limit counts the last 24 hours
+        # instead of the calendar day
+        self.limits = WithdrawalLimits(self.store, rolling=rolling_limit)
+        self.ledger.subscribe(self.limits.record_transaction)
+        # Payees and scheduled bill payments, see payments.py
+        self.payees = PayeeRegistry()
+        self.schedules = ScheduleBook()
+
+        # Daily and monthly spending per account and category
+        self.spending = SpendingRollups(payee_categories=self.payees.category_by_name)
+        self.ledger.subscribe(self.spending.record)
+        # Velocity and fraud rules over the transaction feed
+        self.fraud = FraudEngine(self.store)
+        self.ledger.subscribe(self.fraud.record)
+
+        # Striped locks for balance checks, limits and authentication state
+        self.locks = AccountLocks()
+        self.customer_locks = AccountLocks()
+
+        # Deadlines for idle sessions, lockouts and failed PIN attempts
+        self.timers = TimerWheel(clock=clock)
+        # Results of recent keyed operations, so retries do not execute twice
+        self.idempotency = IdempotencyCache(clock=clock)
+
+        # Write-ahead log receiving every state change, see wal.py
+        self.journal = None
+        # Memory-mapped history file for statements and searches, see history.py
+        self.history = None
+
+    def add_customer(self, pin, savings=0, checking=0):
+        """Create a customer with a savings and a checking account"""
+        row = self.pins.make(pin)
+        with self.ledger.lock:
+            customer = self.store.add_customer()
+            self._journal(wal.ADD_CUSTOMER)
+            self._store_pin(customer, row)
+            for kind, balance in ((SAVINGS, savings), (CHECKING, checking)):
+                account = self.store.open_account(customer, kind, balance)
+                self._journal(wal.OPEN_ACCOUNT, customer, kind, balance,
+                              self.store.interest_day[account])
+            self._ensure_auth_rows()
+        return customer
+
+    def _ensure_auth_rows(self):
+        while len(self.pin_attempts) < self.store.customer_count:
+            self.pin_attempts.append(self.max_pin_attempts)
+            self.lockout_time.append(0.0)
+            self.last_failure.append(0.0)
+
+    def attach_history(self, history):
+        """Mirror every new ledger record into a HistoryFile
+
+        The ledger then keeps only its recent window in memory; older records
+        are read back from the file.
+        """
+        self.history = history
+        self.ledger.subscribe(history.record)
+        self.ledger.drop_archive()
+
+    def _journal(self, kind, *fields, tail=b""):
+        if self.journal is not None:
+            # The ledger lock also orders transaction records into the journal
+            with self.ledger.lock:
+                self.journal.append(kind, *fields, tail=tail)
+
+    def set_auth_state(self, customer, attempts, locked_at=0.0):
+        """Update PIN attempts and lockout time for a customer"""
+        self.pin_attempts[customer] = attempts
+        self.lockout_time[customer] = locked_at
+        self._journal(wal.AUTH, customer, attempts, locked_at)
+        if locked_at:
+            self.timers.schedule(locked_at + self.lockout_seconds,
+                                 self._release_lockout, customer, locked_at)
+
+    def record_failed_pin(self, customer, attempts):
+        """Count a failed PIN attempt; the count resets after pin_attempt_window"""
+        failed_at = self.clock()
+        self.last_failure[customer] = failed_at
+        self.set_auth_state(customer, attempts)
+        self.timers.schedule(failed_at + self.pin_attempt_window,
+                             self._reset_attempts, customer, failed_at)
+
+    def _release_lockout(self, customer, locked_at):
+        with self.customer_locks.hold(customer):
+            # A later lockout has its own timer
+            if self.lockout_time[customer] == locked_at:
+                self.set_auth_state(customer, self.max_pin_attempts)
+
+    def _reset_attempts(self, customer, failed_at):
+        with self.customer_locks.hold(customer):
+            if (self.last_failure[customer] == failed_at and not self.lockout_time[customer]
+                    and self.pin_attempts[customer] != self.max_pin_attempts):
+                self.set_auth_state(customer, self.max_pin_attempts)
+
+    def restore_timers(self):
+        """Re-arm lockout and PIN-attempt deadlines, e.g. after recovery"""
+        self._ensure_auth_rows()
+        now = self.clock()
+        for customer in range(self.store.customer_count):
+            locked_at = self.lockout_time[customer]
+            if locked_at:
+                self.timers.schedule(locked_at + self.lockout_seconds,
+                                     self._release_lockout, customer, locked_at)
+            elif self.pin_attempts[customer] != self.max_pin_attempts:
+                self.last_failure[customer] = now
+                self.timers.schedule(now + self.pin_attempt_window,
+                                     self._reset_attempts, customer, now)
+
+    def tick(self):
+        """Fire every expired deadline and commit an overdue journal group
+
+        Returns how many deadlines fired.
+        """
+        if self.journal is not None:
+            self.journal.commit_due()
+        return self.timers.advance(self.clock())
+
+    def set_pin(self, customer, pin):
+        """Hash and store a new PIN; the key derivation runs before any lock is taken"""
+        self.store.check_customer(customer)
+        row = self.pins.make(pin)
+        with self.ledger.lock:
+            self._store_pin(customer, row)
+
+    def _store_pin(self, customer, row):
+        """Store a PinStore.make row; the caller holds the ledger lock"""
+        self.pins.load(customer, *row)
+        self._journal(wal.PIN_HASH, customer, *row)
+
+    def replay_transaction(self, tx):
+        """Add a recovered record to the ledger and to the state derived from it"""
+        self.ledger.add(tx)
+        self.limits.record_transaction(tx)
+        self.spending.record(tx)
+        self.fraud.record(tx)
+
+    @instrument("log_transaction")
+    def log_transaction(self, transaction_type, account, cents, peer=NO_ACCOUNT, memo=None):
+        """Log a structured transaction; text is only formatted when displayed"""
+        return self.ledger.append(transaction_type, account, cents, peer, memo)
+
+    def lockout_remaining(self, customer):
+        """Seconds until the customer's lockout ends, 0 if not locked"""
+        self._ensure_auth_rows()
+        locked_at = self.lockout_time[customer]
+        if not locked_at:
+            return 0
+        remaining = self.lockout_seconds - (self.clock() - locked_at)
+        if remaining > 0:
+            return remaining
+        self.set_auth_state(customer, self.max_pin_attempts)
+        return 0
+
+    @instrument("accrue_interest")
+    def accrue_interest(self):
+        """Credit pending interest to every savings account"""
+        day = interest.today()
+        with self.ledger.lock:
+            credited, total = interest.accrue_all(self.store, self.ledger, day)
+            self._journal(wal.ACCRUAL_RUN, day)
+        return Result(OK, f"Credited interest to {credited} account(s)", amount=total,
+                      data=credited)
+
+    @instrument("end_of_day")
+    def end_of_day(self, day=None, workers=1, shards=None):
+        """Run the end-of-day pipeline (see eod.py); the Result carries the EODReport"""
+        report = run_end_of_day(self, day, workers, shards)
+        return Result(OK, f"End of day {datetime.date.fromordinal(report.day)} complete",
+                      data=report)
+
+    # Payees and scheduled payments
+
+    def add_payee(self, name, category=OTHER_BILLS):
+        """Register a payee for bill payments; returns its id"""
+        with self.ledger.lock:
+            payee = self.payees.find(name)
+            if payee is None:
+                payee = self.payees.add(name, category)
+                encoded = name.encode("utf-8")
+                self._journal(wal.PAYEE, CATEGORY_INDEX[category], len(encoded), tail=encoded)
+        return payee
+
+    def schedule_payment(self, account, payee, cents, first_day, interval=0):
+        """Add a payment instruction, due first on day first_day; returns its id"""
+        with self.ledger.lock:
+            schedule = self.schedules.add(account, payee, cents, first_day, interval)
+            self._journal(wal.SCHEDULE, account, payee, cents, first_day, interval)
+        return schedule
+
+    def cancel_schedule(self, schedule):
+        with self.ledger.lock:
+            next_day = self.schedules.next_day[schedule]
+            self.schedules.set_state(schedule, next_day, 0, False)
+            self._journal(wal.SCHEDULE_STATE, schedule, next_day, 0, False)
+
+    @instrument("run_scheduled_payments")
+    def run_scheduled_payments(self, day=None):
+        """End-of-day run: execute every payment instruction due by day (default today)"""
+        run = run_due_payments(self, day)
+        return Result(OK, f"Made {run.paid} scheduled payment(s)", amount=run.cents,
+                      fee=run.fees, data=run)
+
+    def open_session(self, cassettes=None):
+        """A new session; cassettes is the terminal's cash, None for a cashless channel"""
+        return Session(self, cassettes)
+
+class Session:
+    """A customer's session at one terminal"""
+
+    def __init__(self, bank, cassettes=None):
+        self.bank = bank
+        self.cassettes = cassettes  # cassettes.CashCassettes of this terminal
+        self.customer = None
+        self.account = NO_ACCOUNT
+        self.started_at = None
+        self.last_activity = None
+        self.idle_timer = None
+        self.expired = False  # set by the idle timer
+
+    @property
+    def authenticated(self):
+        return self.customer is not None
+
+    def timed_out(self):
+        """True once the session has been idle for longer than the timeout"""
+        if self.last_activity is None:
+            return False
+        return (self.expired
+                or self.bank.clock() - self.last_activity > self.bank.session_timeout)
+
+    def _idle_check(self):
+        """Idle timer: expire the session, or re-arm if there was activity since"""
+        if self.last_activity is None:
+            return
+        deadline = self.last_activity + self.bank.session_timeout
+        if deadline <= self.bank.clock():
+            self.expired = True
+        else:
+            self.idle_timer = self.bank.timers.schedule(deadline, self._idle_check)
+
+    def _note_mix(self, cents):
+        """(mix, error): the notes paying cents, or why this terminal cannot"""
+        cassettes = self.cassettes
+        if cassettes is None:
+            return None, None
+        mix = cassettes.solve(cents)
+        if mix is not None:
+            return mix, None
+        if cents % cassettes.unit:
+            return None, fail(CANNOT_DISPENSE, "This machine dispenses multiples of "
+                                               f"${format_cents(cassettes.unit)} only.")
+        return None, fail(CANNOT_DISPENSE, "This machine cannot dispense that amount right now.")
+
+    def balance_of(self, account=None):
+        return self.bank.store.balance[self.account if account is None else account]
+
+    def accounts(self):
+        return list(self.bank.store.accounts_of(self.customer))
+
+    # Authentication
+
+    @instrument("login")
+    def login(self, customer, pin, verified=None):
+        """Log in with a PIN
+
+        verified is the outcome of ``bank.pins.verify(customer, pin)`` when
+        the caller has already run it, e.g. on the verification pool; by
+        default the PIN is verified here. Either way the derivation runs
+        before the customer's lock is taken.
+        """
+        bank = self.bank
+        try:
+            bank.store.check_customer(customer)
+        except KeyError:
+            return fail(UNKNOWN_CARD, "Unknown card number.")
+
+        # A locked customer's PIN is not even hashed
+        if verified is None and not bank.lockout_remaining(customer):
+            verified = bank.pins.verify(customer, pin)
+
+        with bank.customer_locks.hold(customer):
+            remaining = bank.lockout_remaining(customer)
+            if remaining:
+                return fail(LOCKED, f"Account locked. Try again in {remaining / 60:.1f} minutes.",
+                            data=remaining)
+            if verified is None:
+                verified = bank.pins.verify(customer, pin)  # the lockout ran out meanwhile
+
+            if verified:
+                if bank.pin_attempts[customer] != bank.max_pin_attempts:
+                    bank.set_auth_state(customer, bank.max_pin_attempts)  # Reset on success
+                self.logout()
+                self.customer = customer
+                self.account = bank.store.first_account[customer]
+                self.started_at = self.last_activity = bank.clock()
+                self.idle_timer = bank.timers.schedule(self.started_at + bank.session_timeout,
+                                                       self._idle_check)
+            else:
+                attempts = bank.pin_attempts[customer] - 1
+                if attempts <= 0:
+                    bank.set_auth_state(customer, 0, bank.clock())
+                    bank.log_transaction(TxType.SECURITY, NO_ACCOUNT, 0,
+                                         memo="Account locked - multiple failed PIN attempts")
+                    return fail(LOCKED, "Account locked due to multiple failed attempts.", data=0)
+                bank.record_failed_pin(customer, attempts)
+                return fail(BAD_PIN, f"Incorrect PIN. You have {attempts} attempts left.",
+                            data=attempts)
+
+        if bank.pins.needs_rehash(customer):
+            bank.set_pin(customer, pin)  # bring an old hash up to the current work factor
+        return Result(OK, "Authentication successful!")
+
+    def logout(self):
+        if self.idle_timer is not None:
+            self.idle_timer.cancel()
+            self.idle_timer = None
+        self.customer = None
+        self.account = NO_ACCOUNT
+        self.started_at = self.last_activity = None
+        self.expired = False
+        return Result(OK, "Logged out.")
+
+    def _check_session(self):
+        if not self.authenticated:
+            return fail(NOT_AUTHENTICATED, "Please log in first.")
+        if self.timed_out():
+            self.logout()
+            return fail(NOT_AUTHENTICATED, "Session timed out.")
+        if self.bank.lockout_remaining(self.customer):
+            return fail(LOCKED, "Account is temporarily locked. Please try again later.")
+        self.last_activity = self.bank.clock()
+        return None
+
+    # Money movement
+
+    @instrument("deposit")
+    @idempotent
+    def deposit(self, cents):
+        error = self._check_session()
+        if error:
+            return error
+        if cents <= 0:
+            return fail(INVALID_AMOUNT, "Deposit amount must be positive.")
+        if cents > self.bank.deposit_limit:
+            limit = format_cents(self.bank.deposit_limit, grouping=True)
+            return fail(DEPOSIT_LIMIT, f"Daily deposit limit is ${limit}.")
+
+        bank = self.bank
+        error = self._screen(TxType.DEPOSIT, cents)
+        if error:
+            return error
+        with bank.locks.hold(self.account), bank.ledger.lock:
+            new_balance = bank.store.credit(self.account, cents)
+            bank.log_transaction(TxType.DEPOSIT, self.account, cents)
+        return Result(OK, "Deposit successful.", amount=cents, balance=new_balance)
+
+    def _check_limit(self, cents):
+        """LIMIT_EXCEEDED if cents would go over the withdrawal limit
+
+        Call with the customer lock held, so the check and the withdrawal it
+        allows cannot interleave with another session of the same customer.
+        """
+        bank = self.bank
+        remaining = bank.daily_withdrawal_limit - bank.limits.used(self.customer, bank.clock())
+        if cents > remaining:
+            remaining = max(remaining, 0)
+            return fail(LIMIT_EXCEEDED,
+                        f"Daily withdrawal limit exceeded. Remaining: ${format_cents(remaining)}",
+                        data=remaining)
+        return None
+
+    def _screen(self, tx_type, cents, payee=None):
+        """BLOCKED or LOCKED if a fraud rule stops this operation (see fraud.py)"""
+        bank = self.bank
+        now = bank.clock()
+        tripped = bank.fraud.screen(self.customer, tx_type, cents, payee, now)
+        if not tripped or tripped[0].action == FLAG:
+            return None
+        rule = tripped[0]
+        if rule.action == LOCK:
+            bank.set_auth_state(self.customer, 0, now)
+            bank.log_transaction(TxType.SECURITY, NO_ACCOUNT, 0,
+                                 memo=f"Account locked - {rule.name}")
+            return fail(LOCKED, "Account locked for security reasons.", data=rule.name)
+        bank.log_transaction(TxType.SECURITY, NO_ACCOUNT, 0, memo=f"Declined - {rule.name}")
+        return fail(BLOCKED, "Transaction declined for security reasons.", data=rule.name)
+
+    @instrument("withdraw")
+    @idempotent
+    def withdraw(self, cents):
+        error = self._check_session()
+        if error:
+            return error
+        bank = self.bank
+        if cents <= 0:
+            return fail(INVALID_AMOUNT, "Withdrawal amount must be positive.")
+
+        mix, error = self._note_mix(cents)
+        if error:
+            return error
+
+        fee = bank.transaction_fee if cents > bank.fee_threshold else 0
+        with bank.customer_locks.hold(self.customer), bank.locks.hold(self.account):
+            error = self._check_limit(cents)
+            if error:
+                return error
+            # Check sufficient funds (including potential fee)
+            if cents + fee > self.balance_of():
+                return fail(INSUFFICIENT_FUNDS, "Insufficient funds for this withdrawal.")
+            error = self._screen(TxType.WITHDRAWAL, cents)
+            if error:
+                return error
+
+            with bank.ledger.lock:
+                new_balance = bank.store.debit(self.account, cents + fee)
+                bank.log_transaction(TxType.WITHDRAWAL, self.account, cents)
+                if fee:
+                    bank.log_transaction(TxType.FEE, self.account, fee, memo="Withdrawal fee")
+        return Result(OK, "Withdrawal successful.", amount=cents, fee=fee, balance=new_balance,
+                      data=self._dispense(mix))
+
+    @instrument("quick_cash")
+    @idempotent
+    def quick_cash(self, cents):
+        """Withdraw one of the QUICK_CASH_AMOUNTS presets"""
+        error = self._check_session()
+        if error:
+            return error
+        if cents not in QUICK_CASH_AMOUNTS:
+            return fail(INVALID_CHOICE, "Invalid selection.")
+        mix, error = self._note_mix(cents)
+        if error:
+            return error
+        bank = self.bank
+        with bank.customer_locks.hold(self.customer), bank.locks.hold(self.account):
+            error = self._check_limit(cents)
+            if error:
+                return error
+            if cents > self.balance_of():
+                return fail(INSUFFICIENT_FUNDS, "Insufficient funds.")
+            error = self._screen(TxType.QUICK_CASH, cents)
+            if error:
+                return error
+
+            with bank.ledger.lock:
+                new_balance = bank.store.debit(self.account, cents)
+                bank.log_transaction(TxType.QUICK_CASH, self.account, cents)
+        return Result(OK, "Quick cash withdrawn successfully!", amount=cents, balance=new_balance,
+                      data=self._dispense(mix))
+
+    def _dispense(self, mix):
+        """Take a mix from the cassettes; returns {denomination: notes}, None if cashless"""
+        if mix is None:
+            return None
+        self.cassettes.dispense(mix)
+        return self.cassettes.notes(mix)
+
+    @instrument("transfer")
+    @idempotent
+    def transfer(self, target, cents):
+        """Transfer from the selected account to another of the customer's accounts"""
+        error = self._check_session()
+        if error:
+            return error
+        store = self.bank.store
+        if target == self.account or target not in self.accounts():
+            return fail(INVALID_CHOICE, "Invalid target account.")
+        if cents <= 0:
+            return fail(INVALID_AMOUNT, "Transfer amount must be positive.")
+        bank = self.bank
+        # Both accounts are locked in stripe order, so opposite transfers cannot deadlock
+        with bank.locks.hold(self.account, target):
+            if cents > self.balance_of():
+                return fail(INSUFFICIENT_FUNDS,
+                            f"Insufficient funds in {store.kind_name(self.account)} account.")
+            error = self._screen(TxType.TRANSFER, cents)
+            if error:
+                return error
+
+            with bank.ledger.lock:
+                new_balance = store.debit(self.account, cents)
+                store.credit(target, cents)
+                bank.log_transaction(TxType.TRANSFER, self.account, cents, peer=target)
+        return Result(OK, "Transfer successful.", amount=cents, balance=new_balance, data=target)
+
+    @instrument("pay_bill")
+    @idempotent
+    def pay_bill(self, bill_type, cents):
+        error = self._check_session()
+        if error:
+            return error
+        bank = self.bank
+        if bank.payees.find(bill_type) is None:
+            return fail(INVALID_CHOICE, "Invalid selection.")
+        if cents <= 0:
+            return fail(INVALID_AMOUNT, "Bill amount must be positive.")
+
+        fee = bank.transaction_fee
+        with bank.customer_locks.hold(self.customer), bank.locks.hold(self.account):
+            error = self._check_limit(cents)
+            if error:
+                return error
+            if cents + fee > self.balance_of():
+                return fail(INSUFFICIENT_FUNDS, "Insufficient funds for bill payment.")
+            error = self._screen(TxType.BILL_PAYMENT, cents, bill_type)
+            if error:
+                return error
+
+            with bank.ledger.lock:
+                new_balance = bank.store.debit(self.account, cents + fee)
+                bank.log_transaction(TxType.BILL_PAYMENT, self.account, cents, memo=bill_type)
+                bank.log_transaction(TxType.FEE, self.account, fee, memo="Bill payment fee")
+        return Result(OK, f"{bill_type} bill paid successfully!", amount=cents, fee=fee,
+                      balance=new_balance)
+
+    @instrument("schedule_payment")
+    @idempotent
+    def schedule_payment(self, payee, cents, first_day, interval=0):
+        """Pay payee from the current account on first_day, then every interval days"""
+        error = self._check_session()
+        if error:
+            return error
+        bank = self.bank
+        if not 0 <= payee < len(bank.payees):
+            return fail(INVALID_CHOICE, "Invalid selection.")
+        if cents <= 0:
+            return fail(INVALID_AMOUNT, "Bill amount must be positive.")
+        if first_day < interest.today():
+            return fail(INVALID_CHOICE, "The first payment cannot be in the past.")
+        if not 0 <= interval <= MAX_PAYMENT_INTERVAL:
+            return fail(INVALID_CHOICE, f"Repeat every 0 to {MAX_PAYMENT_INTERVAL} days.")
+
+        schedule = bank.schedule_payment(self.account, payee, cents, first_day, interval)
+        return Result(OK, f"Payment to {bank.payees.names[payee]} scheduled.", amount=cents,
+                      data=schedule)
+
+    def scheduled_payments(self):
+        """The customer's active payment instructions, soonest first"""
+        error = self._check_session()
+        if error:
+            return error
+        schedules, payees = self.bank.schedules, self.bank.payees
+        data = [{"id": s,
+                 "account": schedules.account[s],
+                 "payee": payees.names[schedules.payee[s]],
+                 "amount": schedules.cents[s],
+                 "next_due": datetime.date.fromordinal(schedules.next_day[s]),
+                 "interval": schedules.interval[s]}
+                for s in schedules.of_accounts(self.accounts())]
+        data.sort(key=lambda p: (p["next_due"], p["id"]))
+        return Result(OK, data=data)
+
+    @instrument("cancel_payment")
+    @idempotent
+    def cancel_payment(self, schedule):
+        error = self._check_session()
+        if error:
+            return error
+        schedules = self.bank.schedules
+        if (not 0 <= schedule < len(schedules) or not schedules.active[schedule]
+                or schedules.account[schedule] not in self.accounts()):
+            return fail(INVALID_CHOICE, "Invalid selection.")
+        self.bank.cancel_schedule(schedule)
+        return Result(OK, "Scheduled payment cancelled.")
+
+    # Account management
+
+    @instrument("switch_account")
+    def switch_account(self, account):
+        error = self._check_session()
+        if error:
+            return error
+        if account not in self.accounts():
+            return fail(INVALID_CHOICE, "Invalid selection.")
+        self.account = account
+        return Result(OK, "Account switched.", balance=self.balance_of())
+
+    def verify_pin(self, pin):
+        """Check the customer's PIN without changing any state"""
+        error = self._check_session()
+        if error:
+            return error
+        if not self.bank.pins.verify(self.customer, pin):
+            return fail(BAD_PIN, "Current PIN is incorrect.")
+        return Result(OK)
+
+    @instrument("change_pin")
+    @idempotent
+    def change_pin(self, current_pin, new_pin, confirm_pin):
+        error = self._check_session()
+        if error:
+            return error
+        result = self.verify_pin(current_pin)
+        if not result.ok:
+            return result
+        if not valid_pin(new_pin):
+            return fail(INVALID_PIN, "PIN must be exactly 4 digits.")
+        if new_pin != confirm_pin:
+            return fail(PIN_MISMATCH, "PINs don't match.")
+
+        bank = self.bank
+        row = bank.pins.make(new_pin)
+        with bank.customer_locks.hold(self.customer), bank.ledger.lock:
+            bank._store_pin(self.customer, row)
+            bank.log_transaction(TxType.SECURITY, self.account, 0, memo="PIN changed")
+        return Result(OK, "PIN changed successfully!")
+
+    @instrument("calculate_interest")
+    def calculate_interest(self):
+        """Credit pending interest to the customer's savings accounts"""
+        error = self._check_session()
+        if error:
+            return error
+        store = self.bank.store
+        savings = [a for a in self.accounts() if store.kind[a] == SAVINGS]
+        pending = {a: interest.days_pending(store, a) for a in savings}
+        if not any(pending.values()):
+            return fail(NOTHING_TO_DO, "Interest already calculated today.")
+
+        credited = []
+        bank = self.bank
+        with bank.locks.hold(*savings), bank.ledger.lock:
+            for account in savings:
+                cents = interest.catch_up_account(store, bank.ledger, account)
+                if pending[account]:
+                    bank._journal(wal.INTEREST_DAY, account, store.interest_day[account])
+                if cents:
+                    credited.append((account, pending[account], cents))
+        return Result(OK, "Interest credited.", amount=sum(c for _, _, c in credited),
+                      data=credited)
+
+    # Statements
+
+    @instrument("balances")
+    def balances(self):
+        """Result whose data lists (account, balance) for every account"""
+        error = self._check_session()
+        if error:
+            return error
+        store = self.bank.store
+        data = [(a, store.balance[a]) for a in self.accounts()]
+        return Result(OK, balance=self.balance_of(), data=data)
+
+    @instrument("mini_statement")
+    def mini_statement(self, n=5):
+        error = self._check_session()
+        if error:
+            return error
+        bank = self.bank
+        accounts = self.accounts()
+        with bank.ledger.lock:
+            found = bank.ledger.recent_for(accounts, n)
+            if len(found) < n and bank.history is not None:
+                # Older records are no longer held in memory
+                found = bank.history.latest(accounts, n)
+        return Result(OK, data=found)
+
+    @instrument("transaction_history")
+    def transaction_history(self, start=0, page_size=20):
+        """One page of the customer's own transactions, oldest first
+
+        data["transactions"] holds the page and data["next"] the start of the
+        following page, None after the last one. Pages come from the history
+        file when one is attached, otherwise from the records the ledger holds.
+        """
+        error = self._check_session()
+        if error:
+            return error
+        accounts = self.accounts()
+        bank = self.bank
+        with bank.ledger.lock:
+            source = bank.history if bank.history is not None else bank.ledger
+            found, following = source.page(accounts, start, page_size)
+        return Result(OK, data={"transactions": found, "next": following})
+
+    @instrument("search_transactions")
+    def search_transactions(self, start_ts=None, end_ts=None, types=None,
+                            min_cents=None, max_cents=None, limit=None):
+        """Result whose data lists the customer's transactions matching every filter
+
+        start_ts/end_ts bound a half-open epoch range, types is a collection
+        of TxType, min_cents/max_cents are inclusive. Oldest first. With a
+        history file attached the search uses its time and type indexes
+        (history.HistoryFile.search); otherwise it scans the ledger.
+        """
+        error = self._check_session()
+        if error:
+            return error
+        if min_cents is not None and max_cents is not None and min_cents > max_cents:
+            return fail(INVALID_AMOUNT, "Minimum amount is above the maximum.")
+        if start_ts is not None and end_ts is not None and start_ts > end_ts:
+            return fail(INVALID_CHOICE, "Start date is after the end date.")
+        accounts = self.accounts()
+        bank = self.bank
+        with bank.ledger.lock:
+            if bank.history is not None:
+                found = bank.history.search(accounts, start_ts, end_ts, types,
+                                            min_cents, max_cents, limit)
+                return Result(OK, data=found)
+            owned = set(accounts)
+            types = None if types is None else set(types)
+            found = []
+            for tx in bank.ledger:
+                if ((tx.account in owned or tx.peer in owned)
+                        and (types is None or tx.type in types)
+                        and (min_cents is None or tx.cents >= min_cents)
+                        and (max_cents is None or tx.cents <= max_cents)
+                        and (start_ts is None or tx.ts >= start_ts)
+                        and (end_ts is None or tx.ts < end_ts)):
+                    found.append(tx)
+                    if limit is not None and len(found) >= limit:
+                        break
+        return Result(OK, data=found)
+
+    @instrument("monthly_statement")
+    def monthly_statement(self, year=None, month=None):
+        """Balances plus per-type (count, cents) over the customer's accounts
+
+        With a history file attached the figures cover only the given month
+        (default: the current one) and data["months"] holds one
+        history.MonthlySummary per account; otherwise they cover all history.
+        data["categories"] maps each spending category to (cents this month,
+        cents the month before, change) and data["top_categories"] lists the
+        three largest as (category, cents).
+        """
+        error = self._check_session()
+        if error:
+            return error
+        accounts = self.accounts()
+        bank = self.bank
+        store = bank.store
+        data = {"balances": [(a, store.balance[a]) for a in accounts], "months": None}
+
+        if year is None or month is None:
+            today = datetime.date.fromtimestamp(bank.clock())
+            year, month = today.year, today.month
+        with bank.ledger.lock:
+            data["categories"] = bank.spending.month_over_month(accounts, year, month)
+            data["top_categories"] = bank.spending.top(accounts, year, month, 3)
+
+        history = bank.history
+        if history is None:
+            with bank.ledger.lock:
+                data["summary"] = bank.ledger.summary(accounts)
+            return Result(OK, balance=store.total_balance(self.customer), data=data)
+
+        with bank.ledger.lock:
+            months = [history.monthly_summary(a, year, month) for a in accounts]
+        data["months"] = months
+        data["period"] = (year, month)
+        data["summary"] = {t: (sum(m.count[t] for m in months), sum(m.total[t] for m in months))
+                           for t in TxType}
+        return Result(OK, balance=store.total_balance(self.customer), data=data)
+
+    @instrument("daily_limits")
+    def daily_limits(self):
+        error = self._check_session()
+        if error:
+            return error
+        bank = self.bank
+        limit = bank.daily_withdrawal_limit
+        used = bank.limits.used(self.customer, bank.clock())
+        return Result(OK, amount=used,
+                      data={"limit": limit, "used": used, "remaining": max(limit - used, 0),
+                            "window": bank.limits.window,
+                            "deposit_limit": bank.deposit_limit})
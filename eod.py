@@ -0,0 +1,182 @@
+"""
+End-of-day pipeline for the Enhanced ATM Simulation.
+
+One explicit run brings the whole bank to the end of a day:
+
+1. **Scheduled payments** due by the day (payments.py), made first so the
+   stages below see the balances they leave
+2. **Interest** for every savings account behind the day (interest.py)
+3. **Daily-limit rollover:** calendar-day withdrawal usage from earlier days
+   is cleared (limits.py)
+4. **Fees:** on the last day of a month, checking accounts below
+   ``Bank.minimum_balance`` pay ``Bank.maintenance_fee``, once per month:
+   ``Bank.fee_month`` records (and the write-ahead log journals) the last
+   month charged, so running the day again charges nothing
+5. **Low-balance alerts:** accounts under the thresholds the balance screen
+   warns about (``Bank.low_balance`` and ``Bank.very_low_balance``)
+
+Stages 2-5 are sharded. The account space and the customer space are each
+split into contiguous ranges, and each range's columns are copied to a
+worker in a process pool. The worker returns what to credit, charge, reset
+and alert on, without changing anything. The parent then applies the
+results in account order and merges them into one ``EODReport``. The run
+holds every account lock and the ledger lock from start to finish, so
+sessions wait for it and the report describes a single consistent state.
+
+Benchmark: python -m tools.eod_bench
+"""
+
+import datetime
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from accounts import CHECKING, NO_ACCOUNT
+from ledger import TxType
+from limits import expired_usage
+from money import np
+from payments import make_due_payments
+import interest
+import wal
+
+class EODReport:
+    """Merged outcome of one end-of-day run"""
+
+    __slots__ = ("day", "workers", "shards", "accounts", "payments",
+                 "interest_accounts", "interest_cents", "limits_reset", "limits_reset_cents",
+                 "fee_accounts", "fee_cents", "low_balance", "very_low_balance",
+                 "compute_seconds", "seconds")
+
+    def __init__(self, day, workers, shards, accounts):
+        self.day = day
+        self.workers = workers
+        self.shards = shards
+        self.accounts = accounts
+        self.payments = None  # payments.PaymentRun
+        self.interest_accounts = self.interest_cents = 0
+        self.limits_reset = self.limits_reset_cents = 0
+        self.fee_accounts = self.fee_cents = 0
+        self.low_balance = []  # accounts below Bank.low_balance but not very_low_balance
+        self.very_low_balance = []
+        self.compute_seconds = 0.0  # time spent waiting for the shards
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        """Accounts processed per second"""
+        return self.accounts / self.seconds if self.seconds else 0.0
+
+def run_shard(first, kind, balance, interest_day, first_customer, limit_day, limit_used,
+              day, fee, minimum_balance, low, very_low):
+    """Compute stages 2-5 for one range of accounts and customers
+
+    Columns arrive as bytes. Offsets in the returned tuple are absolute
+    account and customer ids. Runs in a worker process.
+    """
+    kind, balance = array("b", kind), array("q", balance)
+    interest_day = array("i", interest_day)
+
+    offsets, amounts, days = interest.pending_interest(kind, balance, interest_day, day)
+    for offset, cents in zip(offsets, amounts):
+        balance[offset] += cents
+
+    reset, reset_cents = expired_usage(array("i", limit_day), array("q", limit_used), day)
+
+    fees = []
+    if fee:
+        for offset in _between(balance, 1, minimum_balance, kind, CHECKING):
+            charge = min(fee, balance[offset])
+            balance[offset] -= charge
+            fees.append((first + offset, charge))
+
+    very_low_offsets = _between(balance, None, very_low)
+    low_offsets = _between(balance, very_low, low)
+
+    return ([first + o for o in offsets], amounts, days,
+            [first_customer + c for c in reset], reset_cents, fees,
+            [first + o for o in low_offsets], [first + o for o in very_low_offsets])
+
+def _between(balance, low, high, kind=None, only_kind=None):
+    """Offsets with low <= balance < high (low None: no lower bound), optionally of one kind"""
+    if np is None:
+        return [o for o, cents in enumerate(balance)
+                if (low is None or cents >= low) and cents < high
+                and (kind is None or kind[o] == only_kind)]
+    view = np.frombuffer(balance, dtype=np.int64)
+    kinds = np.frombuffer(kind, dtype=np.int8) if kind is not None else None
+    try:
+        mask = view < high
+        if low is not None:
+            mask &= view >= low
+        if kinds is not None:
+            mask &= kinds == only_kind
+        return np.flatnonzero(mask).tolist()
+    finally:
+        del view, kinds
+
+def _ranges(size, shards):
+    step = -(-size // shards) if size else 0
+    return [(lo, min(lo + step, size)) for lo in range(0, size, step)] if step else []
+
+def run_end_of_day(bank, day=None, workers=1, shards=None):
+    """Run the pipeline for day (default today); workers > 1 uses a process pool"""
+    day = interest.today() if day is None else day
+    shards = shards or (workers * 4 if workers > 1 else 1)
+    date = datetime.date.fromordinal(day)
+    month = date.year * 12 + date.month - 1
+    month_end = datetime.date.fromordinal(day + 1).day == 1
+    store, limits, ledger = bank.store, bank.limits, bank.ledger
+
+    start = time.perf_counter()
+    with bank.locks.hold_all(), ledger.lock:
+        fee = bank.maintenance_fee if month_end and month > bank.fee_month else 0
+        report = EODReport(day, workers, shards, len(store))
+        report.payments = make_due_payments(bank, day)
+
+        # Limit rows exist only for customers who have withdrawn; a rolling
+        # window has nothing to roll over
+        limit_rows = 0 if limits.rolling else len(limits.day)
+        account_ranges = _ranges(len(store), shards)
+        customer_ranges = _ranges(limit_rows, len(account_ranges) or 1)
+        missing = len(account_ranges) - len(customer_ranges)
+        customer_ranges += [(limit_rows, limit_rows)] * missing
+        tasks = [(lo, store.kind[lo:hi].tobytes(), store.balance[lo:hi].tobytes(),
+                  store.interest_day[lo:hi].tobytes(),
+                  c_lo, limits.day[c_lo:c_hi].tobytes(), limits.day_used[c_lo:c_hi].tobytes(),
+                  day, fee, bank.minimum_balance, bank.low_balance, bank.very_low_balance)
+                 for (lo, hi), (c_lo, c_hi) in zip(account_ranges, customer_ranges)]
+
+        computed = time.perf_counter()
+        if workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = list(pool.map(run_shard, *zip(*tasks)))
+        else:
+            results = [run_shard(*task) for task in tasks]
+        report.compute_seconds = time.perf_counter() - computed
+
+        for (accounts, amounts, days, reset, reset_cents, fees, low_accounts,
+             very_low_accounts) in results:
+            count, cents = interest.apply_interest(store, ledger, day, accounts, amounts, days)
+            report.interest_accounts += count
+            report.interest_cents += cents
+
+            limits.roll_over(reset, day)
+            report.limits_reset += len(reset)
+            report.limits_reset_cents += reset_cents
+
+            for account, charge in fees:
+                store.debit(account, charge)
+            ledger.extend([(TxType.FEE, account, charge, NO_ACCOUNT, "Monthly maintenance fee")
+                           for account, charge in fees])
+            report.fee_accounts += len(fees)
+            report.fee_cents += sum(charge for _, charge in fees)
+
+            report.low_balance.extend(low_accounts)
+            report.very_low_balance.extend(very_low_accounts)
+        if fee:
+            bank.fee_month = month
+            bank._journal(wal.FEE_MONTH, month)
+        bank._journal(wal.ACCRUAL_RUN, day)
+
+    report.seconds = time.perf_counter() - start
+    return report
@@ -0,0 +1,280 @@
+"""
+Streaming history export for the Enhanced ATM Simulation.
+
+Exports read the memory-mapped history file (history.py) and write CSV or
+JSON Lines, optionally gzip-compressed. They run in constant memory, however
+much history there is:
+
+- ``history_rows`` is a generator of decoded records. With an account filter
+  it walks only the per-account month indexes in the date range, merging
+  them in record order. Without one it scans the records of the date range,
+  found by bisecting the history's time index, in fixed-size chunks.
+- ``csv_chunks`` and ``jsonl_chunks`` turn rows into text, yielded in chunks
+  of roughly ``CHUNK_CHARS`` characters.
+- ``export_history`` writes the chunks to a stream and returns an
+  ``ExportStats`` with the throughput in records/sec.
+
+Amounts are exported as exact dollar strings (money.format_cents), never
+floats.
+
+Usage: python export.py [--dir DIR] [--format csv|jsonl] [--gzip]
+                        [--account N ...] [--from DATE] [--to DATE] [--output FILE]
+       python export.py --benchmark [--records N]
+"""
+
+import argparse
+import csv
+import datetime
+import functools
+import gzip
+import heapq
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+from accounts import AccountStore, NO_ACCOUNT
+from history import HistoryFile, HISTORY_NAME, RECORD, month_key
+from ledger import TxType
+from money import format_cents
+
+FIELDS = ("record", "time", "type", "account", "peer", "amount",
+          "balance_after", "peer_balance_after", "memo")
+FORMATS = ("csv", "jsonl")
+CHUNK_CHARS = 1 << 16
+GZIP_LEVEL = 6  # gzip's own default; 9 costs twice the time for a few percent
+SCAN_RECORDS = 4096  # records decoded per slice of the mapped file
+
+class ExportStats:
+    """Records and characters written by one export, and how long it took"""
+
+    __slots__ = ("records", "chars", "seconds")
+
+    def __init__(self):
+        self.records = 0
+        self.chars = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        """Records exported per second"""
+        return self.records / self.seconds if self.seconds else 0.0
+
+def _bounds(start, end):
+    """Epoch bounds [low, high) of an inclusive local date range; None is open"""
+    low = time.mktime(start.timetuple()) if start else float("-inf")
+    high = time.mktime((end + datetime.timedelta(days=1)).timetuple()) if end else float("inf")
+    return low, high
+
+def _record_numbers(history, accounts, low, high):
+    """Record numbers of the accounts' months in [low, high), ascending, without duplicates"""
+    first = month_key(low) if low != float("-inf") else None
+    last = month_key(high - 1) if high != float("inf") else None
+    streams = []
+    for account in accounts:
+        for key in history.months(account):
+            if (first is None or key >= first) and (last is None or key <= last):
+                streams.append(history.index[(account, key)])
+    previous = -1
+    for number in heapq.merge(*streams):
+        if number != previous:  # a transfer between two exported accounts
+            yield number
+            previous = number
+
+def _decode(number, fields):
+    account, peer, cents, after, peer_after, ts, tx_type, memo = fields
+    return (number, ts, TxType(tx_type), account, peer, cents, after, peer_after,
+            memo.rstrip(b"\0").decode("utf-8", "ignore"))
+
+def history_rows(history, accounts=None, start=None, end=None):
+    """Yield (record, ts, type, account, peer, cents, after, peer_after, memo) tuples
+
+    accounts limits the export to records touching those accounts; start and
+    end are inclusive dates.
+    """
+    history.flush()
+    view = history._view()
+    if view is None:
+        return
+    low, high = _bounds(start, end)
+
+    if accounts is not None:
+        for number in _record_numbers(history, accounts, low, high):
+            fields = RECORD.unpack_from(view, number * RECORD.size)
+            if low <= fields[5] < high:
+                yield _decode(number, fields)
+        return
+
+    begin, count = history.time_range(low, high)
+    with memoryview(view) as mapped:
+        for first in range(begin, count, SCAN_RECORDS):
+            last = min(first + SCAN_RECORDS, count)
+            chunk = mapped[first * RECORD.size:last * RECORD.size]
+            for number, fields in enumerate(RECORD.iter_unpack(chunk), first):
+                if low <= fields[5] < high:
+                    yield _decode(number, fields)
+            chunk.release()
+
+def _row_values(row):
+    """Export values of a row in FIELDS order; None where there is no account"""
+    number, ts, tx_type, account, peer, cents, after, peer_after, memo = row
+    has_account, has_peer = account != NO_ACCOUNT, peer != NO_ACCOUNT
+    return (number,
+            datetime.datetime.fromtimestamp(ts).isoformat(timespec="seconds"),
+            tx_type.name,
+            account if has_account else None,
+            peer if has_peer else None,
+            format_cents(cents),
+            format_cents(after) if has_account else None,
+            format_cents(peer_after) if has_peer else None,
+            memo)
+
+def csv_chunks(rows):
+    """CSV text for rows, header first, in chunks of about CHUNK_CHARS"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(FIELDS)
+    for row in rows:
+        writer.writerow(_row_values(row))
+        if buffer.tell() >= CHUNK_CHARS:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@functools.lru_cache(maxsize=1024)
+def _json_string(text):
+    return json.dumps(text, ensure_ascii=False)
+
+def _json_value(value):
+    return "null" if value is None else f'"{value}"'
+
+def jsonl_chunks(rows):
+    """One JSON object per row, in chunks of about CHUNK_CHARS"""
+    lines, size = [], 0
+    for row in rows:
+        # Only the memo can need escaping; the other values are numbers,
+        # ISO times, type names and dollar strings
+        number, stamp, type_name, account, peer, amount, after, peer_after, memo = _row_values(row)
+        line = (f'{{"record": {number}, "time": "{stamp}", "type": "{type_name}", '
+                f'"account": {"null" if account is None else account}, '
+                f'"peer": {"null" if peer is None else peer}, "amount": "{amount}", '
+                f'"balance_after": {_json_value(after)}, '
+                f'"peer_balance_after": {_json_value(peer_after)}, '
+                f'"memo": {_json_string(memo)}}}\n')
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_CHARS:
+            yield "".join(lines)
+            lines, size = [], 0
+    yield "".join(lines)
+
+CHUNKERS = {"csv": csv_chunks, "jsonl": jsonl_chunks}
+
+def open_output(path, compress=False):
+    """Text stream for an export file; '-' is stdout"""
+    if path == "-":
+        if compress:
+            return gzip.open(sys.stdout.buffer, "wt", GZIP_LEVEL, encoding="utf-8", newline="")
+        return sys.stdout
+    if compress:
+        return gzip.open(path, "wt", GZIP_LEVEL, encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+def export_history(history, out, fmt="csv", accounts=None, start=None, end=None):
+    """Stream matching history records to the text stream out; returns ExportStats"""
+    stats = ExportStats()
+    began = time.perf_counter()
+
+    def counted(rows):
+        for row in rows:
+            stats.records += 1
+            yield row
+
+    for chunk in CHUNKERS[fmt](counted(history_rows(history, accounts, start, end))):
+        out.write(chunk)
+        stats.chars += len(chunk)
+    stats.seconds = time.perf_counter() - began
+    return stats
+
+def _benchmark(records):
+    """Export a synthetic history of the given size in every format"""
+    import random
+
+    rng = random.Random(7)
+    store = AccountStore()
+    for customer in range(100):
+        store.add_customer()
+        store.open_account(customer, 0, 0)
+    types = [t for t in TxType if t != TxType.SECURITY]
+    with tempfile.TemporaryDirectory() as directory:
+        history = HistoryFile(os.path.join(directory, HISTORY_NAME), store)
+        ts = time.time() - records
+        for _ in range(records):
+            history.file.write(RECORD.pack(rng.randrange(100), NO_ACCOUNT, rng.randrange(1, 10 ** 5),
+                                           rng.randrange(10 ** 7), 0, ts,
+                                           rng.choice(types), b"bench"))
+            ts += 1
+        history._rebuild_index()
+
+        for fmt in FORMATS:
+            for compress in (False, True):
+                path = os.path.join(directory, f"export.{fmt}" + (".gz" if compress else ""))
+                with open_output(path, compress) as out:
+                    stats = export_history(history, out, fmt)
+                label = fmt + (" + gzip" if compress else "")
+                print(f"{label:<13}{stats.records:>10,} records in {stats.seconds:.3f}s "
+                      f"({stats.rate:,.0f} records/sec, {os.path.getsize(path):,} bytes)")
+
+        with open_output(os.devnull) as out:
+            stats = export_history(history, out, "csv", accounts=[7])
+        print(f"{'csv, 1 acct':<13}{stats.records:>10,} records in {stats.seconds:.3f}s "
+              f"({stats.rate:,.0f} records/sec)")
+        history.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export transaction history")
+    parser.add_argument("--dir", default=os.environ.get("ATM_DATA_DIR", "atm_data"),
+                        help="data directory holding the history file")
+    parser.add_argument("--format", choices=FORMATS, default="csv")
+    parser.add_argument("--gzip", action="store_true", help="gzip-compress the output")
+    parser.add_argument("--account", type=int, action="append",
+                        help="only records touching this account (repeatable)")
+    parser.add_argument("--from", dest="start", type=datetime.date.fromisoformat,
+                        help="first date, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end", type=datetime.date.fromisoformat,
+                        help="last date, YYYY-MM-DD")
+    parser.add_argument("--output", default="-", help="output file (default stdout)")
+    parser.add_argument("--benchmark", action="store_true")
+    parser.add_argument("--records", type=int, default=1000000)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        _benchmark(args.records)
+        return 0
+
+    path = os.path.join(args.dir, HISTORY_NAME)
+    if not os.path.exists(path):
+        print(f"No history file at {path}", file=sys.stderr)
+        return 1
+    # Read-only: the running ATM may be appending to the same file
+    history = HistoryFile(path, AccountStore(), read_only=True)
+    try:
+        out = open_output(args.output, args.gzip)
+        try:
+            stats = export_history(history, out, args.format, args.account, args.start, args.end)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+            else:
+                out.flush()
+    finally:
+        history.close()
+    print(f"Exported {stats.records:,} records in {stats.seconds:.3f}s "
+          f"({stats.rate:,.0f} records/sec)", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
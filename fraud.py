@@ -0,0 +1,233 @@
+"""
+Streaming fraud and velocity rules for the Enhanced ATM Simulation.
+
+``FraudEngine`` is a ledger listener: every logged transaction is added to
+per-customer sliding windows, one per rule that watches its type. Before a
+withdrawal, quick cash, bill payment, transfer or deposit is applied, the
+session asks the engine to ``screen`` it. Each rule then checks what its
+window would hold with the new event added:
+
+- **count:** events of the watched types in the window
+- **sum:** cents of those events
+- **distinct:** distinct payees (bill payment memos)
+- **sequence:** an event of one type soon after another, e.g. a deposit
+  followed within minutes by a transfer or cash withdrawal
+
+A rule's action is ``flag`` (alert only), ``block`` (decline the operation)
+or ``lock`` (decline it and lock the customer out, as three bad PINs do).
+Declined attempts are added to the windows too, so repeated attempts
+escalate from block to lock.
+
+Each window is a deque of (timestamp, cents, payee) with a running total
+and payee counts. Events leave the window from the left as time passes,
+so every event is added and evicted once: O(1) amortized per event per
+rule.
+
+The windows survive a restart: write-ahead log snapshots hold ``state()``,
+and replaying the log tail adds the transactions logged since. Declined
+attempts are not journaled, so those made after the last snapshot are
+forgotten.
+"""
+
+import threading
+from collections import deque
+
+from accounts import NO_ACCOUNT
+from ledger import TxType
+
+COUNT = "count"
+SUM = "sum"
+DISTINCT = "distinct"
+SEQUENCE = "sequence"
+
+FLAG = "flag"
+BLOCK = "block"
+LOCK = "lock"
+SEVERITY = {FLAG: 0, BLOCK: 1, LOCK: 2}
+
+class Rule:
+    """One sliding-window rule; a sequence rule trips on types soon after follows"""
+
+    __slots__ = ("name", "kind", "types", "window", "threshold", "action", "follows")
+
+    def __init__(self, name, kind, types, window, threshold=0, action=FLAG, follows=()):
+        self.name = name
+        self.kind = kind
+        self.types = frozenset(types)
+        self.window = window  # seconds
+        self.threshold = threshold
+        self.action = action
+        self.follows = frozenset(follows)  # sequence rules: the earlier event types
+
+    def __repr__(self):
+        return f"Rule({self.name!r}, {self.kind}, {self.action})"
+
+DEFAULT_RULES = (
+    Rule("rapid_quick_cash", COUNT, {TxType.QUICK_CASH}, 300, 3, BLOCK),
+    Rule("quick_cash_storm", COUNT, {TxType.QUICK_CASH}, 300, 5, LOCK),
+    Rule("bill_burst", COUNT, {TxType.BILL_PAYMENT}, 600, 5, BLOCK),
+    Rule("many_payees", DISTINCT, {TxType.BILL_PAYMENT}, 3600, 4, FLAG),
+    Rule("cash_velocity", SUM, {TxType.WITHDRAWAL, TxType.QUICK_CASH}, 3600, 40000, FLAG),
+    Rule("deposit_then_out", SEQUENCE, {TxType.TRANSFER, TxType.WITHDRAWAL, TxType.QUICK_CASH},
+         120, action=FLAG, follows={TxType.DEPOSIT}),
+)
+
+class Window:
+    """Events of one rule and customer inside the rule's time window"""
+
+    __slots__ = ("events", "total", "payees")
+
+    def __init__(self):
+        self.events = deque()  # (ts, cents, payee)
+        self.total = 0
+        self.payees = {}  # payee -> events in the window
+
+    def expire(self, cutoff):
+        events, payees = self.events, self.payees
+        while events and events[0][0] <= cutoff:
+            _, cents, payee = events.popleft()
+            self.total -= cents
+            if payee is not None:
+                left = payees[payee] - 1
+                if left:
+                    payees[payee] = left
+                else:
+                    del payees[payee]
+
+    def add(self, ts, cents, payee):
+        self.events.append((ts, cents, payee))
+        self.total += cents
+        if payee is not None:
+            self.payees[payee] = self.payees.get(payee, 0) + 1
+
+class Alert:
+    __slots__ = ("ts", "customer", "rule", "action", "tx_type", "cents")
+
+    def __init__(self, ts, customer, rule, action, tx_type, cents):
+        self.ts = ts
+        self.customer = customer
+        self.rule = rule
+        self.action = action
+        self.tx_type = tx_type
+        self.cents = cents
+
+class FraudEngine:
+    """Sliding-window rules over the transaction feed"""
+
+    def __init__(self, store, rules=DEFAULT_RULES, max_alerts=1000):
+        self.store = store
+        self.enabled = True
+        self.rules = ()
+        # (rule index, customer) -> Window
+        self.windows = {}
+        # (rule index, customer) -> time of the latest event a sequence rule follows
+        self.last_seen = {}
+        self.alerts = deque(maxlen=max_alerts)
+        self.tripped = {}  # rule name -> times tripped
+        # Screening and the ledger listener may run on different threads
+        self.lock = threading.Lock()
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        with self.lock:
+            self.rules = tuple(rules)
+            self.windows.clear()
+            self.last_seen.clear()
+            self.tripped = {rule.name: 0 for rule in self.rules}
+            # Transaction type -> indexes of the rules watching it / that it starts
+            self.watching = {t: [i for i, r in enumerate(self.rules) if t in r.types]
+                             for t in TxType}
+            self.starting = {t: [i for i, r in enumerate(self.rules) if t in r.follows]
+                             for t in TxType}
+
+    def _window(self, index, customer, now):
+        key = (index, customer)
+        window = self.windows.get(key)
+        if window is None:
+            window = self.windows[key] = Window()
+        else:
+            window.expire(now - self.rules[index].window)
+        return window
+
+    def _trips(self, index, customer, cents, payee, now):
+        rule = self.rules[index]
+        if rule.kind == SEQUENCE:
+            seen = self.last_seen.get((index, customer))
+            return seen is not None and now - seen <= rule.window
+        window = self._window(index, customer, now)
+        if rule.kind == COUNT:
+            return len(window.events) + 1 > rule.threshold
+        if rule.kind == SUM:
+            return window.total + cents > rule.threshold
+        return len(window.payees) + (payee not in window.payees) > rule.threshold
+
+    def _add(self, customer, tx_type, cents, payee, ts):
+        for index in self.watching[tx_type]:
+            if self.rules[index].kind != SEQUENCE:
+                self._window(index, customer, ts).add(ts, cents, payee)
+        for index in self.starting[tx_type]:
+            self.last_seen[(index, customer)] = ts
+
+    def screen(self, customer, tx_type, cents, payee, now):
+        """Rules tripped by a proposed event, most severe first (empty when clear)
+
+        Every tripped rule raises an alert. If one of them blocks or locks,
+        the attempt is added to the windows, since it will not be logged.
+        """
+        if not self.enabled:
+            return []
+        with self.lock:
+            tripped = [self.rules[i] for i in self.watching[tx_type]
+                       if self._trips(i, customer, cents, payee, now)]
+            if not tripped:
+                return tripped
+            tripped.sort(key=lambda rule: SEVERITY[rule.action], reverse=True)
+            for rule in tripped:
+                self.tripped[rule.name] += 1
+                self.alerts.append(Alert(now, customer, rule.name, rule.action, tx_type, cents))
+            if tripped[0].action != FLAG:
+                self._add(customer, tx_type, cents, payee, now)
+        return tripped
+
+    def record(self, tx):
+        """Ledger listener adding a logged transaction to the windows"""
+        if not self.enabled or tx.account == NO_ACCOUNT:
+            return
+        payee = tx.memo if tx.type == TxType.BILL_PAYMENT else None
+        with self.lock:
+            self._add(self.store.owner[tx.account], tx.type, tx.cents, payee, tx.ts)
+
+    def state(self):
+        """Window events and sequence starts keyed by rule name, for snapshots"""
+        with self.lock:
+            names = [rule.name for rule in self.rules]
+            return {
+                "windows": [(names[index], customer, list(window.events))
+                            for (index, customer), window in self.windows.items()
+                            if window.events],
+                "last_seen": [(names[index], customer, ts)
+                              for (index, customer), ts in self.last_seen.items()],
+            }
+
+    def load_state(self, state):
+        """Restore what state() returned; rules no longer configured are skipped"""
+        with self.lock:
+            indexes = {rule.name: index for index, rule in enumerate(self.rules)}
+            self.windows.clear()
+            self.last_seen.clear()
+            for name, customer, events in state["windows"]:
+                index = indexes.get(name)
+                if index is None:
+                    continue
+                window = self.windows[(index, customer)] = Window()
+                for event in events:
+                    window.add(*event)
+            for name, customer, ts in state["last_seen"]:
+                index = indexes.get(name)
+                if index is not None:
+                    self.last_seen[(index, customer)] = ts
+
+    def alerts_for(self, customer):
+        """Recent alerts for one customer, oldest first"""
+        with self.lock:
+            return [alert for alert in self.alerts if alert.customer == customer]
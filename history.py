@@ -0,0 +1,360 @@
+"""
+Memory-mapped transaction history file for the Enhanced ATM Simulation.
+
+Years of history are kept on disk as fixed-width binary records and read
+through ``mmap``, with an in-memory index of record numbers per account and
+month. A monthly statement reads only that month's records for the account;
+nothing is parsed from text and the history is never loaded into RAM.
+
+Record layout (little endian, 72 bytes):
+
+    account q | peer q | cents q | balance after q | peer balance after q |
+    timestamp d | type b | memo 23s (utf-8, truncated)
+
+Searches by date range, type, amount and account use a time index (record
+timestamps in record order, searched with bisect) and per-type posting
+lists of record numbers. A query bisects both and decodes only the records
+of the smallest candidate list, O(log n + k) instead of a full scan.
+
+The history file is a secondary copy of the ledger. The write-ahead log is
+what makes state durable; records still buffered here when the process dies
+are not re-created.
+
+Other processes (e.g. export.py) open the file with ``read_only=True``: it
+is mapped without being opened for writing, and a partial record at the
+tail, which the running writer has yet to finish, is ignored rather than
+cut off.
+"""
+
+import bisect
+import datetime
+import heapq
+import mmap
+import os
+import struct
+from array import array
+
+from accounts import NO_ACCOUNT
+from ledger import BALANCE_SIGN, Transaction, TxType, TX_TYPE_COUNT
+import money
+from money import np
+
+RECORD = struct.Struct("<qqqqqdb23s")
+HISTORY_NAME = "history.bin"
+
+# Months with more records than this are summarized with NumPy over the mmap
+VECTOR_THRESHOLD = 64
+if np is not None:
+    RECORD_DTYPE = np.dtype([("account", "<i8"), ("peer", "<i8"), ("cents", "<i8"),
+                             ("after", "<i8"), ("peer_after", "<i8"), ("ts", "<f8"),
+                             ("type", "i1"), ("memo", "S23")])
+    SIGNS = np.array([BALANCE_SIGN[t] for t in TxType], dtype=np.int64)
+
+def month_key(ts):
+    """Months since year 0 for an epoch timestamp, in local time"""
+    date = datetime.date.fromtimestamp(ts)
+    return date.year * 12 + date.month - 1
+
+class MonthlySummary:
+    """Per-type counts and sums plus opening/closing balance for one account-month"""
+
+    __slots__ = ("account", "year", "month", "count", "total",
+                 "transfers_in", "transfers_in_total", "opening", "closing")
+
+    def __init__(self, account, year, month):
+        self.account = account
+        self.year = year
+        self.month = month
+        self.count = [0] * TX_TYPE_COUNT
+        self.total = [0] * TX_TYPE_COUNT
+        self.transfers_in = 0
+        self.transfers_in_total = 0
+        self.opening = None
+        self.closing = None
+
+    @property
+    def records(self):
+        return sum(self.count) + self.transfers_in
+
+class HistoryFile:
+    """Append-only binary history with a per-account, per-month record index"""
+
+    def __init__(self, path, store, read_only=False):
+        self.path = path
+        self.store = store
+        self.read_only = read_only
+        self.file = open(path, "rb" if read_only else "ab+")
+        self.map = None
+        self.mapped_size = 0
+        # (account, month key) -> record numbers, ascending
+        self.index = {}
+        # account -> month keys with activity, ascending
+        self.account_months = {}
+        # Timestamp of every record in record order, for bisect. A clock that
+        # steps back is indexed at the latest time seen so the array stays
+        # sorted; skew is the largest such step, which widens the end of a
+        # time range. Searches still filter on the exact timestamp.
+        self.timestamps = array("d")
+        self.skew = 0.0
+        # transaction type -> record numbers, ascending
+        self.by_type = {tx_type: array("q") for tx_type in TxType}
+
+        size = os.path.getsize(path)
+        if size % RECORD.size and not read_only:
+            # Cut off a partially written record at the tail
+            self.file.truncate(size - size % RECORD.size)
+        self.count = 0
+        self._rebuild_index()
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def _rebuild_index(self):
+        self.file.flush()
+        view = self._view()
+        for number in range(self.count, len(view) // RECORD.size if view else 0):
+            account, peer, _, _, _, ts, tx_type, _ = RECORD.unpack_from(
+                view, number * RECORD.size)
+            self._index(number, account, peer, ts, tx_type)
+            self.count = number + 1
+
+    def _index(self, number, account, peer, ts, tx_type):
+        timestamps = self.timestamps
+        if timestamps and ts < timestamps[-1]:
+            self.skew = max(self.skew, timestamps[-1] - ts)
+            timestamps.append(timestamps[-1])
+        else:
+            timestamps.append(ts)
+        self.by_type[tx_type].append(number)
+        key = month_key(ts)
+        for owner in (account, peer):
+            if owner == NO_ACCOUNT:
+                continue
+            records = self.index.get((owner, key))
+            if records is None:
+                records = self.index[(owner, key)] = array("q")
+                months = self.account_months.get(owner)
+                if months is None:
+                    months = self.account_months[owner] = array("l")
+                bisect.insort(months, key)
+            records.append(number)
+
+    def _view(self):
+        """mmap covering everything written so far"""
+        size = os.path.getsize(self.path)
+        if size == 0:
+            return None
+        if self.map is None or size > self.mapped_size:
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+            self.mapped_size = size
+        return self.map
+
+    # Writing
+
+    def record(self, tx):
+        """Ledger listener: append one transaction with the balances after it"""
+        balance = self.store.balance
+        after = balance[tx.account] if tx.account != NO_ACCOUNT else 0
+        peer_after = balance[tx.peer] if tx.peer != NO_ACCOUNT else 0
+        memo = tx.memo.encode("utf-8")[:23] if tx.memo else b""
+        self.file.write(RECORD.pack(tx.account, tx.peer, tx.cents, after, peer_after,
+                                    tx.ts, tx.type, memo))
+        self._index(self.count, tx.account, tx.peer, tx.ts, tx.type)
+        self.count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    # Reading
+
+    def read(self, number):
+        """Decode one record into a Transaction"""
+        self.flush()
+        return self._transaction(self._view(), number)
+
+    @staticmethod
+    def _transaction(view, number):
+        account, peer, cents, _, _, ts, tx_type, memo = RECORD.unpack_from(
+            view, number * RECORD.size)
+        memo = memo.rstrip(b"\0").decode("utf-8", "ignore") or None
+        return Transaction(TxType(tx_type), account, cents, ts, peer, memo)
+
+    def page(self, accounts, start=0, count=20):
+        """Up to count records of the accounts from record number start on, oldest first
+
+        Returns (transactions, record number the next page starts at or None).
+        Only the month lists reaching start are read.
+        """
+        self.flush()
+        lists = []
+        for account in set(accounts):
+            for key in self.account_months.get(account, ()):
+                records = self.index[(account, key)]
+                if records[-1] >= start:
+                    lists.append(records[bisect.bisect_left(records, start):])
+        view = self._view()
+        found = []
+        previous = -1
+        for number in heapq.merge(*lists):
+            if number == previous:
+                continue  # a transfer between two of the accounts
+            previous = number
+            if len(found) == count:
+                return found, number
+            found.append(self._transaction(view, number))
+        return found, None
+
+    def time_range(self, start_ts=None, end_ts=None):
+        """Record numbers [first, last) holding every record with a timestamp in [start_ts, end_ts)"""
+        first = 0 if start_ts is None else bisect.bisect_left(self.timestamps, start_ts)
+        last = (self.count if end_ts is None
+                else bisect.bisect_left(self.timestamps, end_ts + self.skew))
+        return first, max(first, last)
+
+    def search(self, accounts=None, start_ts=None, end_ts=None, types=None,
+               min_cents=None, max_cents=None, limit=None):
+        """Transactions matching every given filter, oldest first
+
+        accounts matches either side of a transfer; start_ts/end_ts bound a
+        half-open time range; min_cents/max_cents are inclusive.
+        """
+        self.flush()
+        first, last = self.time_range(start_ts, end_ts)
+        if first == last:
+            return []
+
+        # Candidate record numbers in [first, last): the whole range, the
+        # type posting lists or the account month lists, whichever is shortest
+        def window(numbers):
+            return numbers[bisect.bisect_left(numbers, first):bisect.bisect_left(numbers, last)]
+
+        candidates = [range(first, last)]
+        if types is not None:
+            candidates.append([window(self.by_type[t]) for t in set(types)])
+        if accounts is not None:
+            low = -1 if start_ts is None else month_key(start_ts)
+            high = float("inf") if end_ts is None else month_key(end_ts)
+            candidates.append([window(self.index[(a, key)]) for a in set(accounts)
+                               for key in self.account_months.get(a, ())
+                               if low <= key <= high])
+        numbers = min(candidates[1:], key=lambda lists: sum(map(len, lists)), default=None)
+        if numbers is None or sum(map(len, numbers)) > last - first:
+            numbers = candidates[0]
+        else:
+            numbers = heapq.merge(*numbers)
+
+        accounts = None if accounts is None else set(accounts)
+        types = None if types is None else set(types)
+        view = self._view()
+        found = []
+        previous = -1
+        for number in numbers:
+            if number == previous:
+                continue  # a transfer between two of the accounts
+            previous = number
+            account, peer, cents, _, _, ts, tx_type, memo = RECORD.unpack_from(
+                view, number * RECORD.size)
+            if ((types is not None and tx_type not in types)
+                    or (min_cents is not None and cents < min_cents)
+                    or (max_cents is not None and cents > max_cents)
+                    or (start_ts is not None and ts < start_ts)
+                    or (end_ts is not None and ts >= end_ts)
+                    or (accounts is not None and account not in accounts
+                        and peer not in accounts)):
+                continue
+            memo = memo.rstrip(b"\0").decode("utf-8", "ignore") or None
+            found.append(Transaction(TxType(tx_type), account, cents, ts, peer, memo))
+            if limit is not None and len(found) >= limit:
+                break
+        return found
+
+    def latest(self, accounts, n):
+        """The newest n records of the accounts, oldest first"""
+        self.flush()
+        numbers = set()
+        for account in set(accounts):
+            wanted = n
+            for key in reversed(self.account_months.get(account, ())):
+                records = self.index[(account, key)]
+                numbers.update(records[-wanted:])
+                wanted -= len(records)
+                if wanted <= 0:
+                    break
+        view = self._view()
+        return [self._transaction(view, number) for number in sorted(numbers)[-n:]]
+
+    def months(self, account):
+        """Month keys (year * 12 + month - 1) in which the account has records"""
+        return list(self.account_months.get(account, ()))
+
+    def monthly_summary(self, account, year, month):
+        """Summarize one account-month touching only that month's records"""
+        self.flush()
+        summary = MonthlySummary(account, year, month)
+        key = year * 12 + month - 1
+        records = self.index.get((account, key))
+
+        if not records:
+            summary.opening = summary.closing = self._quiet_month_balance(account, key)
+            return summary
+
+        view = self._view()
+        if np is not None and len(records) > VECTOR_THRESHOLD:
+            self._summarize_vectorized(summary, view, records)
+            return summary
+
+        net = 0
+        for number in records:
+            owner, peer, cents, after, peer_after, _, tx_type, _ = RECORD.unpack_from(
+                view, number * RECORD.size)
+            if owner == account:
+                summary.count[tx_type] += 1
+                summary.total[tx_type] += cents
+                net += BALANCE_SIGN[tx_type] * cents
+                summary.closing = after
+            else:
+                summary.transfers_in += 1
+                summary.transfers_in_total += cents
+                net += cents
+                summary.closing = peer_after
+        summary.opening = summary.closing - net
+        return summary
+
+    def _summarize_vectorized(self, summary, view, records):
+        """monthly_summary over int64 columns of the mapped records"""
+        table = np.frombuffer(view, dtype=RECORD_DTYPE, count=self.count)
+        try:
+            rows = table[np.frombuffer(records, dtype=np.int64)]
+        finally:
+            del table
+        own = rows["account"] == summary.account
+        types, cents = rows["type"][own], rows["cents"][own]
+        summary.count, summary.total = money.totals_by_type(types, cents, TX_TYPE_COUNT)
+        incoming = rows["cents"][~own]
+        summary.transfers_in = len(incoming)
+        summary.transfers_in_total = int(incoming.sum())
+
+        net = int((SIGNS[types] * cents).sum()) + summary.transfers_in_total
+        last = rows[-1]
+        summary.closing = int(last["after"] if own[-1] else last["peer_after"])
+        summary.opening = summary.closing - net
+
+    def _quiet_month_balance(self, account, key):
+        """Balance throughout a month in which the account had no records"""
+        months = self.account_months.get(account)
+        if not months:
+            return self.store.balance[account]
+        position = bisect.bisect_left(months, key)
+        if position:
+            year, month = divmod(months[position - 1], 12)
+            return self.monthly_summary(account, year, month + 1).closing
+        year, month = divmod(months[0], 12)
+        return self.monthly_summary(account, year, month + 1).opening
@@ -0,0 +1,126 @@
+"""
+Idempotency keys for the Enhanced ATM Simulation.
+
+Terminals retry an operation when its reply is lost or late. Every
+state-changing ``Session`` method accepts ``key=``: the first call with a
+key executes, and a retry with the same key (from the same customer, on any
+session) gets the original ``Result`` back without executing again. A retry
+that arrives while the first call is still running waits for its outcome.
+
+``IdempotencyCache`` holds the recent keys and their results:
+
+- **Bounded:** at most ``capacity`` keys, evicting the least recently used
+- **TTL:** a key is forgotten ``ttl`` seconds after its first use; a retry
+  after that executes as a new operation
+- **Conflicts:** reusing a key for a different operation or different
+  arguments is refused rather than answered with an unrelated result
+- **Stats:** hits, misses, waits, evictions and the hit rate
+
+The cache lives in memory only; keys are not journaled, so a retry that
+spans a restart executes again.
+
+Self-check: python -m tools.idempotency_check
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CAPACITY = 100000
+DEFAULT_TTL = 24 * 3600  # seconds
+
+class _Pending:
+    """A keyed call still executing; duplicates wait on it"""
+
+    __slots__ = ("fingerprint", "done", "result")
+
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.done = threading.Event()
+        self.result = None
+
+class IdempotencyCache:
+    """Recent idempotency keys and their results, LRU-bounded with a TTL"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, ttl=DEFAULT_TTL, clock=time.time):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        # key -> (expires at, fingerprint, result), least recently used first
+        self.entries = OrderedDict()
+        self.pending = {}  # key -> _Pending
+        self.hits = self.misses = self.waits = 0
+        self.evictions = self.expired = self.conflicts = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self):
+        """Share of keyed calls answered without executing"""
+        calls = self.hits + self.misses
+        return self.hits / calls if calls else 0.0
+
+    def run(self, key, fingerprint, call, conflict, cacheable=lambda result: True):
+        """call()'s result, executed at most once per live key
+
+        fingerprint identifies the operation and its arguments; a key seen
+        with another fingerprint returns conflict() instead. Results for
+        which cacheable() is false are returned but not remembered.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[0] <= self.clock():
+                    del self.entries[key]
+                    self.expired += 1
+                    entry = None
+                else:
+                    self.entries.move_to_end(key)
+            if entry is not None:
+                if entry[1] != fingerprint:
+                    self.conflicts += 1
+                    return conflict()
+                self.hits += 1
+                return entry[2]
+            pending = self.pending.get(key)
+            if pending is None:
+                pending = self.pending[key] = _Pending(fingerprint)
+                self.misses += 1
+                owner = True
+            else:
+                if pending.fingerprint != fingerprint:
+                    self.conflicts += 1
+                    return conflict()
+                self.waits += 1
+                owner = False
+
+        if not owner:
+            pending.done.wait()
+            if pending.result is not None:
+                with self.lock:
+                    self.hits += 1
+                return pending.result
+            # The first call failed or was not cacheable: run this one
+            return self.run(key, fingerprint, call, conflict, cacheable)
+
+        result = None
+        try:
+            result = call()
+        finally:
+            keep = result is not None and cacheable(result)
+            with self.lock:
+                del self.pending[key]
+                if keep:
+                    self.entries[key] = (self.clock() + self.ttl, fingerprint, result)
+                    while len(self.entries) > self.capacity:
+                        self.entries.popitem(last=False)
+                        self.evictions += 1
+            pending.result = result if keep else None
+            pending.done.set()
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
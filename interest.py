@@ -0,0 +1,149 @@
+"""
+Interest accrual for savings accounts.
+
+- **Catch-up:** an account that has not been credited for N days gets N days of
+  daily compounding in one step, ``balance * ((1 + rate) ** N - 1)``, computed
+  in Decimal and rounded once to whole cents
+- **Batch accrual:** the end-of-day run computes one day of interest for every
+  savings account in a single vectorized NumPy pass over the balance column
+  (pure Python fallback when NumPy is not installed). ``pending_interest``
+  only computes, over whole columns or slices of them, so the sharded
+  pipeline in eod.py can run it in worker processes; ``apply_interest``
+  credits the result
+
+Each credited account gets exactly one INTEREST transaction per run.
+"""
+
+import datetime
+import functools
+from decimal import Decimal, ROUND_HALF_UP, localcontext
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+from accounts import NO_ACCOUNT, SAVINGS
+from ledger import TxType
+
+# Simple daily interest calculation (0.01% daily = ~3.65% annual)
+DAILY_INTEREST_RATE = Decimal("0.0001")
+
+def today():
+    """Current local date as a day number (proleptic Gregorian ordinal)"""
+    return datetime.date.today().toordinal()
+
+@functools.lru_cache(maxsize=1024)
+def _growth(days, rate):
+    """(1 + rate) ** days - 1; accounts catching up over the same gap share it"""
+    with localcontext() as ctx:
+        ctx.prec = 50
+        return (1 + rate) ** days - 1
+
+def compound_interest_cents(balance_cents, days, rate=DAILY_INTEREST_RATE):
+    """Interest earned by balance_cents over days of daily compounding, in cents"""
+    if balance_cents <= 0 or days <= 0:
+        return 0
+    growth = _growth(days, rate)
+    with localcontext() as ctx:
+        ctx.prec = 50
+        interest = Decimal(balance_cents) * growth
+        return int(interest.to_integral_value(rounding=ROUND_HALF_UP))
+
+def days_pending(store, account, day=None):
+    day = today() if day is None else day
+    return max(0, day - store.interest_day[account])
+
+def catch_up_account(store, ledger, account, day=None):
+    """Credit all pending interest for one savings account; returns cents credited"""
+    day = today() if day is None else day
+    if store.kind[account] != SAVINGS:
+        return 0
+    days = days_pending(store, account, day)
+    if days == 0:
+        return 0
+    interest = compound_interest_cents(store.balance[account], days)
+    store.interest_day[account] = day
+    if interest > 0:
+        store.credit(account, interest)
+        ledger.append(TxType.INTEREST, account, interest, memo=_days_memo(days))
+    return interest
+
+def accrue_all(store, ledger, day=None, rate=DAILY_INTEREST_RATE):
+    """Bring every savings account up to date; returns (accounts credited, cents)"""
+    day = today() if day is None else day
+    offsets, amounts, days = pending_interest(store.kind, store.balance, store.interest_day,
+                                              day, rate)
+    return apply_interest(store, ledger, day, offsets, amounts, days)
+
+def pending_interest(kind, balance, interest_day, day, rate=DAILY_INTEREST_RATE):
+    """Interest owed to a run of accounts on day, without changing them
+
+    kind, balance and interest_day are parallel account columns, or slices of
+    them. Returns (offsets, cents, days) lists for every savings account behind
+    day, including those whose interest is 0. Accounts exactly one day behind
+    are handled in one vectorized pass; accounts with a longer gap go through
+    the closed-form catch-up.
+    """
+    numerator, denominator = rate.as_integer_ratio()
+    if np is None:
+        return _pending_interest_python(kind, balance, interest_day, day, rate,
+                                        numerator, denominator)
+
+    balance = np.frombuffer(balance, dtype=np.int64)
+    kind = np.frombuffer(kind, dtype=np.int8)
+    last_day = np.frombuffer(interest_day, dtype=np.int32)
+    try:
+        behind = day - last_day
+        due = (kind == SAVINGS) & (behind > 0)
+        one_day = np.flatnonzero(due & (behind == 1))
+        longer = np.flatnonzero(due & (behind > 1))
+
+        # Round half up in integer arithmetic: (2 * b * n + d) // (2 * d)
+        interest = (2 * balance[one_day] * numerator + denominator) // (2 * denominator)
+        interest[balance[one_day] <= 0] = 0
+
+        offsets, amounts = one_day.tolist(), interest.tolist()
+        days = [1] * len(offsets)
+        for offset in longer.tolist():
+            gap = int(behind[offset])
+            offsets.append(offset)
+            amounts.append(compound_interest_cents(int(balance[offset]), gap, rate))
+            days.append(gap)
+    finally:
+        # Release the buffer views so the columns can grow again
+        del balance, kind, last_day
+    return offsets, amounts, days
+
+def _pending_interest_python(kind, balance, interest_day, day, rate, numerator, denominator):
+    offsets, amounts, days = [], [], []
+    for offset in range(len(kind)):
+        if kind[offset] != SAVINGS:
+            continue
+        behind = day - interest_day[offset]
+        if behind == 1:
+            cents = 0
+            if balance[offset] > 0:
+                cents = (2 * balance[offset] * numerator + denominator) // (2 * denominator)
+        elif behind > 1:
+            cents = compound_interest_cents(balance[offset], behind, rate)
+        else:
+            continue
+        offsets.append(offset)
+        amounts.append(cents)
+        days.append(behind)
+    return offsets, amounts, days
+
+def apply_interest(store, ledger, day, accounts, amounts, days):
+    """Credit interest computed by pending_interest; returns (accounts credited, cents)"""
+    credits = []
+    for account, cents, gap in zip(accounts, amounts, days):
+        store.interest_day[account] = day
+        if cents > 0:
+            store.credit(account, cents)
+            credits.append((TxType.INTEREST, account, cents, NO_ACCOUNT, _days_memo(gap)))
+    ledger.extend(credits)
+    return len(credits), sum(credit[2] for credit in credits)
+
+def _days_memo(days):
+    return "1 day" if days == 1 else f"{days} days"
@@ -0,0 +1,392 @@
+"""
+Structured transaction log for the Enhanced ATM Simulation.
+
+Transactions are stored as small typed records instead of formatted strings.
+Text is only produced when a record is displayed, and the ledger keeps running
+counts and sums per transaction type and per account as records are appended,
+so statement summaries never have to rescan the history.
+
+The most recent records live in a fixed-capacity ring buffer; records pushed
+out of it spill into an append-only, paged archive, so nothing is lost and
+appends stay O(1). Once a history file holds every record (history.py),
+``drop_archive`` stops keeping them: evicted records are dropped and memory
+stays bounded by the ring buffer, whatever the length of the history.
+"""
+
+import datetime
+import threading
+import time
+from array import array
+from enum import IntEnum
+
+from accounts import NO_ACCOUNT
+from money import format_cents
+
+class TxType(IntEnum):
+    DEPOSIT = 0
+    WITHDRAWAL = 1
+    QUICK_CASH = 2
+    TRANSFER = 3
+    BILL_PAYMENT = 4
+    FEE = 5
+    INTEREST = 6
+    SECURITY = 7
+
+TX_TYPE_COUNT = len(TxType)
+
+# How each type moves the balance of its account; transfers also credit the peer
+BALANCE_SIGN = {
+    TxType.DEPOSIT: 1,
+    TxType.INTEREST: 1,
+    TxType.WITHDRAWAL: -1,
+    TxType.QUICK_CASH: -1,
+    TxType.BILL_PAYMENT: -1,
+    TxType.FEE: -1,
+    TxType.TRANSFER: -1,
+    TxType.SECURITY: 0,
+}
+
+# Display templates, filled in with account labels and the memo at display time
+DESCRIPTIONS = {
+    TxType.DEPOSIT: "Deposited to {account}",
+    TxType.WITHDRAWAL: "Withdrew from {account}",
+    TxType.QUICK_CASH: "Quick cash from {account}",
+    TxType.TRANSFER: "Transfer: {account} → {peer}",
+    TxType.BILL_PAYMENT: "Paid {memo} bill",
+    TxType.FEE: "{memo}",
+    TxType.INTEREST: "Interest earned on {account} ({memo})",
+    TxType.SECURITY: "{memo}",
+}
+
+class Transaction:
+    """A single ledger entry; amounts are integer cents, ts is epoch seconds"""
+
+    __slots__ = ("type", "account", "cents", "ts", "peer", "memo", "prev", "peer_prev")
+
+    def __init__(self, tx_type, account, cents, ts, peer=NO_ACCOUNT, memo=None):
+        self.type = tx_type
+        self.account = account
+        self.cents = cents
+        self.ts = ts
+        self.peer = peer
+        self.memo = memo
+        # Position of the previous record of the same account / of the peer
+        self.prev = -1
+        self.peer_prev = -1
+
+    def __repr__(self):
+        return (f"Transaction({self.type.name}, account={self.account}, "
+                f"cents={self.cents}, ts={self.ts})")
+
+def describe(tx, label=str):
+    """Human readable description; label turns an account id into a name"""
+    return DESCRIPTIONS[tx.type].format(
+        account=label(tx.account), peer=label(tx.peer), memo=tx.memo)
+
+def format_transaction(tx, label=str):
+    """Format a record as '[YYYY-mm-dd HH:MM:SS] TYPE: description - $x.xx'"""
+    timestamp = datetime.datetime.fromtimestamp(tx.ts).strftime('%Y-%m-%d %H:%M:%S')
+    text = f"[{timestamp}] {tx.type.name}: {describe(tx, label)}"
+    if tx.cents > 0:
+        text += f" - ${format_cents(tx.cents)}"
+    return text
+
+class RingBuffer:
+    """Fixed-capacity FIFO; pushing into a full buffer evicts the oldest item"""
+
+    __slots__ = ("items", "start", "size")
+
+    def __init__(self, capacity):
+        if capacity <= 0:
+            raise ValueError("Ring buffer capacity must be positive")
+        self.items = [None] * capacity
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.items)
+
+    def push(self, item):
+        """Append an item and return the evicted one, or None"""
+        capacity = len(self.items)
+        if self.size < capacity:
+            self.items[(self.start + self.size) % capacity] = item
+            self.size += 1
+            return None
+        evicted = self.items[self.start]
+        self.items[self.start] = item
+        self.start = (self.start + 1) % capacity
+        return evicted
+
+    def last(self, n):
+        """The newest n items, oldest first"""
+        n = min(n, self.size)
+        capacity = len(self.items)
+        first = self.start + self.size - n
+        return [self.items[(first + i) % capacity] for i in range(n)]
+
+    def __getitem__(self, index):
+        """Item by age, 0 being the oldest retained item"""
+        if not 0 <= index < self.size:
+            raise IndexError("ring buffer index out of range")
+        return self.items[(self.start + index) % len(self.items)]
+
+    def __iter__(self):
+        return iter(self.last(self.size))
+
+class Archive:
+    """Append-only store of evicted records, kept in fixed-size pages"""
+
+    def __init__(self, page_size=1000):
+        self.page_size = page_size
+        self.pages = []
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def append(self, tx):
+        if not self.pages or len(self.pages[-1]) == self.page_size:
+            self.pages.append([])
+        self.pages[-1].append(tx)
+        self.size += 1
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.size:
+            raise IndexError("archive index out of range")
+        return self.pages[index // self.page_size][index % self.page_size]
+
+    def __iter__(self):
+        for page in self.pages:
+            yield from page
+
+class OperationLock:
+    """Reentrant lock that runs hooks when its outermost holder releases it
+
+    The bank holds the ledger lock for the whole of a multi-record operation,
+    so the outermost release is an operation boundary: every leg has been
+    applied and recorded. Hooks (e.g. the write-ahead log's group commit and
+    snapshot) run there, before any other thread can take the lock.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.depth = 0  # only changed by the holding thread
+        self.on_release = []
+
+    def acquire(self, blocking=True, timeout=-1):
+        acquired = self.lock.acquire(blocking, timeout)
+        if acquired:
+            self.depth += 1
+        return acquired
+
+    def release(self):
+        if self.depth == 1 and self.on_release:
+            try:
+                for hook in self.on_release:
+                    hook()  # may take the lock again; depth stays above 0
+            finally:
+                self.depth = 0
+                self.lock.release()
+            return
+        self.depth -= 1
+        self.lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+class Ledger:
+    """Transaction log with a recent window, an archive and running counters"""
+
+    def __init__(self, recent_capacity=100, archive_page_size=1000, clock=time.time):
+        self.recent_window = RingBuffer(recent_capacity)
+        self.archive = Archive(archive_page_size)
+        self.clock = clock
+
+        # Counters over every record ever appended, not just the ones retained
+        self.count = array("q", bytes(8 * TX_TYPE_COUNT))
+        self.total = array("q", bytes(8 * TX_TYPE_COUNT))
+        # account -> [count per type..., total per type...]
+        self.account_stats = {}
+        # Callables invoked with every new record, e.g. the write-ahead log
+        self.listeners = []
+        # Serializes appends and listeners; held by the bank while it applies
+        # a multi-record operation so the records land together
+        self.lock = OperationLock()
+
+        # Position of the first retained record; earlier ones are no longer held
+        self.base = 0
+        # False once evicted records are dropped rather than archived
+        self.keep_archive = True
+        # account -> position of its newest record; records chain backwards
+        # through Transaction.prev / peer_prev
+        self.last_position = {}
+
+    def __len__(self):
+        """Number of records held in memory"""
+        return len(self.archive) + len(self.recent_window)
+
+    @property
+    def appended(self):
+        """Number of records ever appended"""
+        return self.base + len(self)
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        self.listeners.remove(listener)
+
+    def append(self, tx_type, account, cents, peer=NO_ACCOUNT, memo=None):
+        """Record a transaction and update the counters; returns the record"""
+        with self.lock:
+            tx = Transaction(tx_type, account, cents, self.clock(), peer, memo)
+            self.add(tx)
+            for listener in self.listeners:
+                listener(tx)
+        return tx
+
+    def extend(self, entries):
+        """Record many (type, account, cents, peer, memo) entries at one timestamp
+
+        The bulk form of append for end-of-day runs: the lock is taken and the
+        clock read once, and listeners see each record as with append.
+        """
+        with self.lock:
+            ts = self.clock()
+            add, listeners = self.add, self.listeners
+            for tx_type, account, cents, peer, memo in entries:
+                tx = Transaction(tx_type, account, cents, ts, peer, memo)
+                add(tx)
+                for listener in listeners:
+                    listener(tx)
+
+    def add(self, tx):
+        """Insert an existing record, e.g. during recovery; listeners are not called"""
+        position = self.appended
+        last_position = self.last_position
+        if tx.account != NO_ACCOUNT:
+            tx.prev = last_position.get(tx.account, -1)
+            last_position[tx.account] = position
+        if tx.peer != NO_ACCOUNT:
+            tx.peer_prev = last_position.get(tx.peer, -1)
+            last_position[tx.peer] = position
+
+        evicted = self.recent_window.push(tx)
+        if evicted is not None:
+            if self.keep_archive:
+                self.archive.append(evicted)
+            else:
+                self.base += 1
+
+        tx_type, account, cents = tx.type, tx.account, tx.cents
+        self.count[tx_type] += 1
+        self.total[tx_type] += cents
+        if account != NO_ACCOUNT:
+            stats = self.account_stats.get(account)
+            if stats is None:
+                stats = self.account_stats[account] = array("q", bytes(16 * TX_TYPE_COUNT))
+            stats[tx_type] += 1
+            stats[TX_TYPE_COUNT + tx_type] += cents
+
+    def drop_archive(self):
+        """Release the archive and drop records evicted from now on"""
+        with self.lock:
+            self.base += len(self.archive)
+            self.archive = Archive(self.archive.page_size)
+            self.keep_archive = False
+
+    def recent(self, n):
+        """The newest n records, oldest first"""
+        return self.recent_window.last(n)
+
+    def recent_for(self, accounts, n):
+        """The newest n records touching any of the accounts, oldest first
+
+        Follows each account's chain of records backwards, so the cost is
+        O(n) whatever the size of the ledger.
+        """
+        heads = {account: self.last_position.get(account, -1) for account in accounts}
+        found = []
+        seen = set()
+        while len(found) < n:
+            account, position = max(heads.items(), key=lambda item: item[1], default=(None, -1))
+            if position < self.base:
+                break
+            tx = self[position]
+            heads[account] = tx.prev if tx.account == account else tx.peer_prev
+            if position not in seen:
+                seen.add(position)
+                found.append(tx)
+        found.reverse()
+        return found
+
+    def __getitem__(self, position):
+        """Record by position in the full history, 0 being the oldest ever appended"""
+        index = position - self.base
+        if index < 0:
+            raise IndexError("record is no longer held in memory")
+        archived = len(self.archive)
+        if index < archived:
+            return self.archive[index]
+        return self.recent_window[index - archived]
+
+    def __iter__(self):
+        """Every record, oldest first"""
+        yield from self.archive
+        yield from self.recent_window
+
+    def page(self, accounts, start=0, count=20):
+        """Up to count held records of the accounts from position start on, oldest first
+
+        Returns (transactions, position the next page starts at or None).
+        """
+        owned = set(accounts)
+        found = []
+        for position in range(max(start, self.base), self.appended):
+            tx = self[position]
+            if tx.account in owned or tx.peer in owned:
+                if len(found) == count:
+                    return found, position
+                found.append(tx)
+        return found, None
+
+    def pages(self, page_size=20):
+        """Lazily yield the history as lists of at most page_size records"""
+        page = []
+        for tx in self:
+            page.append(tx)
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def account_count(self, account, tx_type):
+        stats = self.account_stats.get(account)
+        return stats[tx_type] if stats else 0
+
+    def account_total(self, account, tx_type):
+        stats = self.account_stats.get(account)
+        return stats[TX_TYPE_COUNT + tx_type] if stats else 0
+
+    def summary(self, accounts):
+        """Counts and sums per type over the given accounts, in O(len(accounts))"""
+        counts = [0] * TX_TYPE_COUNT
+        totals = [0] * TX_TYPE_COUNT
+        for account in accounts:
+            stats = self.account_stats.get(account)
+            if stats is None:
+                continue
+            for t in range(TX_TYPE_COUNT):
+                counts[t] += stats[t]
+                totals[t] += stats[TX_TYPE_COUNT + t]
+        return {t: (counts[t], totals[t]) for t in TxType}
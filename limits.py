@@ -0,0 +1,115 @@
+"""
+Withdrawal limit tracking for the Enhanced ATM Simulation.
+
+Usage is kept per customer in flat arrays and reset lazily: each row
+remembers the day (or hour) it was last written, and a row from an
+earlier day simply reads as zero. There is no nightly sweep, so the cost
+of a check or an update does not depend on the number of customers. The
+end-of-day pipeline (eod.py) may still clear stale calendar-day rows
+explicitly, which reads exactly the same.
+
+- **Calendar day (default):** usage since local midnight, one day number
+  and one running total per customer
+- **Rolling 24 hours:** 24 hourly buckets per customer, indexed by hour
+  modulo 24; the window is the current hour plus the 23 before it, and a
+  check sums at most 24 buckets whatever the number of withdrawals
+
+Withdrawals, quick cash and bill payments count towards the limit. The
+tracker is a ledger listener, so usage is also rebuilt when the
+write-ahead log is replayed.
+"""
+
+import datetime
+from array import array
+
+from ledger import TxType
+
+LIMITED_TYPES = frozenset((TxType.WITHDRAWAL, TxType.QUICK_CASH, TxType.BILL_PAYMENT))
+HOURS = 24
+EMPTY_HOURS = array("q", bytes(8 * HOURS))
+
+def day_number(ts):
+    """Local calendar day of an epoch timestamp, as a date ordinal"""
+    return datetime.date.fromtimestamp(ts).toordinal()
+
+def expired_usage(day, day_used, today):
+    """Calendar-day rows still holding usage from before today
+
+    day and day_used are the tracker's columns, or slices of them. Returns
+    (offsets, cents) for the rows an end-of-day rollover clears.
+    """
+    offsets = [row for row in range(len(day)) if day[row] < today and day_used[row]]
+    return offsets, sum(day_used[row] for row in offsets)
+
+class WithdrawalLimits:
+    """Per-customer withdrawal usage, by calendar day or rolling 24 hours"""
+
+    def __init__(self, store, rolling=False):
+        self.store = store
+        self.rolling = rolling
+        # Calendar day: day number of the last withdrawal and the total on it
+        self.day = array("i")
+        self.day_used = array("q")
+        # Rolling window: hour of the last withdrawal and 24 hourly totals per customer
+        self.last_hour = array("q")
+        self.hourly = array("q")
+
+    @property
+    def window(self):
+        return "24h" if self.rolling else "day"
+
+    def _ensure_rows(self, customer):
+        while len(self.day) <= customer:
+            self.day.append(0)
+            self.day_used.append(0)
+            if self.rolling:
+                self.last_hour.append(0)
+                self.hourly.extend(EMPTY_HOURS)
+
+    def used(self, customer, now):
+        """Cents counted against the limit at time now"""
+        if customer >= len(self.day):
+            return 0
+        if not self.rolling:
+            return self.day_used[customer] if self.day[customer] == day_number(now) else 0
+
+        hour = int(now // 3600)
+        last = self.last_hour[customer]
+        if hour - last >= HOURS:
+            return 0
+        base = customer * HOURS
+        # Buckets for hours hour-23 .. last; later ones are not written yet
+        return sum(self.hourly[base + h % HOURS] for h in range(hour - HOURS + 1, last + 1))
+
+    def record(self, customer, cents, now):
+        self._ensure_rows(customer)
+        if not self.rolling:
+            today = day_number(now)
+            if self.day[customer] != today:
+                self.day[customer] = today
+                self.day_used[customer] = 0
+            self.day_used[customer] += cents
+            return
+
+        hour = int(now // 3600)
+        last = self.last_hour[customer]
+        base = customer * HOURS
+        if hour > last:
+            # Clear the buckets of the hours skipped since the last withdrawal
+            for h in range(max(last + 1, hour - HOURS + 1), hour + 1):
+                self.hourly[base + h % HOURS] = 0
+            self.last_hour[customer] = hour
+        elif hour <= last - HOURS:
+            return  # older than the window
+        self.hourly[base + hour % HOURS] += cents
+
+    def roll_over(self, customers, today):
+        """Start today with no usage for the given customers (see expired_usage)"""
+        for customer in customers:
+            self.day[customer] = today
+            self.day_used[customer] = 0
+
+    def record_transaction(self, tx):
+        """Ledger listener counting limited transaction types"""
+        if tx.type in LIMITED_TYPES:
+            self.record(self.store.owner[tx.account], tx.cents, tx.ts)
@@ -0,0 +1,222 @@
+"""
+Operation metrics for the Enhanced ATM Simulation.
+
+Core operations are wrapped with ``@instrument(name)``. While the registry
+is enabled every call records
+
+- a call count per operation,
+- a count per outcome code (the ``Result.code`` returned, or the
+  transaction type for ``log_transaction``), and
+- the latency in an HDR-style histogram: log-linear buckets with 32
+  sub-buckets per power of two, so any recorded value is known to within
+  about 3% from 1 ns up to several minutes in a fixed 1,184-slot array.
+
+Wrappers are only installed while the registry is enabled; disabled (the
+default), the methods are the plain functions and cost nothing extra. The data
+can be written in the Prometheus text exposition format or summarized as
+p50/p99/max per operation.
+"""
+
+import functools
+import os
+import threading
+import time
+from array import array
+
+SUB_BUCKET_BITS = 5
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+MAX_SHIFT = 35  # values up to 2^41 ns (about 36 minutes)
+BUCKET_COUNT = 2 * SUB_BUCKETS + MAX_SHIFT * SUB_BUCKETS
+
+# Prometheus bucket bounds: powers of two from 1 µs to about 16 s
+EXPORT_BOUNDS_NS = tuple(1000 << k for k in range(25))
+
+def bucket_index(value):
+    """Histogram slot for a non-negative integer value"""
+    if value < 2 * SUB_BUCKETS:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    if shift > MAX_SHIFT:
+        return BUCKET_COUNT - 1
+    return 2 * SUB_BUCKETS + (shift - 1) * SUB_BUCKETS + (value >> shift) - SUB_BUCKETS
+
+def bucket_high(index):
+    """Largest value that lands in a slot"""
+    if index < 2 * SUB_BUCKETS:
+        return index
+    shift, sub = divmod(index - 2 * SUB_BUCKETS, SUB_BUCKETS)
+    return ((sub + SUB_BUCKETS + 1) << (shift + 1)) - 1
+
+class Histogram:
+    """Log-linear latency histogram in nanoseconds"""
+
+    __slots__ = ("counts", "count", "sum", "max")
+
+    def __init__(self):
+        self.counts = array("q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def record(self, value):
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile value"""
+        if not self.count:
+            return 0
+        rank = max(1, round(p / 100 * self.count))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bucket_high(index), self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """Count of values <= each bound, within bucket precision"""
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds:
+            while index < BUCKET_COUNT and bucket_high(index) <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+class Metrics:
+    """Registry of per-operation calls, outcomes and latencies"""
+
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.outcomes = {}  # (operation, outcome) -> count
+        self.latency = {}
+
+    def enable(self):
+        """Install the timing wrappers on every instrumented method"""
+        for owner, name, func, operation in _instrumented:
+            setattr(owner, name, _timed(func, operation))
+        self.enabled = True
+
+    def disable(self):
+        for owner, name, func, _ in _instrumented:
+            setattr(owner, name, func)
+        self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+            self.outcomes.clear()
+            self.latency.clear()
+
+    def observe(self, operation, nanoseconds, outcome=None):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+            if outcome is not None:
+                key = (operation, outcome)
+                self.outcomes[key] = self.outcomes.get(key, 0) + 1
+            histogram = self.latency.get(operation)
+            if histogram is None:
+                histogram = self.latency[operation] = Histogram()
+            histogram.record(nanoseconds)
+
+    def summary(self):
+        """Rows of (operation, calls, p50 ns, p99 ns, max ns, {outcome: count})"""
+        with self.lock:
+            rows = []
+            for operation in sorted(self.calls):
+                histogram = self.latency[operation]
+                outcomes = {o: n for (op, o), n in self.outcomes.items() if op == operation}
+                rows.append((operation, self.calls[operation], histogram.percentile(50),
+                             histogram.percentile(99), histogram.max, outcomes))
+            return rows
+
+    def prometheus(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = [
+            "# HELP atm_operation_calls_total Operations executed.",
+            "# TYPE atm_operation_calls_total counter",
+        ]
+        with self.lock:
+            for operation, n in sorted(self.calls.items()):
+                lines.append(f'atm_operation_calls_total{{operation="{operation}"}} {n}')
+
+            lines.append("# HELP atm_operation_outcomes_total Operations by outcome code.")
+            lines.append("# TYPE atm_operation_outcomes_total counter")
+            for (operation, outcome), n in sorted(self.outcomes.items()):
+                lines.append(f'atm_operation_outcomes_total{{operation="{operation}",'
+                             f'outcome="{outcome}"}} {n}')
+
+            lines.append("# HELP atm_operation_latency_seconds Operation latency.")
+            lines.append("# TYPE atm_operation_latency_seconds histogram")
+            for operation, histogram in sorted(self.latency.items()):
+                label = f'operation="{operation}"'
+                for bound, n in zip(EXPORT_BOUNDS_NS, histogram.cumulative(EXPORT_BOUNDS_NS)):
+                    lines.append(f'atm_operation_latency_seconds_bucket{{{label},'
+                                 f'le="{bound / 1e9:g}"}} {n}')
+                lines.append(f'atm_operation_latency_seconds_bucket{{{label},le="+Inf"}} '
+                             f'{histogram.count}')
+                lines.append(f"atm_operation_latency_seconds_sum{{{label}}} "
+                             f"{histogram.sum / 1e9:.9f}")
+                lines.append(f"atm_operation_latency_seconds_count{{{label}}} "
+                             f"{histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        """Write the text format atomically, e.g. for a node_exporter textfile collector"""
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus())
+        os.replace(temp_path, path)
+
+registry = Metrics()
+# (class, attribute, plain function, operation name) for every instrumented method
+_instrumented = []
+
+def _outcome(value):
+    code = getattr(value, "code", None)
+    if code is None:
+        code = getattr(value, "type", None)
+        if code is not None:
+            code = code.name
+    return code
+
+def _timed(func, operation):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter_ns()
+        try:
+            value = func(*args, **kwargs)
+        except Exception:
+            registry.observe(operation, time.perf_counter_ns() - start, "EXCEPTION")
+            raise
+        registry.observe(operation, time.perf_counter_ns() - start, _outcome(value))
+        return value
+    return wrapper
+
+class instrument:
+    """Method decorator recording calls, outcome and latency in the registry
+
+    The class keeps the plain function; ``registry.enable()`` swaps in the
+    timing wrapper.
+    """
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.func = None
+
+    def __call__(self, func):
+        self.func = func
+        return self
+
+    def __set_name__(self, owner, name):
+        _instrumented.append((owner, name, self.func, self.operation))
+        setattr(owner, name, _timed(self.func, self.operation) if registry.enabled
+                else self.func)
@@ -0,0 +1,77 @@
+"""
+Money handling for the Enhanced ATM Simulation.
+
+Amounts are integer cents everywhere: balances live in int64 columns (see
+accounts.py), ledger amounts and counters are ints, and Results carry
+cents. Dollars appear only at the edges, so this module converts there
+without going through floats:
+
+- ``parse_cents`` turns user text such as ``"12.50"`` into cents exactly,
+  rejecting fractions of a cent and anything but plain decimal digits
+- ``format_cents`` renders cents as ``"12.50"`` (or ``"1,234.50"``) by integer
+  division, never ``cents / 100``
+- ``total`` and ``totals_by_type`` sum int64 columns with NumPy when it is
+  installed, exact at any history size, and fall back to Python ints
+"""
+
+import re
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional
+    np = None
+
+AMOUNT = re.compile(r"(-?)([0-9]+)(?:\.([0-9]{1,2}))?\Z")
+FRACTION_OF_CENT = re.compile(r"-?[0-9]+\.[0-9]{3,}\Z")
+
+def parse_cents(text):
+    """Parse a dollar amount such as '12.50' into integer cents
+
+    Only plain digits with at most two decimals are accepted; exponents such
+    as '1e999999' are rejected before any arithmetic happens.
+    """
+    match = AMOUNT.match(str(text).strip())
+    if match is None:
+        if FRACTION_OF_CENT.match(str(text).strip()):
+            raise ValueError(f"Amount has fractions of a cent: {text!r}")
+        raise ValueError(f"Invalid amount: {text!r}")
+    sign, dollars, fraction = match.groups()
+    cents = int(dollars) * 100 + int((fraction or "").ljust(2, "0"))
+    return -cents if sign else cents
+
+def format_cents(cents, grouping=False):
+    """Dollars and cents of an integer amount, e.g. 123456 -> '1234.56'"""
+    dollars, rest = divmod(abs(cents), 100)
+    sign = "-" if cents < 0 else ""
+    return f"{sign}{dollars:,}.{rest:02d}" if grouping else f"{sign}{dollars}.{rest:02d}"
+
+def as_int64(column):
+    """Zero-copy int64 NumPy view of an array('q'); delete it before resizing the column"""
+    return np.frombuffer(column, dtype=np.int64)
+
+def total(column):
+    """Exact sum of an array('q') of cents"""
+    if np is None or not len(column):
+        return sum(column)
+    view = as_int64(column)
+    try:
+        return int(view.sum())
+    finally:
+        del view
+
+def totals_by_type(types, cents, type_count):
+    """Per-type (counts, sums) of parallel type/cents sequences, as lists of ints
+
+    Sums are accumulated in int64, not in the float64 that np.bincount's
+    weights would use, so they stay exact.
+    """
+    if np is None:
+        counts, sums = [0] * type_count, [0] * type_count
+        for tx_type, amount in zip(types, cents):
+            counts[tx_type] += 1
+            sums[tx_type] += amount
+        return counts, sums
+    types = np.asarray(types, dtype=np.intp)
+    sums = np.zeros(type_count, dtype=np.int64)
+    np.add.at(sums, types, np.asarray(cents, dtype=np.int64))
+    return np.bincount(types, minlength=type_count).tolist(), sums.tolist()
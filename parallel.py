@@ -0,0 +1,147 @@
+"""
+Multi-threaded execution for the Enhanced ATM Simulation.
+
+``ParallelRunner`` spreads batch operations over a thread pool. Operations
+are sharded by card, so each card's operations keep their order and its
+session stays on one thread, while different cards run side by side under
+the per-account locks in core.
+
+Run as a script it is a stress test: worker threads hammer a small set of
+shared accounts with overlapping sessions (the same card logged in on
+several threads) and the test then checks that
+
+- no balance went negative,
+- every account's balance equals its opening balance plus the effect of
+  its ledger records, and
+- the money in the bank equals the opening total plus deposits and
+  interest minus everything that left (withdrawals, quick cash, bills, fees).
+
+Usage: python parallel.py [--threads N] [--customers N] [--ops N] [--seed N]
+"""
+
+import argparse
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import core
+from batch import BatchRunner
+from ledger import BALANCE_SIGN, TxType
+from tools import make_bank
+
+class ParallelRunner:
+    """Runs batch operations on a thread pool, one shard of cards per worker"""
+
+    def __init__(self, bank, workers=4):
+        self.bank = bank
+        self.workers = workers
+        self.runners = [BatchRunner(bank) for _ in range(workers)]
+
+    @property
+    def codes(self):
+        codes = {}
+        for runner in self.runners:
+            for code, n in runner.codes.items():
+                codes[code] = codes.get(code, 0) + n
+        return codes
+
+    def run(self, operations):
+        """Execute every operation; returns (count, elapsed seconds)"""
+        shards = [[] for _ in range(self.workers)]
+        for op in operations:
+            shards[int(op["card"]) % self.workers].append(op)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            counts = list(pool.map(lambda shard: self.runners[shard[0]].run(shard[1])[0],
+                                   enumerate(shards)))
+        return sum(counts), time.perf_counter() - start
+
+def _hammer(bank, customers, ops, seed, violations):
+    """One worker: random operations on random shared cards"""
+    rng = random.Random(seed)
+    sessions = []
+    for customer in range(customers):
+        session = bank.open_session()
+        session.login(customer, "1234")
+        sessions.append(session)
+
+    store = bank.store
+    for _ in range(ops):
+        session = rng.choice(sessions)
+        session.account = store.first_account[session.customer] + rng.randrange(2)
+        roll = rng.random()
+        cents = rng.randrange(1, 40000)
+        if roll < 0.3:
+            session.transfer(session.account ^ 1, cents)
+        elif roll < 0.5:
+            session.withdraw(cents)
+        elif roll < 0.6:
+            session.quick_cash(rng.choice(core.QUICK_CASH_AMOUNTS))
+        elif roll < 0.75:
+            session.pay_bill(rng.choice(core.BILL_TYPES), cents)
+        else:
+            session.deposit(cents // 2)
+        if session.balance_of() < 0:
+            violations.append(session.account)
+
+def stress(threads=8, customers=4, ops=20000, seed=7):
+    """Run the stress test; returns a list of problems found (empty when sound)"""
+    # The stress test is about balances, not limits
+    bank = make_bank(customers, unlimited=True)
+    opening = list(bank.store.balance)
+
+    violations = []
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)  # switch threads as often as possible
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for future in [pool.submit(_hammer, bank, customers, ops, seed + i, violations)
+                           for i in range(threads)]:
+                future.result()
+    finally:
+        sys.setswitchinterval(previous)
+    elapsed = time.perf_counter() - start
+
+    problems = [f"negative balance seen on account {a}" for a in set(violations)]
+    balance, ledger = bank.store.balance, bank.ledger
+    expected = list(opening)
+    for tx in ledger:
+        expected[tx.account] += BALANCE_SIGN[tx.type] * tx.cents
+        if tx.type == TxType.TRANSFER:
+            expected[tx.peer] += tx.cents
+    for account, cents in enumerate(expected):
+        if balance[account] != cents:
+            problems.append(f"account {account}: balance {balance[account]}, ledger says {cents}")
+
+    inflow = ledger.total[TxType.DEPOSIT] + ledger.total[TxType.INTEREST]
+    outflow = sum(ledger.total[t] for t in (TxType.WITHDRAWAL, TxType.QUICK_CASH,
+                                            TxType.BILL_PAYMENT, TxType.FEE))
+    held, expected_total = bank.store.total(), sum(opening) + inflow - outflow
+    if held != expected_total:
+        problems.append(f"money not conserved: {held} held, {expected_total} expected")
+
+    print(f"{threads} threads x {ops} ops over {customers} customers: "
+          f"{len(ledger)} records in {elapsed:.2f}s ({threads * ops / elapsed:,.0f} ops/sec)")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress-test concurrent sessions")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--customers", type=int, default=4)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    problems = stress(args.threads, args.customers, args.ops, args.seed)
+    for problem in problems:
+        print(f"❌ {problem}")
+    if problems:
+        return 1
+    print("✅ Money conserved; no overdrafts")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
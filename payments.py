@@ -0,0 +1,191 @@
+"""
+Payees and scheduled bill payments for the Enhanced ATM Simulation.
+
+- **PayeeRegistry:** named payees, each filed under a spending category;
+  the five standard bill types are always registered first
+- **ScheduleBook:** one-off and recurring payment instructions in flat
+  columns (account, payee, amount, next due day, repeat interval, failed
+  attempts), indexed by account
+- **run_due_payments:** the end-of-day run. It selects every instruction
+  due by the given day, sorts them by account for locality and executes
+  them in one pass under a single hold of the locks, charging the bill
+  payment fee and recording every payment and fee in one bulk ledger
+  call. A payment that meets insufficient funds is retried on each
+  following run until ``max_attempts`` is reached; then a one-off
+  instruction is cancelled and a recurring one moves on to its next period.
+
+Benchmark: python -m tools.payments_bench
+"""
+
+import time
+from array import array
+
+from accounts import NO_ACCOUNT
+from categories import BILL_TYPES, OTHER_BILLS
+from ledger import TxType
+from money import np
+import interest
+import wal
+
+MAX_ATTEMPTS = 3
+
+class PayeeRegistry:
+    """Payee names and their spending categories, by payee id"""
+
+    def __init__(self):
+        self.names = []
+        self.categories = []
+        self.by_name = {}
+        # payee name -> spending category, consulted by categories.SpendingRollups
+        self.category_by_name = {}
+        for bill in BILL_TYPES:
+            self.add(bill, bill)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name, category=OTHER_BILLS):
+        """Register a payee and return its id; an existing name keeps its id"""
+        payee = self.by_name.get(name)
+        if payee is not None:
+            return payee
+        payee = len(self.names)
+        self.names.append(name)
+        self.categories.append(category)
+        self.by_name[name] = payee
+        self.category_by_name[name] = category
+        return payee
+
+    def find(self, name):
+        return self.by_name.get(name)
+
+class ScheduleBook:
+    """Payment instructions, indexed by instruction id"""
+
+    def __init__(self):
+        self.account = array("q")
+        self.payee = array("i")
+        self.cents = array("q")
+        self.next_day = array("i")  # date ordinal the payment is next due
+        self.interval = array("H")  # days between payments, 0 for a one-off
+        self.attempts = array("b")  # failed attempts for the current due date
+        self.active = array("b")
+        # account -> instruction ids
+        self.by_account = {}
+
+    def __len__(self):
+        return len(self.account)
+
+    def add(self, account, payee, cents, first_day, interval=0):
+        schedule = len(self.account)
+        self.account.append(account)
+        self.payee.append(payee)
+        self.cents.append(cents)
+        self.next_day.append(first_day)
+        self.interval.append(interval)
+        self.attempts.append(0)
+        self.active.append(1)
+        self.by_account.setdefault(account, []).append(schedule)
+        return schedule
+
+    def set_state(self, schedule, next_day, attempts, active):
+        self.next_day[schedule] = next_day
+        self.attempts[schedule] = attempts
+        self.active[schedule] = active
+
+    def of_accounts(self, accounts):
+        """Active instruction ids for the given accounts"""
+        return [s for a in accounts for s in self.by_account.get(a, ()) if self.active[s]]
+
+    def due(self, day):
+        """Active instruction ids due by day, ordered by account"""
+        if np is None or not len(self.account):
+            ids = [s for s in range(len(self.account))
+                   if self.active[s] and self.next_day[s] <= day]
+            ids.sort(key=self.account.__getitem__)
+            return ids
+        active = np.frombuffer(self.active, dtype=np.int8)
+        next_day = np.frombuffer(self.next_day, dtype=np.int32)
+        account = np.frombuffer(self.account, dtype=np.int64)
+        try:
+            ids = np.flatnonzero((active == 1) & (next_day <= day))
+            return ids[np.argsort(account[ids], kind="stable")].tolist()
+        finally:
+            del active, next_day, account
+
+class PaymentRun:
+    """Outcome of one end-of-day run"""
+
+    __slots__ = ("day", "due", "paid", "retried", "failed", "cents", "fees", "seconds")
+
+    def __init__(self, day):
+        self.day = day
+        self.due = self.paid = self.retried = self.failed = 0
+        self.cents = self.fees = 0
+        self.seconds = 0.0
+
+    @property
+    def rate(self):
+        """Instructions processed per second"""
+        return self.due / self.seconds if self.seconds else 0.0
+
+def run_due_payments(bank, day=None, max_attempts=MAX_ATTEMPTS):
+    """Execute every payment instruction due by day (default today)"""
+    # All accounts are locked once for the whole run rather than per payment
+    with bank.locks.hold_all(), bank.ledger.lock:
+        return make_due_payments(bank, day, max_attempts)
+
+def make_due_payments(bank, day=None, max_attempts=MAX_ATTEMPTS):
+    """run_due_payments for a caller already holding every account lock and the ledger lock"""
+    day = interest.today() if day is None else day
+    run = PaymentRun(day)
+    start = time.perf_counter()
+    schedules, payees = bank.schedules, bank.payees
+    store = bank.store
+    fee = bank.transaction_fee
+    entries, states = [], []
+
+    due = schedules.due(day)
+    run.due = len(due)
+    for schedule in due:
+        account = schedules.account[schedule]
+        cents = schedules.cents[schedule]
+        next_day = schedules.next_day[schedule]
+        interval = schedules.interval[schedule]
+        attempts, active = 0, 1
+
+        if store.balance[account] >= cents + fee:
+            store.debit(account, cents + fee)
+            entries.append((TxType.BILL_PAYMENT, account, cents, NO_ACCOUNT,
+                            payees.names[schedules.payee[schedule]]))
+            entries.append((TxType.FEE, account, fee, NO_ACCOUNT, "Scheduled payment fee"))
+            run.paid += 1
+            run.cents += cents
+            run.fees += fee
+            if interval:
+                next_day = max(next_day + interval, day + 1)
+            else:
+                active = 0
+        else:
+            attempts = schedules.attempts[schedule] + 1
+            if attempts < max_attempts:
+                run.retried += 1
+                next_day = day + 1
+            else:
+                run.failed += 1
+                attempts = 0
+                if interval:
+                    next_day = max(next_day + interval, day + 1)
+                else:
+                    active = 0
+
+        schedules.set_state(schedule, next_day, attempts, active)
+        states.append((schedule, next_day, attempts, active))
+
+    # One ledger call for the whole run, then the schedule states it settled
+    bank.ledger.extend(entries)
+    for state in states:
+        bank._journal(wal.SCHEDULE_STATE, *state)
+
+    run.seconds = time.perf_counter() - start
+    return run
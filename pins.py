@@ -0,0 +1,223 @@
+"""
+Hashed PIN store for the Enhanced ATM Simulation.
+
+PINs are never kept in the clear, in memory, in the write-ahead log or in
+snapshots. Each customer has a row of three columns:
+
+- a random 16-byte **salt**
+- the **work factor**: PBKDF2-HMAC-SHA256 iterations the hash was made with
+- the 32-byte **digest** of the PIN
+
+Digests are compared with ``hmac.compare_digest``. ``PinStore.iterations``
+is the work factor for new hashes. Raising it does not invalidate old rows:
+a row made with fewer iterations still verifies, and ``needs_rehash`` tells
+the caller to store the PIN again after the next successful login.
+
+Key derivation is deliberately slow, so two things keep logins fast:
+
+- **Auth cache:** after a successful verification the store remembers a
+  keyed HMAC of the PIN, under a secret made per process, for up to
+  ``cache_size`` customers (least recently used evicted). A repeat login is
+  then one HMAC; changing the PIN drops the entry.
+- **Worker pool:** ``verify_async`` runs the derivation on a thread pool.
+  hashlib releases the GIL while it derives, so verifications use every
+  core while an event loop (server.py) keeps serving other sessions.
+
+A 4-digit PIN has only 10,000 values, so no hash stops an attacker who has
+the digests and time; it keeps PINs out of logs, backups and memory dumps.
+Guessing at a terminal is stopped by the lockout after three failed
+attempts (core.Bank).
+
+Usage: python pins.py [--logins N] [--iterations N] [--workers N]
+       (logins/sec benchmark)
+"""
+
+import argparse
+import hashlib
+import hmac
+import os
+import sys
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+SALT_SIZE = 16
+DIGEST_SIZE = 32
+DEFAULT_ITERATIONS = 100000
+# Work factor for fixtures and benchmarks that create many customers but do
+# not measure authentication
+FAST_ITERATIONS = 1000
+AUTH_CACHE_SIZE = 100000
+
+def derive(pin, salt, iterations):
+    """PBKDF2-HMAC-SHA256 digest of a PIN"""
+    return hashlib.pbkdf2_hmac("sha256", pin.encode("ascii"), salt, iterations)
+
+def valid_pin(pin):
+    return len(pin) == 4 and pin.isdigit() and pin.isascii()
+
+class PinStore:
+    """Salted PIN digests per customer, with an auth cache and a verification pool"""
+
+    def __init__(self, iterations=DEFAULT_ITERATIONS, cache_size=AUTH_CACHE_SIZE, workers=None):
+        self.iterations = iterations
+        # Per-customer columns, indexed by customer id
+        self.salt = array("B")  # SALT_SIZE bytes per customer
+        self.digest = array("B")  # DIGEST_SIZE bytes per customer
+        self.rounds = array("I")  # iterations each digest was made with
+
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # customer -> HMAC of the verified PIN
+        self.cache_secret = os.urandom(32)
+        self.hits = self.derivations = 0
+        self.lock = threading.Lock()
+
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def _cache_tag(self, customer, pin):
+        message = customer.to_bytes(8, "little") + pin.encode("ascii")
+        return hmac.new(self.cache_secret, message, hashlib.sha256).digest()
+
+    def _row(self, customer):
+        with self.lock:
+            if not 0 <= customer < len(self.rounds):
+                raise KeyError(f"Unknown customer: {customer}")
+            salt = self.salt[customer * SALT_SIZE:(customer + 1) * SALT_SIZE].tobytes()
+            digest = self.digest[customer * DIGEST_SIZE:(customer + 1) * DIGEST_SIZE].tobytes()
+            return salt, self.rounds[customer], digest
+
+    # Writing
+
+    def load(self, customer, iterations, salt, digest):
+        """Store an already derived row, appending it for the next customer id"""
+        with self.lock:
+            if customer == len(self.rounds):
+                self.salt.frombytes(salt)
+                self.digest.frombytes(digest)
+                self.rounds.append(iterations)
+            else:
+                self.salt[customer * SALT_SIZE:(customer + 1) * SALT_SIZE] = array("B", salt)
+                self.digest[customer * DIGEST_SIZE:(customer + 1) * DIGEST_SIZE] = array("B", digest)
+                self.rounds[customer] = iterations
+            self.cache.pop(customer, None)
+
+    def make(self, pin):
+        """(iterations, salt, digest) for pin with a new salt; slow, takes no lock"""
+        if not valid_pin(pin):
+            raise ValueError("PIN must be exactly 4 digits")
+        salt = os.urandom(SALT_SIZE)
+        return self.iterations, salt, derive(pin, salt, self.iterations)
+
+    def set(self, customer, pin):
+        """Hash pin for customer (or the next customer id); returns the stored row"""
+        row = self.make(pin)
+        self.load(customer, *row)
+        return row
+
+    def needs_rehash(self, customer):
+        """True when the customer's digest was made with fewer iterations than now used"""
+        return self.rounds[customer] < self.iterations
+
+    # Verification
+
+    def verify(self, customer, pin):
+        """True if pin is the customer's PIN; KeyError for an unknown customer"""
+        salt, iterations, digest = self._row(customer)
+        if not valid_pin(pin):
+            return False
+        tag = self._cache_tag(customer, pin)
+        with self.lock:
+            cached = self.cache.get(customer)
+            if cached is not None:
+                self.cache.move_to_end(customer)
+                self.hits += 1
+        if cached is not None:
+            # Only the current PIN is ever cached, so a mismatch is a wrong PIN
+            return hmac.compare_digest(tag, cached)
+
+        with self.lock:
+            self.derivations += 1
+        if not hmac.compare_digest(derive(pin, salt, iterations), digest):
+            return False
+        with self.lock:
+            # Skip caching if the PIN changed while deriving
+            if self._matches_row(customer, salt):
+                self.cache[customer] = tag
+                if len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return True
+
+    def _matches_row(self, customer, salt):
+        return self.salt[customer * SALT_SIZE:(customer + 1) * SALT_SIZE].tobytes() == salt
+
+    def verify_async(self, customer, pin):
+        """verify() on the worker pool; returns a concurrent.futures.Future"""
+        if self.pool is None:
+            with self.lock:
+                if self.pool is None:
+                    self.pool = ThreadPoolExecutor(max_workers=self.workers,
+                                                   thread_name_prefix="pin-verify")
+        return self.pool.submit(self.verify, customer, pin)
+
+    def forget(self, customer=None):
+        """Drop one customer's auth cache entry, or all of them"""
+        with self.lock:
+            if customer is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(customer, None)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def nbytes(self):
+        return sum(c.itemsize * len(c) for c in (self.salt, self.digest, self.rounds))
+
+def _run(store, logins, workers):
+    """Verify logins (customer, pin) pairs on workers threads; returns seconds"""
+    start = time.perf_counter()
+    if workers == 1:
+        for customer, pin in logins:
+            store.verify(customer, pin)
+    else:
+        futures = [store.verify_async(customer, pin) for customer, pin in logins]
+        for future in futures:
+            future.result()
+    return time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark hashed PIN verification")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    cores = os.cpu_count() or 1
+    print(f"PBKDF2-HMAC-SHA256, {args.iterations:,} iterations, {cores} core(s)")
+    for workers in sorted({1, args.workers}):
+        store = PinStore(args.iterations, workers=workers)
+        for customer in range(args.logins):
+            store.set(customer, f"{customer % 10000:04d}")
+        logins = [(customer, f"{customer % 10000:04d}") for customer in range(args.logins)]
+        for label, pairs in (("first login", logins), ("cached login", logins),
+                             ("wrong PIN", [(c, "0000" if p != "0000" else "1111")
+                                            for c, p in logins])):
+            if label == "wrong PIN":
+                store.forget()
+            seconds = _run(store, pairs, workers)
+            rate = len(pairs) / seconds
+            print(f"{workers} worker(s), {label:<13} {rate:>12,.0f} logins/sec "
+                  f"({rate / min(workers, cores):,.0f} per core)")
+        store.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
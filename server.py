@@ -0,0 +1,302 @@
+"""
+asyncio TCP session server for the Enhanced ATM Simulation.
+
+One process serves many ATM terminals. Every connection gets its own core
+``Session`` in place of the interactive module's globals and talks a simple
+line protocol: one command per line in, one response line out.
+
+Commands (amounts in dollars):
+
+    LOGIN <card> <pin>          BALANCE
+    DEPOSIT <amount>            WITHDRAW <amount>
+    QUICK <amount>              TRANSFER <account> <amount>
+    BILL <payee> <amount>       SWITCH <account>
+    PIN <current> <new>         STATEMENT
+    MONTHLY                     INTEREST
+    LIMITS                      QUIT
+
+A state-changing command may end with ``KEY=<token>``, an idempotency key:
+a retry carrying the same key gets the original response without being
+executed again (see idempotency.py).
+
+PINs are verified on the PIN store's worker pool (pins.py), so a slow key
+derivation for one LOGIN does not hold up the other connections. Commands
+themselves run on the event loop's default executor: they may wait on
+account locks, a journal group commit or a PIN rehash. A connection still
+executes its commands one at a time, in order.
+
+Responses are ``<CODE> <json>``, e.g. ``OK {"amount": 10000, "balance": 110000}``.
+
+Usage:
+    python server.py [--host H] [--port P] [--customers N] [--data-dir DIR]
+                     [--pin-iterations N]
+    python server.py --load-test [--terminals N] [--ops N] [--pin-iterations N]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import core
+from money import parse_cents
+from history import HistoryFile, HISTORY_NAME
+from ledger import format_transaction
+from pins import DEFAULT_ITERATIONS, FAST_ITERATIONS
+from tools import make_bank
+from wal import WriteAheadLog
+
+MAX_LINE = 1024
+
+def _result_payload(result):
+    payload = {"message": result.message}
+    if result.amount:
+        payload["amount"] = result.amount
+    if result.fee:
+        payload["fee"] = result.fee
+    if result.balance is not None:
+        payload["balance"] = result.balance
+    return payload
+
+def handle_command(session, line, verified=None):
+    """Execute one protocol line against a session; returns (code, payload)
+
+    verified is the already computed PIN check of a LOGIN line.
+    """
+    parts = line.split()
+    if not parts:
+        return core.INVALID_CHOICE, {"message": "Empty command."}
+    command, args = parts[0].upper(), parts[1:]
+    keyed = {}
+    if args and args[-1].upper().startswith("KEY="):
+        keyed["key"] = args.pop()[4:]
+
+    try:
+        if command == "LOGIN":
+            result = session.login(int(args[0]), args[1], verified)
+        elif command == "BALANCE":
+            result = session.balances()
+            if result.ok:
+                return result.code, {"balance": result.balance,
+                                     "accounts": {str(a): b for a, b in result.data}}
+        elif command == "DEPOSIT":
+            result = session.deposit(parse_cents(args[0]), **keyed)
+        elif command == "WITHDRAW":
+            result = session.withdraw(parse_cents(args[0]), **keyed)
+        elif command == "QUICK":
+            result = session.quick_cash(parse_cents(args[0]), **keyed)
+        elif command == "TRANSFER":
+            result = session.transfer(int(args[0]), parse_cents(args[1]), **keyed)
+        elif command == "BILL":
+            # Payees are numbered from 1 in registration order, the bill types first
+            names = session.bank.payees.names
+            payee = int(args[0])
+            if not 1 <= payee <= len(names):
+                return core.INVALID_CHOICE, {"message": f"Unknown payee {payee}."}
+            result = session.pay_bill(names[payee - 1], parse_cents(args[1]), **keyed)
+        elif command == "SWITCH":
+            result = session.switch_account(int(args[0]))
+        elif command == "PIN":
+            result = session.change_pin(args[0], args[1], args[1], **keyed)
+        elif command == "STATEMENT":
+            result = session.mini_statement()
+            if result.ok:
+                return result.code, {"transactions": [format_transaction(tx) for tx in result.data]}
+        elif command == "MONTHLY":
+            result = session.monthly_statement()
+            if result.ok:
+                summary = {t.name: list(v) for t, v in result.data["summary"].items() if v[0]}
+                spending = {c: v[0] for c, v in result.data["categories"].items() if v[0]}
+                return result.code, {"balance": result.balance, "summary": summary,
+                                     "spending": spending}
+        elif command == "INTEREST":
+            result = session.calculate_interest()
+        elif command == "LIMITS":
+            result = session.daily_limits()
+            if result.ok:
+                return result.code, result.data
+        else:
+            return core.INVALID_CHOICE, {"message": f"Unknown command {command}."}
+    except (IndexError, ValueError):
+        return core.INVALID_CHOICE, {"message": f"Bad arguments for {command}."}
+
+    return result.code, _result_payload(result)
+
+class ATMServer:
+    """Serves the line protocol, one core Session per connection"""
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.server = None
+        self.ticker = None
+        self.connections = 0
+        self.commands = 0
+
+    async def start(self, host="127.0.0.1", port=0):
+        self.server = await asyncio.start_server(self._serve, host, port, limit=MAX_LINE,
+                                                 backlog=4096)
+        self.ticker = asyncio.create_task(self._tick())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.ticker.cancel()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _tick(self):
+        """Expire idle sessions, lockouts and failed PIN attempts as they fall due
+
+        The tick may commit an overdue journal group, so it runs on a worker
+        thread like the commands do.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await loop.run_in_executor(None, self.bank.tick)
+            await asyncio.sleep(self.bank.timers.resolution)
+
+    async def _serve(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        session = self.bank.open_session()
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not line:
+                    break
+                text = line.decode("utf-8", "replace").strip()
+                if text.upper() == "QUIT":
+                    writer.write(b'OK {"message": "Goodbye!"}\n')
+                    await writer.drain()
+                    break
+                verified = await self._verify_login(text)
+                # Commands wait on account locks, the journal's group commit
+                # (write and fsync) and PIN rehashing, none of which may hold
+                # up the other connections
+                code, payload = await loop.run_in_executor(None, handle_command, session,
+                                                           text, verified)
+                self.commands += 1
+                writer.write(f"{code} {json.dumps(payload)}\n".encode("utf-8"))
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def _verify_login(self, text):
+        """Check a LOGIN line's PIN on the worker pool; None if it is not one to check"""
+        parts = text.split()
+        if len(parts) < 3 or parts[0].upper() != "LOGIN":
+            return None
+        bank = self.bank
+        try:
+            card = int(parts[1])
+            bank.store.check_customer(card)
+        except (KeyError, ValueError):
+            return None
+        if bank.lockout_remaining(card):
+            return None
+        return await asyncio.wrap_future(bank.pins.verify_async(card, parts[2]))
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))) - 1))
+    return sorted_values[rank]
+
+async def _terminal(port, card, ops, rng, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port, limit=MAX_LINE)
+    commands = [f"LOGIN {card} 1234"]
+    for _ in range(ops):
+        commands.append(rng.choice((
+            "BALANCE", "DEPOSIT 50", "WITHDRAW 20", "QUICK 40",
+            f"TRANSFER {2 * card + 1} 10", "BILL 2 15", "STATEMENT",
+        )))
+    commands.append("QUIT")
+    for command in commands:
+        start = time.perf_counter()
+        writer.write(command.encode("utf-8") + b"\n")
+        await writer.drain()
+        response = await reader.readline()
+        latencies.append(time.perf_counter() - start)
+        if not response:
+            break
+    writer.close()
+
+async def load_test(terminals=500, ops=20, seed=7, pin_iterations=FAST_ITERATIONS):
+    """Drive many simulated terminals against a loopback server"""
+    bank = make_bank(terminals, pin_iterations=pin_iterations)
+    server = ATMServer(bank)
+    port = await server.start()
+
+    rng = random.Random(seed)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(_terminal(port, card, ops, random.Random(rng.random()), latencies)
+                           for card in range(terminals)))
+    elapsed = time.perf_counter() - start
+    await server.stop()
+    bank.pins.close()
+
+    latencies.sort()
+    print(f"{terminals} terminals, {len(latencies)} requests in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:,.0f} req/sec)")
+    print(f"latency p50 {percentile(latencies, 50) * 1000:.2f} ms, "
+          f"p99 {percentile(latencies, 99) * 1000:.2f} ms, "
+          f"max {latencies[-1] * 1000:.2f} ms")
+    return len(latencies) / elapsed
+
+async def serve(args):
+    bank = core.Bank(pin_iterations=args.pin_iterations or DEFAULT_ITERATIONS)
+    journal = None
+    if args.data_dir:
+        journal = WriteAheadLog(args.data_dir)
+        recovered = journal.recover(bank)
+        print(f"Recovered {recovered} log records in {journal.recovery_seconds * 1000:.1f} ms")
+        journal.attach(bank)
+        bank.attach_history(HistoryFile(os.path.join(args.data_dir, HISTORY_NAME), bank.store))
+    while bank.store.customer_count < args.customers:
+        bank.add_customer("1234", savings=100000, checking=50000)
+
+    server = ATMServer(bank)
+    port = await server.start(args.host, args.port)
+    print(f"🏦 ATM server listening on {args.host}:{port}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        bank.pins.close()
+        if journal is not None:
+            journal.close()
+            bank.history.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve ATM sessions over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--customers", type=int, default=1)
+    parser.add_argument("--data-dir", help="recover from and journal to this directory")
+    parser.add_argument("--load-test", action="store_true",
+                        help="run a loopback throughput/latency test and exit")
+    parser.add_argument("--terminals", type=int, default=500)
+    parser.add_argument("--ops", type=int, default=20)
+    parser.add_argument("--pin-iterations", type=int,
+                        help="PIN hashing work factor (load test default: "
+                             f"{FAST_ITERATIONS}, server default: {DEFAULT_ITERATIONS})")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.load_test:
+            asyncio.run(load_test(args.terminals, args.ops,
+                                  pin_iterations=args.pin_iterations or FAST_ITERATIONS))
+        else:
+            asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,114 @@
+"""
+Hierarchical timer wheel for session and lockout expiry.
+
+Timers are hashed into wheels of ``slots`` buckets by their deadline tick.
+Level 0 holds timers due within ``slots`` ticks, level 1 within
+``slots**2`` ticks and so on; a bucket of a higher level is redistributed
+("cascaded") into the level below when the wheel reaches it, and timers
+beyond the top level wait in an overflow list. Scheduling and cancelling
+are O(1), and advancing one tick touches only the timers that expire or
+cascade in that tick -- never every pending timer.
+
+With the defaults (1 s ticks, 64 slots, 4 levels) the wheels span about
+194 days.
+"""
+
+import math
+import threading
+import time
+
+class Timer:
+    """A scheduled callback; cancel() is O(1), the entry is dropped when reached"""
+
+    __slots__ = ("tick", "callback", "args", "cancelled")
+
+    def __init__(self, tick, callback, args):
+        self.tick = tick
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class TimerWheel:
+    """Hierarchical hashed timer wheel driven by advance()"""
+
+    def __init__(self, resolution=1.0, slots=64, levels=4, clock=time.time):
+        if slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.resolution = resolution
+        self.bits = slots.bit_length() - 1
+        self.mask = slots - 1
+        self.levels = levels
+        self.clock = clock
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.overflow = []
+        self.current = int(clock() / resolution)
+        self.pending = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        """Timers scheduled and not yet fired (cancelled ones included until reached)"""
+        return self.pending
+
+    def schedule(self, deadline, callback, *args):
+        """Call callback(*args) at the first tick at or after the deadline (epoch seconds)"""
+        with self.lock:
+            tick = max(math.ceil(deadline / self.resolution), self.current + 1)
+            timer = Timer(tick, callback, args)
+            self._place(timer)
+            self.pending += 1
+        return timer
+
+    def _place(self, timer):
+        delta = timer.tick - self.current
+        if delta <= 0:
+            # Due in the tick being processed
+            self.wheels[0][self.current & self.mask].append(timer)
+            return
+        for level in range(self.levels):
+            if delta >> (self.bits * (level + 1)) == 0:
+                self.wheels[level][(timer.tick >> (self.bits * level)) & self.mask].append(timer)
+                return
+        self.overflow.append(timer)
+
+    def _cascade(self, level):
+        wheel = self.wheels[level]
+        slot = (self.current >> (self.bits * level)) & self.mask
+        timers, wheel[slot] = wheel[slot], []
+        for timer in timers:
+            if timer.cancelled:
+                self.pending -= 1
+            else:
+                self._place(timer)
+
+    def advance(self, now=None):
+        """Fire every timer due by now; returns the number fired"""
+        target = int((self.clock() if now is None else now) / self.resolution)
+        due = []
+        with self.lock:
+            while self.current < target:
+                self.current += 1
+                tick = self.current
+
+                # Find the highest level whose period starts at this tick
+                top = 0
+                while top < self.levels and not tick & ((1 << (self.bits * (top + 1))) - 1):
+                    top += 1
+                if top == self.levels:
+                    timers, self.overflow = self.overflow, []
+                    for timer in timers:
+                        self._place(timer)
+                    top -= 1
+                for level in range(top, 0, -1):
+                    self._cascade(level)
+
+                slot = tick & self.mask
+                timers, self.wheels[0][slot] = self.wheels[0][slot], []
+                self.pending -= len(timers)
+                due.extend(timer for timer in timers if not timer.cancelled)
+
+        for timer in due:
+            timer.callback(*timer.args)
+        return len(due)
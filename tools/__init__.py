@@ -0,0 +1,35 @@
+"""
+Benchmark and self-check drivers for the Enhanced ATM Simulation.
+
+Drivers that need a whole bank live here rather than in the modules core
+imports, so those modules never import core back. Run each from the project
+directory as ``python -m tools.<name>``:
+
+- ``wal_bench``: write-ahead log commit throughput and recovery time
+- ``eod_bench``: the sharded end-of-day pipeline
+- ``payments_bench``: the end-of-day scheduled payment run
+- ``idempotency_check``: duplicate-heavy retried traffic must execute once
+
+``make_bank`` builds the bank they (and bench.py, parallel.py, workload.py
+and the server load test) start from.
+"""
+
+from pins import FAST_ITERATIONS
+import core
+
+def make_bank(customers=0, savings=100000, checking=50000, unlimited=False, pin="1234",
+              **options):
+    """A Bank for benchmarks and self-checks, with customers already added
+
+    PINs are hashed at pins.FAST_ITERATIONS unless pin_iterations is given.
+    unlimited lifts the withdrawal and deposit limits and turns the fraud
+    rules off, for loops that would trip them. Other options go to Bank.
+    """
+    options.setdefault("pin_iterations", FAST_ITERATIONS)
+    bank = core.Bank(**options)
+    if unlimited:
+        bank.daily_withdrawal_limit = bank.deposit_limit = 10 ** 15
+        bank.fraud.enabled = False
+    for _ in range(customers):
+        bank.add_customer(pin, savings=savings, checking=checking)
+    return bank
@@ -0,0 +1,69 @@
+"""
+End-of-day pipeline benchmark for the Enhanced ATM Simulation.
+
+Builds a bank of random balances, interest days and withdrawal usage, then
+runs the same end of day on a fresh copy of it with one worker and with
+``--workers``, reporting accounts/sec and the time spent computing shards.
+
+Usage: python -m tools.eod_bench [--customers N] [--workers N] [--shards N]
+                                 [--month-end]
+"""
+
+import argparse
+import datetime
+import random
+import sys
+import time
+from array import array
+
+from eod import run_end_of_day
+from money import format_cents
+from tools import make_bank
+import interest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the end-of-day pipeline")
+    parser.add_argument("--customers", type=int, default=200000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--shards", type=int, default=None)
+    parser.add_argument("--month-end", action="store_true",
+                        help="run for the last day of this month, so fees are assessed")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    bank = make_bank()
+    today = interest.today()
+    for _ in range(args.customers):
+        customer = bank.add_customer("1234", savings=rng.randrange(10 ** 7),
+                                     checking=rng.randrange(30000))
+        savings = bank.store.first_account[customer]
+        bank.store.interest_day[savings] = today - rng.choice((1, 1, 1, 2, 30))
+        bank.limits.record(customer, rng.randrange(50000), time.time() - 86400)
+
+    # Each configuration runs on a fresh copy of the same state
+    state = {name: column[:] for name, column in vars(bank.store).items()
+             if isinstance(column, array)}
+    limit_state = (bank.limits.day[:], bank.limits.day_used[:])
+    day = today
+    if args.month_end:
+        next_month = (datetime.date.today().replace(day=28) + datetime.timedelta(days=4))
+        day = next_month.replace(day=1).toordinal() - 1
+
+    for workers in sorted({1, args.workers}):
+        for name, column in state.items():
+            setattr(bank.store, name, column[:])
+        bank.limits.day, bank.limits.day_used = limit_state[0][:], limit_state[1][:]
+        bank.fee_month = -1
+        report = run_end_of_day(bank, day, workers=workers, shards=args.shards)
+        print(f"{workers} worker(s), {report.shards} shard(s): {report.accounts:,} accounts "
+              f"in {report.seconds:.3f}s ({report.rate:,.0f} accounts/sec, "
+              f"{report.compute_seconds:.3f}s computing)")
+    print(f"  interest: ${format_cents(report.interest_cents, grouping=True)} "
+          f"to {report.interest_accounts:,} accounts; limits reset: {report.limits_reset:,}; "
+          f"fees: {report.fee_accounts:,}; low balance: {len(report.low_balance):,}, "
+          f"very low: {len(report.very_low_balance):,}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Idempotency self-check for the Enhanced ATM Simulation.
+
+Duplicate-heavy traffic, with retries both delayed and concurrent on
+several threads, must leave exactly the balances and ledger that executing
+each operation once leaves.
+
+Usage: python -m tools.idempotency_check [--customers N] [--ops N] [--threads N]
+                                         [--seed N]
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from tools import make_bank
+import core
+
+def _operations(rng, customers, count):
+    """(customer, key, method, args) for count distinct keyed operations"""
+    ops = []
+    for n in range(count):
+        customer = rng.randrange(customers)
+        roll = rng.random()
+        if roll < 0.3:
+            op = ("deposit", (rng.randrange(100, 5000),))
+        elif roll < 0.6:
+            op = ("withdraw", (rng.randrange(1, 10) * 1000,))
+        elif roll < 0.8:
+            op = ("transfer", (None, rng.randrange(100, 5000)))
+        else:
+            op = ("pay_bill", (rng.choice(core.BILL_TYPES), rng.randrange(100, 5000)))
+        ops.append((customer, f"op-{n}", *op))
+    return ops
+
+def _execute(bank, sessions, customer, key, method, args):
+    session = sessions.get(customer)
+    if session is None:
+        session = sessions[customer] = bank.open_session()
+        session.login(customer, "1234")
+    if method == "transfer":
+        args = (bank.store.last_account[customer], args[1])
+    return getattr(session, method)(*args, key=key)
+
+def _replay(bank, traffic):
+    sessions = {}
+    return [_execute(bank, sessions, *op) for op in traffic]
+
+def self_check(customers=50, ops=20000, threads=4, seed=7):
+    """Replay duplicate-heavy traffic; returns a list of problems (empty when sound)"""
+    rng = random.Random(seed)
+    unique = _operations(rng, customers, ops)
+
+    # The check is about duplicates, not limits
+    reference = make_bank(customers, 10 ** 9, 10 ** 9, unlimited=True)
+    expected = _replay(reference, unique)
+
+    # Every operation one to four times; retries land up to 50 operations later
+    traffic = []
+    for position, op in enumerate(unique):
+        traffic.append((position, op))
+        for _ in range(rng.choice((0, 1, 1, 2, 3))):
+            traffic.append((position + rng.random() * 50, op))
+    traffic.sort(key=lambda item: item[0])
+    traffic = [op for _, op in traffic]
+
+    problems = []
+    bank = make_bank(customers, 10 ** 9, 10 ** 9, unlimited=True)
+    start = time.perf_counter()
+    results = _replay(bank, traffic)
+    elapsed = time.perf_counter() - start
+    first = {}
+    for op, result in zip(traffic, results):
+        if first.setdefault(op[1], result) is not result:
+            problems.append(f"retry of {op[1]} returned a different result")
+    for op, result in zip(unique, expected):
+        if first[op[1]].as_dict() != result.as_dict():
+            problems.append(f"{op[1]}: {first[op[1]]!r}, executed once: {result!r}")
+    if list(bank.store.balance) != list(reference.store.balance):
+        problems.append("balances differ from executing each operation once")
+    if len(bank.ledger) != len(reference.ledger):
+        problems.append(f"{len(bank.ledger)} ledger records, {len(reference.ledger)} expected")
+    cache = bank.idempotency
+    print(f"{len(traffic):,} calls for {ops:,} operations in {elapsed:.2f}s: "
+          f"hit rate {cache.hit_rate:.1%}, {len(cache):,} keys cached")
+
+    # The same traffic on several threads at once, each with its own sessions
+    bank = make_bank(customers, 10 ** 9, 10 ** 9, unlimited=True)
+    workers = [threading.Thread(target=_replay, args=(bank, traffic)) for _ in range(threads)]
+    previous = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    finally:
+        sys.setswitchinterval(previous)
+    if bank.store.total() != reference.store.total():
+        problems.append("concurrent retries: money in the bank differs")
+    if len(bank.ledger) != len(reference.ledger):
+        problems.append(f"concurrent retries: {len(bank.ledger)} ledger records, "
+                        f"{len(reference.ledger)} expected")
+    cache = bank.idempotency
+    print(f"{threads} threads x {len(traffic):,} calls: hit rate {cache.hit_rate:.1%}, "
+          f"{cache.waits:,} waited for a call in flight")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay duplicate-heavy traffic")
+    parser.add_argument("--customers", type=int, default=50)
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    problems = self_check(args.customers, args.ops, args.threads, args.seed)
+    for problem in problems[:20]:
+        print(f"❌ {problem}")
+    if problems:
+        return 1
+    print("✅ Every operation executed exactly once")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,48 @@
+"""
+Scheduled payment benchmark for the Enhanced ATM Simulation.
+
+Schedules payments across customers, some of them without the money to
+pay, and times two end-of-day runs: the first pays or defers everything
+due, the second retries the underfunded ones.
+
+Usage: python -m tools.payments_bench [--customers N] [--schedules N]
+                                      [--underfunded F]
+"""
+
+import argparse
+import random
+import sys
+
+from tools import make_bank
+import interest
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the end-of-day payment run")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--schedules", type=int, default=100000)
+    parser.add_argument("--underfunded", type=float, default=0.1,
+                        help="fraction of customers without enough money to pay")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    bank = make_bank()
+    for _ in range(args.customers):
+        funded = rng.random() >= args.underfunded
+        bank.add_customer("1234", savings=100000, checking=10 ** 9 if funded else 500)
+    today = interest.today()
+    checking_accounts = [bank.store.last_account[c] for c in range(args.customers)]
+    for _ in range(args.schedules):
+        bank.schedule_payment(rng.choice(checking_accounts), rng.randrange(len(bank.payees)),
+                              rng.randrange(1000, 20000), today - rng.randrange(3),
+                              rng.choice((0, 7, 30)))
+
+    for day in (today, today + 1):
+        run = bank.run_scheduled_payments(day).data
+        print(f"Day {day - today}: {run.due:,} due, {run.paid:,} paid, {run.retried:,} to retry, "
+              f"{run.failed:,} failed in {run.seconds:.3f}s "
+              f"({run.rate / 1000:,.1f}k payments/sec)")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+"""
+Write-ahead log and snapshots for the Enhanced ATM Simulation.
+
+Every state change the bank makes is appended to ``wal.log`` as a small
+binary record, so balances, PIN hashes, lockouts and history survive a
+crash or restart. PINs are journaled only as salted hashes (pins.py).
+
+- **Records:** ``<length, lsn, crc32>`` header followed by a packed payload;
+  a torn or corrupt tail is detected by the CRC and cut off on recovery
+- **Group commit:** records are buffered and written (and optionally fsync'ed)
+  once ``group_size`` records are pending or the oldest has waited
+  ``group_interval`` seconds, trading a bounded window of recent records for
+  throughput. Groups are only committed at operation boundaries, when the
+  bank releases the ledger lock (ledger.OperationLock), so the log never ends
+  halfway through an operation; ``Bank.tick()`` commits a group left
+  pending by an idle terminal
+- **Snapshots:** every ``snapshot_every`` records, at the next operation
+  boundary, the account columns, the PIN hashes and authentication state,
+  payees, payment schedules, the fraud rules' sliding windows and the
+  ledger counters/recent window are written to ``snapshot.bin`` and the log
+  is truncated, so startup replays only the tail
+
+Benchmark: python -m tools.wal_bench
+"""
+
+import datetime
+import os
+import pickle
+import struct
+import time
+import zlib
+from array import array
+
+from accounts import SAVINGS
+from categories import CATEGORIES
+from ledger import BALANCE_SIGN, Transaction, TxType
+from pins import DIGEST_SIZE, SALT_SIZE
+
+# Record kinds
+TX = 1
+ADD_CUSTOMER = 2
+OPEN_ACCOUNT = 3
+PIN_HASH = 4
+AUTH = 5
+INTEREST_DAY = 6
+ACCRUAL_RUN = 7
+PAYEE = 8
+SCHEDULE = 9
+SCHEDULE_STATE = 10
+FEE_MONTH = 11
+
+HEADER = struct.Struct("<IQI")  # payload length, lsn, crc32 of payload
+PAYLOADS = {
+    TX: struct.Struct("<BbqqdqH"),  # + memo bytes
+    ADD_CUSTOMER: struct.Struct("<B"),
+    OPEN_ACCOUNT: struct.Struct("<Bqbqi"),
+    PIN_HASH: struct.Struct(f"<BqI{SALT_SIZE}s{DIGEST_SIZE}s"),
+    AUTH: struct.Struct("<Bqbd"),
+    INTEREST_DAY: struct.Struct("<Bqi"),
+    ACCRUAL_RUN: struct.Struct("<Bi"),
+    PAYEE: struct.Struct("<BbH"),  # + name bytes
+    SCHEDULE: struct.Struct("<BqiqiH"),
+    SCHEDULE_STATE: struct.Struct("<Biib?"),
+    FEE_MONTH: struct.Struct("<Bi"),
+}
+
+LOG_NAME = "wal.log"
+SNAPSHOT_NAME = "snapshot.bin"
+
+class WriteAheadLog:
+    """Append-only journal of bank state changes with group commit"""
+
+    def __init__(self, directory, group_size=64, group_interval=0.05,
+                 fsync=True, snapshot_every=100000):
+        self.directory = directory
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.fsync = fsync
+        self.snapshot_every = snapshot_every
+
+        os.makedirs(directory, exist_ok=True)
+        self.log_path = os.path.join(directory, LOG_NAME)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self.file = None
+        self.bank = None
+
+        self.lsn = 0
+        self.pending = bytearray()
+        self.pending_count = 0
+        self.first_pending = 0.0  # perf_counter() when the oldest pending record came in
+        self.last_commit = time.perf_counter()
+        self.since_snapshot = 0
+        self.snapshot_due = False
+
+        # Statistics
+        self.records_written = 0
+        self.commits = 0
+        self.bytes_written = 0
+        self.commit_seconds = 0.0
+        self.recovered_records = 0
+        self.recovery_seconds = 0.0
+
+    # Writing
+
+    def attach(self, bank):
+        """Journal everything the bank does from now on"""
+        self.bank = bank
+        bank.journal = self
+        bank.ledger.subscribe(self.log_transaction)
+        bank.ledger.lock.on_release.append(self.boundary)
+        if self.file is None:
+            self.file = open(self.log_path, "ab")
+
+    def log_transaction(self, tx):
+        memo = tx.memo.encode("utf-8") if tx.memo else b""
+        self.append(TX, int(tx.type), tx.account, tx.cents, tx.ts, tx.peer, len(memo), tail=memo)
+
+    def append(self, kind, *fields, tail=b""):
+        """Buffer one record; the bank calls this holding the ledger lock"""
+        payload = PAYLOADS[kind].pack(kind, *fields) + tail
+        self.lsn += 1
+        if not self.pending:
+            self.first_pending = time.perf_counter()
+        self.pending += HEADER.pack(len(payload), self.lsn, zlib.crc32(payload))
+        self.pending += payload
+        self.pending_count += 1
+        self.since_snapshot += 1
+        if self.since_snapshot >= self.snapshot_every:
+            self.snapshot_due = True
+        if self.bank is None and self._commit_due():
+            self.commit()  # no operation boundaries without a bank
+
+    def _commit_due(self):
+        return self.pending and (self.pending_count >= self.group_size
+                                 or time.perf_counter() - self.first_pending >= self.group_interval)
+
+    def boundary(self):
+        """Ledger lock hook: an operation has been applied and fully journaled
+
+        Snapshots and group commits happen only here, so a snapshot never
+        holds half an operation whose other records the log would replay.
+        """
+        if self.file is None:
+            return
+        if self.snapshot_due:
+            self.snapshot()
+        elif self._commit_due():
+            self.commit()
+
+    def commit_due(self):
+        """Commit a group that has waited group_interval; called from Bank.tick()"""
+        if self.pending and time.perf_counter() - self.first_pending >= self.group_interval:
+            with self.bank.ledger.lock:
+                self.commit()
+
+    def commit(self):
+        """Write the pending group to disk and fsync it if configured"""
+        start = time.perf_counter()
+        if self.pending:
+            self.file.write(self.pending)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+            self.bytes_written += len(self.pending)
+            self.records_written += self.pending_count
+            self.commits += 1
+            self.pending.clear()
+            self.pending_count = 0
+        self.last_commit = time.perf_counter()
+        self.commit_seconds += self.last_commit - start
+
+    def snapshot(self):
+        """Write a snapshot of the attached bank and truncate the log"""
+        with self.bank.ledger.lock:
+            self._snapshot()
+
+    def _snapshot(self):
+        self.commit()
+        bank = self.bank
+        store, ledger = bank.store, bank.ledger
+        state = {
+            "lsn": self.lsn,
+            "store": {name: column.tobytes() for name, column in vars(store).items()
+                      if isinstance(column, array)},
+            "pins": {name: column.tobytes() for name, column in vars(bank.pins).items()
+                     if isinstance(column, array)},
+            "auth": {"pin_attempts": bank.pin_attempts.tobytes(),
+                     "lockout_time": bank.lockout_time.tobytes()},
+            "limits": {name: column.tobytes() for name, column in vars(bank.limits).items()
+                       if isinstance(column, array)},
+            "spending": {
+                "monthly": {k: r.tobytes() for k, r in bank.spending.monthly.items()},
+                "daily": {k: r.tobytes() for k, r in bank.spending.daily.items()},
+            },
+            "payees": list(zip(bank.payees.names, bank.payees.categories)),
+            "schedules": {name: column.tobytes() for name, column in vars(bank.schedules).items()
+                          if isinstance(column, array)},
+            "fee_month": bank.fee_month,
+            "fraud": bank.fraud.state(),
+            "ledger": {
+                "count": ledger.count.tobytes(),
+                "total": ledger.total.tobytes(),
+                "account_stats": {a: s.tobytes() for a, s in ledger.account_stats.items()},
+                "recent": [(int(tx.type), tx.account, tx.cents, tx.ts, tx.peer, tx.memo,
+                            tx.prev, tx.peer_prev) for tx in ledger.recent_window],
+                "base": ledger.appended - len(ledger.recent_window),
+                "last_position": ledger.last_position,
+            },
+        }
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.snapshot_path)
+
+        # Records up to self.lsn are in the snapshot; recovery skips them anyway
+        self.file.truncate(0)
+        self.file.seek(0)
+        self.since_snapshot = 0
+        self.snapshot_due = False
+
+    def close(self):
+        if self.file is not None:
+            self.commit()
+            self.file.close()
+            self.file = None
+        if self.bank is not None:
+            self.bank.ledger.unsubscribe(self.log_transaction)
+            self.bank.ledger.lock.on_release.remove(self.boundary)
+            self.bank.journal = None
+            self.bank = None
+
+    def stats(self):
+        seconds = self.commit_seconds
+        return {
+            "records": self.records_written,
+            "commits": self.commits,
+            "bytes": self.bytes_written,
+            "records_per_commit": self.records_written / self.commits if self.commits else 0.0,
+            "commit_seconds": seconds,
+            "records_per_sec": self.records_written / seconds if seconds else 0.0,
+            "recovered_records": self.recovered_records,
+            "recovery_seconds": self.recovery_seconds,
+        }
+
+    # Recovery
+
+    def recover(self, bank):
+        """Load the snapshot and replay the log tail into an empty bank
+
+        Returns the number of log records replayed. Must run before attach().
+        """
+        start = time.perf_counter()
+        snapshot_lsn = self._load_snapshot(bank)
+        self.lsn = snapshot_lsn
+
+        replayed = 0
+        valid_end = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                data = f.read()
+            offset = 0
+            while offset + HEADER.size <= len(data):
+                length, lsn, crc = HEADER.unpack_from(data, offset)
+                body_start = offset + HEADER.size
+                payload = data[body_start:body_start + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break  # torn write at the tail
+                offset = body_start + length
+                valid_end = offset
+                if lsn <= snapshot_lsn:
+                    continue
+                self._apply(bank, payload)
+                self.lsn = lsn
+                replayed += 1
+            if valid_end < len(data):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(valid_end)
+
+        bank.restore_timers()
+        self.recovered_records = replayed
+        self.recovery_seconds = time.perf_counter() - start
+        return replayed
+
+    def _load_snapshot(self, bank):
+        if not os.path.exists(self.snapshot_path):
+            return 0
+        with open(self.snapshot_path, "rb") as f:
+            state = pickle.load(f)
+
+        store, ledger = bank.store, bank.ledger
+        for name, data in state["store"].items():
+            column = getattr(store, name)
+            del column[:]
+            column.frombytes(data)
+        for name, data in state["pins"].items():
+            column = getattr(bank.pins, name)
+            del column[:]
+            column.frombytes(data)
+        bank.pins.forget()
+        for name, data in state["auth"].items():
+            column = getattr(bank, name)
+            del column[:]
+            column.frombytes(data)
+        limits = state.get("limits")
+        if limits and bank.limits.rolling == bool(limits["hourly"]):
+            # Usage is dropped if the limit window changed since the snapshot
+            for name, data in limits.items():
+                column = getattr(bank.limits, name)
+                del column[:]
+                column.frombytes(data)
+
+        rollups = state.get("spending", {"monthly": {}, "daily": {}})
+        spending = bank.spending
+        spending.monthly = {k: array("q", r) for k, r in rollups["monthly"].items()}
+        spending.daily = {k: array("q", r) for k, r in rollups["daily"].items()}
+        spending.days = {}
+        for account, day in spending.daily:
+            spending.days.setdefault(day, []).append(account)
+
+        for name, category in state.get("payees", ()):
+            bank.payees.add(name, category)
+        schedules = bank.schedules
+        for name, data in state.get("schedules", {}).items():
+            column = getattr(schedules, name)
+            del column[:]
+            column.frombytes(data)
+        schedules.by_account = {}
+        for schedule, account in enumerate(schedules.account):
+            schedules.by_account.setdefault(account, []).append(schedule)
+        bank.fee_month = state.get("fee_month", -1)
+        if "fraud" in state:
+            bank.fraud.load_state(state["fraud"])
+
+        saved = state["ledger"]
+        ledger.count = array("q", saved["count"])
+        ledger.total = array("q", saved["total"])
+        ledger.account_stats = {a: array("q", s) for a, s in saved["account_stats"].items()}
+        ledger.base = saved["base"]
+        ledger.last_position = saved["last_position"]
+        for tx_type, account, cents, ts, peer, memo, prev, peer_prev in saved["recent"]:
+            tx = Transaction(TxType(tx_type), account, cents, ts, peer, memo)
+            tx.prev, tx.peer_prev = prev, peer_prev
+            ledger.recent_window.push(tx)
+        return state["lsn"]
+
+    def _apply(self, bank, payload):
+        kind = payload[0]
+        layout = PAYLOADS[kind]
+        fields = layout.unpack_from(payload)[1:]
+        store = bank.store
+
+        if kind == TX:
+            tx_type, account, cents, ts, peer, memo_length = fields
+            tx_type = TxType(tx_type)
+            memo = payload[layout.size:layout.size + memo_length].decode("utf-8") or None
+            sign = BALANCE_SIGN[tx_type]
+            if sign:
+                store.balance[account] += sign * cents
+            if tx_type == TxType.TRANSFER:
+                store.balance[peer] += cents
+            elif tx_type == TxType.INTEREST:
+                day = datetime.date.fromtimestamp(ts).toordinal()
+                store.interest_day[account] = max(store.interest_day[account], day)
+            # Replayed records keep their state but are not re-logged
+            bank.replay_transaction(Transaction(tx_type, account, cents, ts, peer, memo))
+        elif kind == ADD_CUSTOMER:
+            store.add_customer()
+        elif kind == OPEN_ACCOUNT:
+            customer, account_kind, balance, opened_day = fields
+            store.open_account(customer, account_kind, balance, opened_day)
+        elif kind == PIN_HASH:
+            bank.pins.load(*fields)
+        elif kind == AUTH:
+            customer, attempts, locked_at = fields
+            bank._ensure_auth_rows()
+            bank.pin_attempts[customer] = attempts
+            bank.lockout_time[customer] = locked_at
+        elif kind == INTEREST_DAY:
+            account, day = fields
+            store.interest_day[account] = day
+        elif kind == ACCRUAL_RUN:
+            day = fields[0]
+            for account in range(len(store)):
+                if store.kind[account] == SAVINGS and store.interest_day[account] < day:
+                    store.interest_day[account] = day
+        elif kind == PAYEE:
+            category, name_length = fields
+            name = payload[layout.size:layout.size + name_length].decode("utf-8")
+            bank.payees.add(name, CATEGORIES[category])
+        elif kind == SCHEDULE:
+            bank.schedules.add(*fields)
+        elif kind == SCHEDULE_STATE:
+            bank.schedules.set_state(*fields)
+        elif kind == FEE_MONTH:
+            bank.fee_month = max(bank.fee_month, fields[0])
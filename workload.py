@@ -0,0 +1,291 @@
+"""
+Workload generator and open-loop load test for the Enhanced ATM Simulation.
+
+``generate`` turns a seed into a reproducible, time-ordered stream of
+``Event``s resembling a day at a fleet of terminals:
+
+- sessions arrive as a Poisson process and pick a customer at random
+- a session logs in, sometimes after mistyping the PIN; three wrong PINs
+  lock the customer out for ``Bank.lockout_seconds``
+- it then performs a few operations drawn from ``DEFAULT_MIX`` (deposits,
+  withdrawals, quick cash, transfers, bill payments, balance and mini
+  statement checks) with exponential think times, and logs out
+- some sessions go idle for longer than the session timeout before their
+  next operation, which then fails with NOT_AUTHENTICATED
+
+Time is simulated: ``time_scale`` simulated seconds pass per real second,
+so idle timeouts and lockouts happen within a short run. The bank's clock
+follows the simulated time (``SimulatedClock``).
+
+``run`` drives a Bank from one thread, issuing events in schedule order and
+never before their scheduled time. When an operation overruns, the events
+due meanwhile are issued late, back to back, and each latency is measured
+from the event's scheduled time rather than from when it was issued. Time
+spent queued behind a slow operation therefore counts, which a closed loop
+(issue, wait, issue) would hide: the measurement corrects for coordinated
+omission, although the driver itself cannot overlap operations. Latencies
+go into a ``metrics.Histogram`` per operation and the report gives
+p50/p95/p99/p99.9 for each, next to the service time (the operation
+alone). Sustained throughput is counted after a warm-up while the first
+sessions build up to the target rate.
+
+Usage: python workload.py [--rate OPS/SEC] [--duration SECONDS] [--customers N]
+                          [--seed N] [--time-scale X]
+       python workload.py --dump N   (print the first N events and exit)
+"""
+
+import argparse
+import heapq
+import math
+import random
+import sys
+import time
+
+import core
+from metrics import Histogram
+from tools import make_bank
+
+PIN = "1234"
+WRONG_PIN = "9999"
+
+# Operation -> relative weight within a session
+DEFAULT_MIX = {
+    "balance": 20,
+    "deposit": 15,
+    "withdraw": 20,
+    "quick_cash": 10,
+    "transfer": 10,
+    "pay_bill": 10,
+    "mini_statement": 15,
+}
+MEAN_OPERATIONS = 3  # per session, after logging in
+# Operations per session are 1 + floor(exponential), a geometric count with
+# mean MEAN_OPERATIONS for this rate
+OPERATIONS_RATE = math.log(MEAN_OPERATIONS / (MEAN_OPERATIONS - 1))
+MAX_OPERATIONS = 12
+THINK_SECONDS = 15.0  # mean simulated pause between a session's events
+WRONG_PIN_RATE = 0.03  # sessions that start with one or more wrong PINs
+IDLE_RATE = 0.02  # operations preceded by a pause longer than the timeout
+PERCENTILES = (50, 95, 99, 99.9)
+
+class Event:
+    """One operation of one session, due at a real-time offset from the start"""
+
+    __slots__ = ("at", "session", "customer", "op", "args")
+
+    def __init__(self, at, session, customer, op, args=()):
+        self.at = at  # seconds after the start of the run
+        self.session = session
+        self.customer = customer
+        self.op = op
+        self.args = args
+
+    def __repr__(self):
+        return f"Event({self.at:.4f}, session={self.session}, card={self.customer}, {self.op}{self.args})"
+
+class SimulatedClock:
+    """Wall clock running time_scale times faster than real time once started"""
+
+    def __init__(self, time_scale=1.0):
+        self.time_scale = time_scale
+        self.origin = time.time()
+        self.started = None
+
+    def start(self):
+        self.origin = time.time()
+        self.started = time.perf_counter()
+
+    def __call__(self):
+        if self.started is None:
+            return time.time()
+        return self.origin + (time.perf_counter() - self.started) * self.time_scale
+
+def warmup_seconds(time_scale):
+    """Real seconds until sessions overlap enough to reach the target rate"""
+    return 2 * (MEAN_OPERATIONS + 1) * THINK_SECONDS / time_scale
+
+def _arguments(rng, op):
+    if op == "deposit":
+        return (rng.randrange(1, 50) * 1000,)
+    if op == "withdraw":
+        return (rng.randrange(1, 20) * 1000,)
+    if op == "quick_cash":
+        return (rng.choice(core.QUICK_CASH_AMOUNTS),)
+    if op == "transfer":
+        return (rng.randrange(100, 20000),)
+    if op == "pay_bill":
+        return (rng.choice(core.BILL_TYPES), rng.randrange(1000, 15000))
+    return ()
+
+def _session(rng, session, start, customers, ops, weights, timeout):
+    """(simulated time, op, args) events of one session"""
+    customer = rng.randrange(customers)
+    t = start
+    events = []
+    if rng.random() < WRONG_PIN_RATE:
+        for _ in range(rng.choice((1, 1, 2, 3))):
+            events.append((t, "login", (WRONG_PIN,)))
+            t += rng.uniform(2, 10)
+    events.append((t, "login", (PIN,)))
+
+    count = min(MAX_OPERATIONS, 1 + int(rng.expovariate(OPERATIONS_RATE)))
+    for op in rng.choices(ops, weights, k=count):
+        t += rng.expovariate(1 / THINK_SECONDS)
+        if rng.random() < IDLE_RATE:
+            t += timeout + rng.uniform(1, 60)
+        events.append((t, op, _arguments(rng, op)))
+    events.append((t + rng.expovariate(1 / THINK_SECONDS), "logout", ()))
+    return customer, events
+
+def generate(seed=7, customers=1000, rate=1000.0, duration=10.0, mix=None,
+             time_scale=60.0, timeout=300):
+    """Yield Events in time order for about duration seconds at rate events/sec"""
+    rng = random.Random(seed)
+    ops, weights = zip(*(mix or DEFAULT_MIX).items())
+    # Events per session: the login, its operations and the logout, plus
+    # the wrong PINs of the sessions that mistype
+    per_session = 2 + MEAN_OPERATIONS + WRONG_PIN_RATE * 1.75
+    sessions_per_second = rate / time_scale / per_session  # simulated
+    end = duration * time_scale
+
+    pending = []  # (simulated time, sequence, Event)
+    sequence = 0
+    session = 0
+    next_start = rng.expovariate(sessions_per_second)
+    while pending or next_start < end:
+        if next_start < end and (not pending or next_start <= pending[0][0]):
+            customer, events = _session(rng, session, next_start, customers,
+                                        ops, weights, timeout)
+            for t, op, args in events:
+                if t < end:
+                    heapq.heappush(pending, (t, sequence,
+                                             Event(t / time_scale, session, customer, op, args)))
+                    sequence += 1
+            session += 1
+            next_start += rng.expovariate(sessions_per_second)
+        else:
+            yield heapq.heappop(pending)[2]
+
+class LoadReport:
+    """Throughput, per-operation latency histograms and outcome counts of one run"""
+
+    def __init__(self, target_rate, warmup):
+        self.target_rate = target_rate
+        self.warmup = warmup  # seconds not counted towards the sustained rate
+        self.events = 0
+        self.seconds = 0.0
+        self.steady_events = 0  # events scheduled after the warm-up
+        self.max_lag = 0.0  # furthest the driver fell behind the schedule, seconds
+        self.latency = {}  # op -> metrics.Histogram of nanoseconds from the scheduled time
+        self.service = Histogram()  # nanoseconds spent in the operations themselves
+        self.outcomes = {}  # (op, result code) -> count
+
+    @property
+    def rate(self):
+        """Events completed per second after the warm-up"""
+        steady = self.seconds - self.warmup
+        return self.steady_events / steady if steady > 0 else 0.0
+
+def _execute(bank, session, event):
+    op, args = event.op, event.args
+    if op == "login":
+        return session.login(event.customer, *args)
+    if op == "logout":
+        return session.logout()
+    if op == "balance":
+        return session.balances()
+    if op == "mini_statement":
+        return session.mini_statement()
+    if op == "transfer":
+        return session.transfer(bank.store.last_account[event.customer], *args)
+    return getattr(session, op)(*args)
+
+def run(bank, events, target_rate, clock=None, warmup=0.0, tick_seconds=0.05):
+    """Issue events in order on one thread, none before its time; returns a LoadReport
+
+    clock, the bank's SimulatedClock, is started together with the schedule.
+    """
+    report = LoadReport(target_rate, warmup)
+    sessions = {}
+    perf_counter, sleep = time.perf_counter, time.sleep
+    if clock is not None:
+        clock.start()
+    start = next_tick = perf_counter()
+    for event in events:
+        due = start + event.at
+        now = perf_counter()
+        if now < due:
+            sleep(due - now)
+        elif now - due > report.max_lag:
+            report.max_lag = now - due
+
+        session = sessions.get(event.session)
+        if session is None:
+            session = sessions[event.session] = bank.open_session()
+        issued = perf_counter()
+        result = _execute(bank, session, event)
+        done = perf_counter()
+        report.service.record(int((done - issued) * 1e9))
+
+        histogram = report.latency.get(event.op)
+        if histogram is None:
+            histogram = report.latency[event.op] = Histogram()
+        histogram.record(int((done - due) * 1e9))
+        key = (event.op, result.code)
+        report.outcomes[key] = report.outcomes.get(key, 0) + 1
+        report.events += 1
+        if event.at >= warmup:
+            report.steady_events += 1
+        if event.op == "logout":
+            del sessions[event.session]
+        if done >= next_tick:
+            bank.tick()
+            next_tick = done + tick_seconds
+    report.seconds = perf_counter() - start
+    return report
+
+def print_report(report):
+    print(f"{report.events:,} operations in {report.seconds:.2f}s: "
+          f"{report.rate:,.0f} ops/sec sustained after {report.warmup:.1f}s warm-up "
+          f"(target {report.target_rate:,.0f}), max lag {report.max_lag * 1000:.1f} ms")
+    header = "".join(f"{'p' + format(p, 'g'):>10}" for p in PERCENTILES)
+    print(f"{'operation':<16}{'count':>9}{header}{'max':>10}   (ms)")
+    for op in sorted(report.latency):
+        histogram = report.latency[op]
+        values = "".join(f"{histogram.percentile(p) / 1e6:>10.3f}" for p in PERCENTILES)
+        print(f"{op:<16}{histogram.count:>9,}{values}{histogram.max / 1e6:>10.3f}")
+    service = report.service
+    values = "".join(f"{service.percentile(p) / 1e6:>10.3f}" for p in PERCENTILES)
+    print(f"{'(service time)':<16}{service.count:>9,}{values}{service.max / 1e6:>10.3f}")
+    print("outcomes:")
+    for (op, code), count in sorted(report.outcomes.items()):
+        print(f"  {op:<16}{code:<20}{count:>9,}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Open-loop load test of the ATM core")
+    parser.add_argument("--rate", type=float, default=2000, help="target operations/sec")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load")
+    parser.add_argument("--customers", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--time-scale", type=float, default=60,
+                        help="simulated seconds per real second")
+    parser.add_argument("--dump", type=int, metavar="N", help="print the first N events and exit")
+    args = parser.parse_args(argv)
+
+    clock = SimulatedClock(args.time_scale)
+    bank = make_bank(0 if args.dump else args.customers, 200000, 100000, pin=PIN,
+                          clock=clock)
+    events = generate(args.seed, args.customers, args.rate, args.duration,
+                      time_scale=args.time_scale, timeout=bank.session_timeout)
+    if args.dump:
+        for _, event in zip(range(args.dump), events):
+            print(event)
+        return 0
+
+    # Generate up front so the driver's timing excludes the generator
+    events = list(events)
+    print_report(run(bank, events, args.rate, clock, warmup_seconds(args.time_scale)))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())